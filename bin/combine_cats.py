@@ -7,6 +7,7 @@
 """ Combine cats into single file """
 
 import argparse
+import despyfitsutils.profiling as profiling
 import despyfitsutils.fitsutils as fitsutils
 
 def read_list(listname):
@@ -20,20 +21,49 @@ def read_list(listname):
 
 def main():
     """ Entry point """
+    prof = profiling.Profiler('combine_cats.py')
     parser = argparse.ArgumentParser(description='Combine cats into single file')
     parser.add_argument('--outcat', action='store', required=True)
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('--list', action='store')
     group.add_argument('--incats', action='store')
+    parser.add_argument('--no-validate', action='store_true', default=False,
+                        help='skip the header check of all inputs before combining')
+    parser.add_argument('--columns', action='store', default=None,
+                        help='comma separated list of object table columns to keep (default all)')
+    parser.add_argument('--metadata', action='store', default=None,
+                        help='comma separated list of metadata values to compute per catalog, e.g. band,nite,field,objects')
+    parser.add_argument('--metadata-out', action='store', default=None,
+                        help='file to write the per catalog metadata to (.json, .fits, .csv or .parquet)')
+    parser.add_argument('--append', action='store_true', default=False,
+                        help='append inputs not already in outcat to it instead of rebuilding it')
+
+    profiling.add_profile_args(parser)
 
     args = vars(parser.parse_args())   # convert dict
+    prof.start(args)
 
     incats = args['incats']
     if args['list'] is not None:
         incats = ','.join(read_list(args['list']))
 
-    print(f"Combining catalogs into {args['outcat']}")
-    fitsutils.combine_cats(incats, args['outcat'])
+    columns = None
+    if args['columns'] is not None:
+        columns = [c.strip() for c in args['columns'].split(',')]
+    metadata = None
+    if args['metadata'] is not None:
+        metadata = [m.strip() for m in args['metadata'].split(',')]
+
+    if args['append']:
+        print(f"Appending catalogs to {args['outcat']}")
+    else:
+        print(f"Combining catalogs into {args['outcat']}")
+    try:
+        fitsutils.combine_cats(incats, args['outcat'], validate=not args['no_validate'],
+                               columns=columns, metadata=metadata,
+                               metadata_out=args['metadata_out'], append=args['append'])
+    finally:
+        prof.stop()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+    Generate a deterministic corpus of DES-like fits files and run the
+    regression and throughput checks over it
+"""
+import os
+import sys
+import json
+import argparse
+import despyfitsutils.profiling as profiling
+import despyfitsutils.corpus as corpus
+
+def run(args):
+    """
+    Run the tasks over the corpus, returns the exit status
+    """
+    try:
+        manifest = corpus.read_corpus_manifest(args.corpus)
+    except (OSError, ValueError) as err:
+        sys.exit(f"ERROR: {err}")
+    golden = None
+    if args.golden:
+        if os.path.exists(args.golden):
+            with open(args.golden, 'r') as goldfh:
+                golden = json.load(goldfh)
+    else:
+        golden = corpus.read_golden(manifest['scale'], manifest['seed'])
+    tasks = None if args.tasks is None else [t.strip() for t in args.tasks.split(',')]
+
+    def report(result):
+        line = f"{result['status']:<8} {result['task']:<16}"
+        if result['seconds'] is not None:
+            line += f" {result['seconds']:8.3f}s {result['mbps']:10.2f} MB/s"
+        if result['error']:
+            line += f"  ({result['error']})"
+        print(line, flush=True)
+
+    try:
+        results = corpus.run_corpus(args.corpus, workdir=args.workdir, golden=golden,
+                                    tasks=tasks, repeat=args.repeat, callback=report)
+    except ValueError as err:
+        sys.exit(str(err))
+
+    if args.report:
+        with open(args.report, 'w') as reportfh:
+            json.dump(results, reportfh, indent=1)
+    if args.update_golden:
+        if not args.golden:
+            sys.exit("ERROR: --update-golden needs --golden")
+        golden = corpus.make_golden(args.corpus, results, golden)
+        with open(args.golden, 'w') as goldfh:
+            json.dump(golden, goldfh, indent=1)
+            goldfh.write('\n')
+        print(f"# Wrote golden digests to {args.golden}")
+        return 1 if any(result['status'] == 'failed' for result in results) else 0
+
+    nbad = sum(1 for result in results if result['status'] in ('failed', 'mismatch'))
+    print(f"# {len(results) - nbad} of {len(results)} tasks passed, {nbad} failed or mismatched")
+    if golden is not None and 'corpus' in golden and golden['corpus'] != corpus.corpus_digest(args.corpus, manifest):
+        print("# The corpus files do not match the golden digest, the generator has changed")
+        nbad += 1
+    return 1 if nbad else 0
+
+def main():
+    """
+    Main entry point
+    """
+    prof = profiling.Profiler('fits_corpus.py')
+    parser = argparse.ArgumentParser(description="Generate and check a deterministic corpus of fits files")
+    parser.add_argument("corpus", help="corpus directory")
+    subparsers = parser.add_subparsers(dest='op', required=True)
+
+    gen = subparsers.add_parser('generate', help='write the corpus files')
+    gen.add_argument("--scale", default='small', choices=list(corpus.CORPUS_SCALES),
+                     help="Size of the corpus.")
+    gen.add_argument("--seed", type=int, default=0,
+                     help="Random seed.")
+    gen.add_argument("--clobber", action='store_true', default=False,
+                     help="Write the files again even if the corpus exists")
+
+    check = subparsers.add_parser('run', help='run the tasks, check their outputs and time them')
+    check.add_argument("--workdir", default=None,
+                       help="Directory for the outputs (default <corpus>/work).")
+    check.add_argument("--tasks", default=None,
+                       help=f"Comma separated tasks to run (default {','.join(corpus.CORPUS_TASKS)}).")
+    check.add_argument("--golden", default=None,
+                       help="JSON file of golden digests to check the outputs against "
+                            "(default the shipped digests of the corpus scale and seed, if any).")
+    check.add_argument("--update-golden", action='store_true', default=False,
+                       help="Write the digests of this run to the --golden file.")
+    check.add_argument("--repeat", type=int, default=1,
+                       help="Run each task this many times and report the fastest.")
+    check.add_argument("--report",
+                       help="Write per task status, digest and timing as JSON.")
+    profiling.add_profile_args(parser)
+    args = parser.parse_args()
+    prof.start(args)
+
+    try:
+        if args.op == 'generate':
+            manifest = corpus.generate_corpus(args.corpus, scale=args.scale, seed=args.seed,
+                                              clobber=args.clobber)
+            print(f"# Corpus {args.corpus}: scale {manifest['scale']}, seed {manifest['seed']}, "
+                  f"{len(manifest['raw'])} raw exposures, {len(manifest['catalogs'])} catalogs")
+            status = 0
+        else:
+            status = run(args)
+    finally:
+        prof.stop()
+    if status:
+        sys.exit(status)
+
+if __name__ == "__main__":
+    main()
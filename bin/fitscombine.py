@@ -2,13 +2,40 @@
 """
     Combine two fits files
 """
+import sys
+import json
 import argparse
+import despyfitsutils.profiling as profiling
 import despyfitsutils
 
+def run_batch(args):
+    """
+    Build all MEFs listed in a manifest, returns the exit status
+    """
+    jobs = despyfitsutils.read_mef_manifest(args.manifest)
+    print(f"# Building {len(jobs)} MEF files from {args.manifest} with {args.nproc} processes")
+
+    def report(result):
+        line = f"{result['status']:<8} {result['seconds']:8.2f}s {result['outname']}"
+        if result['error']:
+            line += f"  ({result['error']})"
+        print(line, flush=True)
+
+    mem_limit = None if args.mem_limit is None else int(args.mem_limit * 1024 * 1024)
+    results = despyfitsutils.make_mef_batch(jobs, nproc=args.nproc, mem_limit=mem_limit,
+                                            clobber=args.clobber, callback=report, stats=args.stats)
+    nfailed = sum(1 for result in results if result['status'] == 'failed')
+    print(f"# {len(results) - nfailed} of {len(results)} done, {nfailed} failed")
+    if args.report:
+        with open(args.report, 'w') as reportfh:
+            json.dump(results, reportfh, indent=1)
+    return 1 if nfailed else 0
+
 def main():
     """
     Main entry point
     """
+    prof = profiling.Profiler('fitscombine.py')
     parser = argparse.ArgumentParser(description="Create a MEF fits file from a list of flat fits files")
 
     parser.add_argument("filenames", nargs='*',
@@ -19,9 +46,39 @@ def main():
                         help="List of EXTNAME to use for each file.")
     parser.add_argument("--clobber", action='store_true', default=False,
                         help="Clobber output MEF fits file")
+    parser.add_argument("--stats", action='store_true', default=False,
+                        help="Add pixel statistics keywords to each extension while writing.")
+    parser.add_argument("--stats-file",
+                        help="Also write the pixel statistics as a table (.fits, .csv, .json, .parquet), not with --manifest.")
+    parser.add_argument("--manifest",
+                        help="CSV (outname,filename,extname) or JSON file listing many MEFs to build.")
+    parser.add_argument("--nproc", type=int, default=4,
+                        help="Number of MEFs to build at once with --manifest.")
+    parser.add_argument("--mem-limit", type=float, default=None,
+                        help="Memory in MB for concurrent builds with --manifest (default half of RAM).")
+    parser.add_argument("--report",
+                        help="Write per output status and timing as JSON with --manifest.")
+    profiling.add_profile_args(parser)
     args = parser.parse_args()
-    kwargs = vars(args)
-    despyfitsutils.makeMEF(**kwargs)
+    if args.manifest and args.stats_file:
+        parser.error("--stats-file cannot be used with --manifest, use --stats")
+    prof.start(args)
+
+    try:
+        if args.manifest:
+            status = run_batch(args)
+        else:
+            try:
+                despyfitsutils.makeMEF(filenames=args.filenames, outname=args.outname,
+                                       extnames=args.extnames, clobber=args.clobber,
+                                       stats=args.stats, stats_file=args.stats_file)
+            except ValueError as err:
+                sys.exit(str(err))
+            status = 0
+    finally:
+        prof.stop()
+    if status:
+        sys.exit(status)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+    Split MEF fits files into flat fits files, one per extension
+"""
+import sys
+import json
+import argparse
+import despyfitsutils.profiling as profiling
+import despyfitsutils.fitsutils as fitsutils
+
+def read_list(listname):
+    """ Read input file names from list file """
+    with open(listname, 'r') as listfh:
+        infiles = listfh.readlines()
+
+    # Strip \n from list if present, skip blank lines
+    return [f.strip() for f in infiles if f.strip()]
+
+def main():
+    """
+    Main entry point
+    """
+    prof = profiling.Profiler('fitssplit.py')
+    parser = argparse.ArgumentParser(description="Write extensions of MEF fits files as flat fits files")
+
+    parser.add_argument("filenames", nargs='*',
+                        help="List of input MEF FITS files.")
+    parser.add_argument("--list",
+                        help="File listing input MEF FITS files.")
+    parser.add_argument("--extnames",
+                        help="Comma separated EXTNAME or DES_EXT values to extract (default all).")
+    parser.add_argument("--outpattern", default=None,
+                        help="Output names, with {dir}, {base}, {extname} and {hdu} (default {dir}/{base}_{extname}.fits).")
+    parser.add_argument("--nproc", type=int, default=4,
+                        help="Number of files to split at once.")
+    parser.add_argument("--clobber", action='store_true', default=False,
+                        help="Clobber output fits files")
+    parser.add_argument("--report",
+                        help="Write per input status and timing as JSON.")
+    profiling.add_profile_args(parser)
+    args = parser.parse_args()
+    prof.start(args)
+
+    filenames = list(args.filenames)
+    if args.list:
+        filenames.extend(read_list(args.list))
+    if not filenames:
+        parser.error("no input files given")
+    extnames = None if args.extnames is None else [e.strip() for e in args.extnames.split(',')]
+
+    def report(result):
+        line = f"{result['status']:<8} {result['seconds']:8.2f}s {result['filename']}"
+        if result['error']:
+            line += f"  ({result['error']})"
+        print(line, flush=True)
+
+    try:
+        results = fitsutils.split_mef_batch(filenames, extnames, args.outpattern, nproc=args.nproc,
+                                            clobber=args.clobber, callback=report)
+        if args.report:
+            with open(args.report, 'w') as reportfh:
+                json.dump(results, reportfh, indent=1)
+    finally:
+        prof.stop()
+    nfailed = sum(1 for result in results if result['status'] == 'failed')
+    print(f"# {len(results) - nfailed} of {len(results)} done, {nfailed} failed")
+    if nfailed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+"""
+Query the header lookup service started by hdr_server.py
+
+Only the standard library is imported so that each call is cheap.
+"""
+
+import os
+import sys
+import json
+import socket
+import argparse
+
+# Same default as despyfitsutils.header_service.default_socket_path
+SOCKET_ENV = 'DESPYFITSUTILS_HDR_SOCKET'
+
+def default_socket_path():
+    """ Socket from the environment or the per user default """
+    return os.environ.get(SOCKET_ENV, f"/tmp/despyfitsutils_hdr_{os.getuid():d}.sock")
+
+def send_request(request, socket_path=None):
+    """ Send a single request and return the decoded response """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(socket_path or default_socket_path())
+    with sock, sock.makefile('rwb') as fh:
+        fh.write(json.dumps(request).encode('utf-8') + b'\n')
+        fh.flush()
+        return json.loads(fh.readline())
+
+def convert_hdu(hdu):
+    """ Convert extension to integers if not strings """
+    try:
+        return int(hdu)
+    except (TypeError, ValueError):
+        return hdu
+
+def main():
+    """ Entry point """
+    parser = argparse.ArgumentParser(description='Query the fits header lookup service')
+    parser.add_argument('--socket', action='store', default=None,
+                        help=f"Unix socket of the service (default ${SOCKET_ENV} or a per user file in /tmp)")
+    subparsers = parser.add_subparsers(dest='op', required=True)
+
+    value = subparsers.add_parser('value', help='print value of a header keyword')
+    value.add_argument('fitsfile')
+    value.add_argument('key')
+    value.add_argument('-x', '--extension', default=None)
+
+    func = subparsers.add_parser('func', help='print special metadata value, e.g. band, nite')
+    func.add_argument('name')
+    func.add_argument('fitsfile')
+    func.add_argument('-x', '--extension', default=None)
+
+    header = subparsers.add_parser('header', help='print full header')
+    header.add_argument('fitsfile')
+    header.add_argument('-x', '--extension', default=0)
+
+    subparsers.add_parser('stats', help='print service statistics as JSON')
+    subparsers.add_parser('shutdown', help='stop the service')
+
+    args = parser.parse_args()
+
+    request = {'op': args.op}
+    if args.op in ('value', 'func', 'header'):
+        request['file'] = os.path.abspath(args.fitsfile)
+        request['hdu'] = convert_hdu(args.extension)
+    if args.op == 'value':
+        request['key'] = args.key
+    elif args.op == 'func':
+        request['name'] = args.name
+
+    try:
+        response = send_request(request, args.socket)
+    except OSError as err:
+        sys.exit(f"ERROR: cannot reach header service: {err}")
+
+    if not response['ok']:
+        sys.exit(f"ERROR: {response['error']}")
+    if args.op == 'stats':
+        print(json.dumps(response['value'], indent=2))
+    elif response['value'] is not None:
+        print(response['value'])
+
+
+if __name__ == "__main__":
+    main()
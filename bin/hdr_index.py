@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+"""
+Build and query an index of header keyword values over many fits files
+"""
+
+import os
+import sys
+import argparse
+import despyfitsutils.header_index as header_index
+
+def read_list(listname):
+    """ Read input file names from list file """
+    infiles = []
+    with open(listname, 'r') as listfh:
+        infiles = listfh.readlines()
+
+    # Strip \n from list if present, skip blank lines
+    return [f.strip() for f in infiles if f.strip()]
+
+def convert_value(val):
+    """ Convert query values to numbers where possible, the string is
+        also queried """
+    for conv in (int, float):
+        try:
+            return conv(val)
+        except ValueError:
+            pass
+    return val
+
+def main():
+    """ Entry point """
+    parser = argparse.ArgumentParser(description='Build and query an index of fits header values')
+    parser.add_argument('index', help='index file')
+    subparsers = parser.add_subparsers(dest='op', required=True)
+
+    build = subparsers.add_parser('update', help='create the index or bring it up to date')
+    build.add_argument('--keys', action='store', default=None,
+                       help='comma separated keywords to index (required for a new index)')
+    build.add_argument('--nthreads', action='store', type=int, default=8)
+    build.add_argument('--prune', action='store_true', default=False,
+                       help='also drop files that no longer exist')
+    group = build.add_mutually_exclusive_group(required=True)
+    group.add_argument('--list', action='store', help='list file containing filenames')
+    group.add_argument('--files', action='store', nargs='+', help='filenames')
+
+    query = subparsers.add_parser('query', help='print file and HDU number of matching HDUs')
+    query.add_argument('key')
+    qgroup = query.add_mutually_exclusive_group(required=True)
+    qgroup.add_argument('--value', help='exact value')
+    qgroup.add_argument('--prefix', help='string prefix')
+    qgroup.add_argument('--range', nargs=2, metavar=('LOW', 'HIGH'), type=float,
+                        help='inclusive numeric range')
+
+    args = parser.parse_args()
+
+    if args.op == 'update':
+        if os.path.exists(args.index):
+            index = header_index.HeaderIndex.load(args.index)
+        elif args.keys is None:
+            sys.exit("ERROR: --keys is required to create a new index")
+        else:
+            index = header_index.HeaderIndex(args.keys.split(','))
+        files = args.files if args.list is None else read_list(args.list)
+        nread = index.update(files, nthreads=args.nthreads)
+        npruned = index.prune() if args.prune else 0
+        index.save(args.index)
+        print(f"Read {nread} files, removed {npruned}, index has {len(index)} files")
+        return
+
+    index = header_index.HeaderIndex.load(args.index)
+    if args.value is not None:
+        # string valued keywords may look like numbers, e.g. '00581000'
+        found = sorted(set(index.query(args.key, args.value)) |
+                       set(index.query(args.key, convert_value(args.value))))
+    elif args.prefix is not None:
+        found = index.query_prefix(args.key, args.prefix)
+    else:
+        found = index.query_range(args.key, args.range[0], args.range[1])
+    for path, hdu in found:
+        print(f"{path} {hdu}")
+
+
+if __name__ == "__main__":
+    main()
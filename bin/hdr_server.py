@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+
+"""
+Run the resident header lookup service used by hdr_client.py
+"""
+
+import argparse
+import despyfitsutils.header_service as header_service
+
+def main():
+    """ Entry point """
+    parser = argparse.ArgumentParser(description='Run the resident fits header lookup service')
+    parser.add_argument('--socket', action='store', default=None,
+                        help=f"Unix socket to listen on (default ${header_service.SOCKET_ENV} or a per user file in /tmp)")
+    parser.add_argument('--nworkers', action='store', type=int, default=8,
+                        help='number of connections handled concurrently')
+    parser.add_argument('--cache-size', action='store', type=int, default=256,
+                        help='number of files to keep headers for')
+    args = parser.parse_args()
+
+    server = header_service.HeaderServer(args.socket, nworkers=args.nworkers,
+                                         cache_size=args.cache_size)
+    print(f"Listening on {server.socket_path}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
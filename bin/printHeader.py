@@ -12,21 +12,27 @@ Print header values to either stdout or to a file
 import argparse
 import sys
 import fitsio
+import despyfitsutils.profiling as profiling
 
 def print_header(fitsfile, ext=0, ofileh=sys.stdout):
     """ print header from fits file to either stdout or to a file """
 
-    hdr = fitsio.read_header(fitsfile, ext=ext)
-    ofileh.write(f"{hdr}")
-    ofileh.write("\n")
+    with profiling.phase('read'):
+        hdr = fitsio.read_header(fitsfile, ext=ext)
+    with profiling.phase('write'):
+        ofileh.write(f"{hdr}")
+        ofileh.write("\n")
 
 def main():
     """ main function """
+    prof = profiling.Profiler('printHeader.py')
     parser = argparse.ArgumentParser(description='Prints fits headers')
     parser.add_argument('-o', '--outfile', action='store', type=str, help="Print header to given file", default=False)
     parser.add_argument('-x', '--extension', action='store', default=0)
     parser.add_argument('fitsfile', action='store')
+    profiling.add_profile_args(parser)
     args = parser.parse_args()
+    prof.start(args)
 
     useStdout = False
     if args.outfile:
@@ -45,10 +51,13 @@ def main():
         pass
 
     # Make the call
-    print_header(args.fitsfile, ext=args.extension, ofileh=outfh)
-    # only clode if outputtting to real file
-    if not useStdout:
-        outfh.close()
+    try:
+        print_header(args.fitsfile, ext=args.extension, ofileh=outfh)
+    finally:
+        # only clode if outputtting to real file
+        if not useStdout:
+            outfh.close()
+        prof.stop()
 
 if __name__ == "__main__":
     main()
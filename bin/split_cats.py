@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+""" Split a combined catalog back into individual catalogs """
+
+import argparse
+import despyfitsutils.profiling as profiling
+import despyfitsutils.fitsutils as fitsutils
+
+def read_list(listname):
+    """ Read output catalog names from list file """
+    outcats = []
+    with open(listname, 'r') as listfh:
+        outcats = listfh.readlines()
+
+    # Strip \n from list if present
+    return [f.strip() for f in outcats]
+
+def main():
+    """ Entry point """
+    prof = profiling.Profiler('split_cats.py')
+    parser = argparse.ArgumentParser(description='Split combined catalog into individual catalogs')
+    parser.add_argument('--incat', action='store', required=True,
+                        help='combined catalog to split')
+    parser.add_argument('--nthreads', action='store', type=int, default=1,
+                        help='number of catalogs to write concurrently')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--list', action='store',
+                       help='list file containing output filenames, order must match order in combined catalog')
+    group.add_argument('--outcats', action='store',
+                       help='output filenames, order must match order in combined catalog')
+
+    profiling.add_profile_args(parser)
+
+    args = vars(parser.parse_args())   # convert dict
+    prof.start(args)
+
+    outcats = args['outcats']
+    if args['list'] is not None:
+        outcats = ','.join(read_list(args['list']))
+
+    print(f"Splitting {args['incat']} into {outcats}")
+    try:
+        fitsutils.split_cats(args['incat'], outcats, nthreads=args['nthreads'])
+    finally:
+        prof.stop()
+
+
+if __name__ == '__main__':
+    main()
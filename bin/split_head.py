@@ -7,6 +7,7 @@
 """ Split single head file into multiple files """
 
 import argparse
+import despyfitsutils.profiling as profiling
 import despyfitsutils.fitsutils as fitsutils
 
 def read_list(listname):
@@ -21,6 +22,7 @@ def read_list(listname):
 
 def main():
     """ Entry point """
+    prof = profiling.Profiler('split_head.py')
     parser = argparse.ArgumentParser(description='Split single head file into multiple files')
     parser.add_argument('--in', action='store', help='head file to split')
     group = parser.add_mutually_exclusive_group()
@@ -28,8 +30,15 @@ def main():
                        help='list file containing output filenames, order must match order in head file')
     group.add_argument('--out', action='store',
                        help='output filenames, order must match order in head file')
+    parser.add_argument('--checkpoint', action='store', default=None,
+                        help='checkpoint file used to resume an interrupted split')
+    parser.add_argument('--progress', action='store', type=float, default=0,
+                        help='print progress every this many seconds')
+
+    profiling.add_profile_args(parser)
 
     args = vars(parser.parse_args())   # convert dict
+    prof.start(args)
 
     inhead = args['in']
 
@@ -38,7 +47,11 @@ def main():
         outheads = ','.join(read_list(args['list']))
 
     print(f"Splitting {inhead} into {outheads}")
-    fitsutils.splitScampHead(inhead, outheads)
+    try:
+        fitsutils.splitScampHead(inhead, outheads, checkpoint=args['checkpoint'],
+                                 progress=args['progress'])
+    finally:
+        prof.stop()
 
 
 if __name__ == '__main__':
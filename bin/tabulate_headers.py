@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+"""
+Tabulate header values from many fits files into a single table
+"""
+
+import argparse
+import despyfitsutils.profiling as profiling
+import despyfitsutils.header_table as header_table
+
+def read_list(listname):
+    """ Read input file names from list file """
+    infiles = []
+    with open(listname, 'r') as listfh:
+        infiles = listfh.readlines()
+
+    # Strip \n from list if present, skip blank lines
+    return [f.strip() for f in infiles if f.strip()]
+
+def main():
+    """ Entry point """
+    prof = profiling.Profiler('tabulate_headers.py')
+    parser = argparse.ArgumentParser(description='Tabulate header values from many fits files')
+    parser.add_argument('--keys', action='store', required=True,
+                        help='comma separated list of header keywords and/or func_* names')
+    parser.add_argument('--outfile', action='store', required=True,
+                        help='output table (.fits, .csv or .parquet)')
+    parser.add_argument('-x', '--extension', action='store', default=None,
+                        help='comma separated list of HDUs to read (default is primary)')
+    parser.add_argument('--nthreads', action='store', type=int, default=4)
+    parser.add_argument('--clobber', action='store_true', default=False,
+                        help='overwrite output table')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--list', action='store', help='list file containing input filenames')
+    group.add_argument('--files', action='store', nargs='+', help='input filenames')
+
+    profiling.add_profile_args(parser)
+    args = parser.parse_args()
+    prof.start(args)
+
+    files = args.files
+    if args.list is not None:
+        files = read_list(args.list)
+
+    whichhdu = None
+    if args.extension is not None:
+        whichhdu = args.extension.split(',')
+        if len(whichhdu) == 1:
+            whichhdu = whichhdu[0]
+
+    keys = [k.strip() for k in args.keys.split(',')]
+    try:
+        with profiling.phase('read'):
+            table = header_table.tabulate_headers(files, keys, whichhdu, nthreads=args.nthreads)
+        print(f"Writing {len(table)} rows to {args.outfile}")
+        with profiling.phase('write'):
+            header_table.write_header_table(table, args.outfile, overwrite=args.clobber)
+    finally:
+        prof.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,40 @@
  Python-based modules
 """
 
-from . import fitsutils
-from .fitsutils import *
+import importlib
 
 __author__ = "Felipe Menanteau, Michelle Gower"
 __version__ = '1.0.0'
 version = __version__
+
+
+def _fitsutils_names(fitsutils):
+    """ Return the names 'from .fitsutils import *' would import.
+    """
+    names = getattr(fitsutils, '__all__', None)
+    if names is None:
+        names = [name for name in vars(fitsutils) if not name.startswith('_')]
+    return ['fitsutils', 'version'] + list(names)
+
+
+def __getattr__(name):
+    """ Import fitsutils (and astropy) on first use of one of its names, so
+        that the standard library only modules (e.g. profiling) can be
+        imported cheaply.  despyfitsutils.<name>, 'from despyfitsutils
+        import *' and dir() give what they did when fitsutils was star
+        imported here.
+    """
+    fitsutils = importlib.import_module('.fitsutils', __name__)
+    if name == 'fitsutils':
+        return fitsutils
+    if name == '__all__':
+        return _fitsutils_names(fitsutils)
+    try:
+        return getattr(fitsutils, name)
+    except AttributeError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+
+
+def __dir__():
+    fitsutils = importlib.import_module('.fitsutils', __name__)
+    return sorted(set(globals()) | set(_fitsutils_names(fitsutils)))
@@ -0,0 +1,526 @@
+"""
+    Byte range access to local and remote files
+
+    A byte source returns ranges of bytes of a file by offset and size.
+    Header reading only needs the header blocks of a file, so reading
+    headers through a source over HTTP range requests transfers a few
+    kilobytes however large the data is.  Sources are chosen by the scheme
+    of the file name; new schemes can be added with :func:`register_source`.
+
+    Remote sources are wrapped in a :class:`CachedByteSource` which fetches
+    whole blocks, coalesces adjacent missing blocks into one request and
+    keeps the blocks in memory and optionally in a local cache directory.
+    The cache directory records the version of the file (size and
+    modification time or ETag) its blocks came from and is emptied when
+    the file has changed.
+"""
+
+import io
+import os
+import re
+import json
+import hashlib
+import tempfile
+import threading
+import urllib.request
+import urllib.error
+from collections import OrderedDict
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from functools import partial
+
+import despymisc.miscutils as miscutils
+
+# 4 FITS blocks
+CACHE_BLOCK_SIZE = 4 * 2880
+CACHE_MAX_BLOCKS = 4096
+CACHE_DIR_ENV = 'DESPYFITSUTILS_CACHE_DIR'
+HTTP_TIMEOUT = 60
+
+# scheme -> function(name) returning a ByteSource
+SOURCE_SCHEMES = {}
+
+
+#######################################################################
+class ByteSource:
+    """ Base class of byte sources.
+
+        Subclasses implement :meth:`read_range` and set `size` when known.
+        `requests` and `bytes_read` count the reads made from the
+        underlying storage.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.size = None
+        self.requests = 0
+        self.bytes_read = 0
+
+    def read_range(self, offset, size):
+        """ Return up to `size` bytes at `offset`, fewer at the end of the
+            file.
+        """
+        raise NotImplementedError
+
+    def read(self, offset, size):
+        """ Return up to `size` bytes at `offset`, fewer at the end of the
+            file.
+        """
+        return self.read_range(offset, size)
+
+    def get_size(self):
+        """ Return the size of the file in bytes.
+        """
+        return self.size
+
+    def get_version(self):
+        """ Return a dict that changes when the contents of the file change
+            (size, modification time, ...), or ``None`` if the source cannot
+            tell.
+        """
+        return None
+
+    def close(self):
+        """ Release any resources held by the source.
+        """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+#######################################################################
+class LocalByteSource(ByteSource):
+    """ Byte source reading a local file with pread.
+    """
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        self._fd = os.open(filename, os.O_RDONLY)
+        self.size = os.fstat(self._fd).st_size
+
+    def read_range(self, offset, size):
+        self.requests += 1
+        data = os.pread(self._fd, size, offset)
+        self.bytes_read += len(data)
+        return data
+
+    def get_version(self):
+        stat = os.fstat(self._fd)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'inode': stat.st_ino}
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+#######################################################################
+class HTTPByteSource(ByteSource):
+    """ Byte source reading a URL with HTTP range requests.
+
+        Parameters
+        ----------
+        url : str
+            The http:// or https:// URL of the file.
+
+        timeout : float, optional
+            Timeout in seconds of each request, default is HTTP_TIMEOUT.
+    """
+
+    def __init__(self, url, timeout=HTTP_TIMEOUT):
+        super().__init__(url)
+        self.timeout = timeout
+
+    def read_range(self, offset, size):
+        if size <= 0 or (self.size is not None and offset >= self.size):
+            return b''
+        request = urllib.request.Request(self.name, headers={'Range': f"bytes={offset:d}-{offset + size - 1:d}"})
+        self.requests += 1
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                if response.status == 206:
+                    match = re.match(r'bytes \d+-\d+/(\d+)', response.headers.get('Content-Range', ''))
+                    if match:
+                        self.size = int(match.group(1))
+                    data = response.read()
+                else:
+                    # the server ignored the range, read up to what is needed
+                    if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
+                        miscutils.fwdebug_print(f"No range support for {self.name}, reading from the start")
+                    length = response.headers.get('Content-Length')
+                    if length is not None:
+                        self.size = int(length)
+                    data = response.read(offset + size)[offset:]
+        except urllib.error.HTTPError as err:
+            if err.code == 416:
+                # range not satisfiable: offset is past the end
+                return b''
+            raise OSError(f"Error reading {self.name} bytes {offset:d}+{size:d}: {err}") from err
+        self.bytes_read += len(data)
+        return data
+
+    def get_size(self):
+        if self.size is None:
+            self.get_version()
+            if self.size is None:
+                raise OSError(f"No Content-Length for {self.name}")
+        return self.size
+
+    def get_version(self):
+        request = urllib.request.Request(self.name, method='HEAD')
+        self.requests += 1
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                headers = response.headers
+        except urllib.error.HTTPError as err:
+            raise OSError(f"Error reading {self.name}: {err}") from err
+        if headers.get('Content-Length') is not None:
+            self.size = int(headers['Content-Length'])
+        version = {'size': self.size, 'etag': headers.get('ETag'),
+                   'last_modified': headers.get('Last-Modified')}
+        if version['etag'] is None and version['last_modified'] is None:
+            return None
+        return version
+
+
+#######################################################################
+class CachedByteSource(ByteSource):
+    """ Block cache in front of another byte source.
+
+        Reads are rounded out to whole blocks.  Consecutive blocks that are
+        not cached are fetched with a single read of the underlying source.
+        Blocks are kept in memory (least recently used are dropped first)
+        and, if `cache_dir` is given, in files under it so that later
+        processes do not fetch them again.  The files are only used while
+        the version of the file (see :meth:`ByteSource.get_version`) is the
+        one they were fetched from.
+
+        Parameters
+        ----------
+        source : ByteSource
+            The source to cache.
+
+        block_size : int, optional
+            Size in bytes of the cached blocks, default is CACHE_BLOCK_SIZE.
+
+        cache_dir : str, optional
+            Directory for the local block cache, default is ``None`` (in
+            memory only).
+
+        max_blocks : int, optional
+            Maximum number of blocks kept in memory, default is
+            CACHE_MAX_BLOCKS.
+    """
+
+    def __init__(self, source, block_size=CACHE_BLOCK_SIZE, cache_dir=None, max_blocks=CACHE_MAX_BLOCKS):
+        super().__init__(source.name)
+        self.source = source
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+        self.size = source.size
+        self.hits = 0
+        self.misses = 0
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+        self._dir = None
+        if cache_dir:
+            key = hashlib.sha1(source.name.encode('utf-8')).hexdigest()
+            self._dir = os.path.join(cache_dir, key)
+            os.makedirs(self._dir, exist_ok=True)
+            self._check_version(source.get_version())
+            self.size = source.size
+            if self._dir is not None and self.size is None:
+                try:
+                    with open(os.path.join(self._dir, 'size'), 'r') as sizefh:
+                        self.size = int(sizefh.read())
+                except (OSError, ValueError):
+                    pass
+
+    def _check_version(self, version):
+        """ Empty the cache directory if its blocks are not of this version
+            of the file, or stop using it if the version is unknown.
+        """
+        version_file = os.path.join(self._dir, 'version')
+        try:
+            with open(version_file, 'r') as versionfh:
+                cached = json.load(versionfh)
+        except (OSError, ValueError):
+            cached = None
+        if version is not None and cached == version:
+            return
+
+        if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
+            miscutils.fwdebug_print(f"Dropping cached blocks of {self.name}: version {cached} is not {version}")
+        for fname in os.listdir(self._dir):
+            try:
+                os.unlink(os.path.join(self._dir, fname))
+            except FileNotFoundError:
+                pass
+        if version is None:
+            # nothing to check the cached blocks against later
+            self._dir = None
+        else:
+            self._save('version', json.dumps(version).encode('ascii'))
+
+    def _block_file(self, index):
+        return os.path.join(self._dir, f"{self.block_size:d}_{index:d}")
+
+    def _save(self, name, data):
+        """ Write a file in the cache directory atomically.
+        """
+        fd, tmpname = tempfile.mkstemp(dir=self._dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as outfh:
+            outfh.write(data)
+        os.replace(tmpname, os.path.join(self._dir, name))
+
+    def _get_cached(self, index):
+        """ Return a cached block or ``None``.
+        """
+        with self._lock:
+            block = self._blocks.get(index)
+            if block is not None:
+                self._blocks.move_to_end(index)
+                return block
+        if self._dir is not None:
+            try:
+                with open(self._block_file(index), 'rb') as blockfh:
+                    block = blockfh.read()
+            except OSError:
+                return None
+            self._put(index, block)
+        return block
+
+    def _put(self, index, block):
+        with self._lock:
+            self._blocks[index] = block
+            self._blocks.move_to_end(index)
+            while len(self._blocks) > self.max_blocks:
+                self._blocks.popitem(last=False)
+
+    def _fetch(self, first, last):
+        """ Fetch blocks first to last (inclusive) with one read.
+        """
+        data = self.source.read(first * self.block_size, (last - first + 1) * self.block_size)
+        self.requests += 1
+        self.bytes_read += len(data)
+        if self.source.size is not None:
+            if self.size is None and self._dir is not None:
+                self._save('size', str(self.source.size).encode('ascii'))
+            self.size = self.source.size
+        for index in range(first, last + 1):
+            start = (index - first) * self.block_size
+            block = data[start:start + self.block_size]
+            if not block:
+                break
+            self._put(index, block)
+            if self._dir is not None:
+                self._save(os.path.basename(self._block_file(index)), block)
+
+    def read_range(self, offset, size):
+        end = offset + size
+        if self.size is not None:
+            end = min(end, self.size)
+        if end <= offset:
+            return b''
+        first = offset // self.block_size
+        last = (end - 1) // self.block_size
+
+        blocks = {}
+        missing = []
+        for index in range(first, last + 1):
+            block = self._get_cached(index)
+            if block is None:
+                missing.append(index)
+            else:
+                blocks[index] = block
+        self.hits += len(blocks)
+        self.misses += len(missing)
+
+        # coalesce runs of consecutive missing blocks
+        runs = []
+        for index in missing:
+            if runs and runs[-1][1] == index - 1:
+                runs[-1][1] = index
+            else:
+                runs.append([index, index])
+        for run_first, run_last in runs:
+            self._fetch(run_first, run_last)
+            for index in range(run_first, run_last + 1):
+                block = self._get_cached(index)
+                if block is not None:
+                    blocks[index] = block
+
+        parts = []
+        for index in range(first, last + 1):
+            block = blocks.get(index, b'')
+            parts.append(block)
+            if len(block) < self.block_size:
+                break
+        data = b''.join(parts)
+        start = offset - first * self.block_size
+        return data[start:start + end - offset]
+
+    def get_size(self):
+        if self.size is None:
+            self.size = self.source.get_size()
+        return self.size
+
+    def close(self):
+        self.source.close()
+
+
+#######################################################################
+class SourceFile(io.RawIOBase):
+    """ Read-only, seekable binary file object over a byte source, e.g.
+        for :func:`fitsutils.get_hdu_toc`.
+    """
+
+    def __init__(self, source):
+        super().__init__()
+        self.source = source
+        self.name = source.name
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = self.source.get_size() + offset
+        else:
+            raise ValueError(f"Invalid whence {whence!r}")
+        return self._pos
+
+    def readinto(self, buf):
+        data = self.source.read(self._pos, len(buf))
+        buf[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+
+#######################################################################
+def register_source(scheme, factory):
+    """ Use `factory(name)` to make the byte source of names starting
+        with "<scheme>://".
+    """
+    SOURCE_SCHEMES[scheme.lower()] = factory
+
+
+def get_scheme(name):
+    """ Return the URL scheme of a file name, or ``None`` for a local path.
+    """
+    match = re.match(r'([A-Za-z][A-Za-z0-9+.-]*)://', str(name))
+    if match and match.group(1).lower() in SOURCE_SCHEMES:
+        return match.group(1).lower()
+    return None
+
+
+def is_remote(name):
+    """ Whether `name` is read through a registered (non local) source.
+    """
+    return get_scheme(name) is not None
+
+
+def open_source(name, cache_dir=None, block_size=CACHE_BLOCK_SIZE):
+    """ Open the byte source for a local path or a URL.
+
+        Parameters
+        ----------
+        name : str
+            Local path or URL of a registered scheme (http, https).
+
+        cache_dir : str, optional
+            Local block cache directory for remote sources, default is
+            $DESPYFITSUTILS_CACHE_DIR or ``None`` (in memory only).
+
+        block_size : int, optional
+            Block size of the cache for remote sources, default is
+            CACHE_BLOCK_SIZE.
+
+        Returns
+        -------
+        ByteSource
+            A LocalByteSource, or the registered source wrapped in a
+            CachedByteSource.
+    """
+    scheme = get_scheme(name)
+    if scheme is None:
+        return LocalByteSource(name)
+    if cache_dir is None:
+        cache_dir = os.environ.get(CACHE_DIR_ENV)
+    return CachedByteSource(SOURCE_SCHEMES[scheme](name), block_size, cache_dir)
+
+
+register_source('http', HTTPByteSource)
+register_source('https', HTTPByteSource)
+
+
+#######################################################################
+class RangeHTTPRequestHandler(SimpleHTTPRequestHandler):
+    """ SimpleHTTPRequestHandler answering single "Range: bytes=a-b"
+        requests with 206 Partial Content, as a local stand-in for a
+        range request service.
+    """
+
+    def send_head(self):
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match is None:
+            return super().send_head()
+
+        path = self.translate_path(self.path)
+        try:
+            infh = open(path, 'rb')
+        except OSError:
+            self.send_error(404, "File not found")
+            return None
+        with infh:
+            size = os.fstat(infh.fileno()).st_size
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f"bytes */{size:d}")
+                self.end_headers()
+                return None
+            infh.seek(start)
+            data = infh.read(end - start + 1)
+        self.send_response(206)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Range', f"bytes {start:d}-{end:d}/{size:d}")
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        return io.BytesIO(data)
+
+    def log_message(self, format, *args):
+        if miscutils.fwdebug_check(6, 'FITSUTILS_DEBUG'):
+            super().log_message(format, *args)
+
+
+def start_range_server(directory, host='127.0.0.1', port=0):
+    """ Serve the files in `directory` with range request support from a
+        background thread.
+
+        Returns
+        -------
+        tuple
+            The ThreadingHTTPServer (stop it with ``shutdown()`` and
+            ``server_close()``) and its base URL.
+    """
+    server = ThreadingHTTPServer((host, port), partial(RangeHTTPRequestHandler, directory=directory))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{server.server_address[0]}:{server.server_address[1]:d}"
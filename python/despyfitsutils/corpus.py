@@ -0,0 +1,569 @@
+"""
+    Deterministic test corpus of DES-like FITS files
+
+    generate_corpus() writes raw 70 extension exposures, reduced SCI/WGT/MSK
+    images, LDAC catalogs and a combined SCAMP head file, all derived from a
+    seed, so the same scale and seed always give byte identical files.
+    run_corpus() runs combine_cats, makeMEF, splitScampHead and the func_*
+    special metadata functions over a corpus, digests their outputs and
+    times them, so that changes to the code can be checked for both
+    correctness (against golden digests of a previous run) and throughput
+    without the Jenkins test data.  Golden digests of the corpus files and
+    task outputs for the default seed are shipped in the golden directory
+    of the package.
+"""
+
+import os
+import json
+import time
+import hashlib
+import datetime
+
+import numpy as np
+from astropy.io import fits
+
+import despymisc.miscutils as miscutils
+import despyfitsutils.fitsutils as fitsutils
+import despyfitsutils.fits_special_metadata as fsm
+
+CORPUS_VERSION = 1
+CORPUS_MANIFEST = 'corpus.json'
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden')
+
+# Number of raw exposures and their CCD size, number of reduced CCDs (each
+# with a SCI/WGT/MSK image, a catalog and a SCAMP head) and their size, and
+# the typical number of objects per catalog.
+CORPUS_SCALES = {
+    'small': {'nexposures': 1, 'raw_shape': (16, 32), 'nccds': 4,
+              'image_shape': (32, 64), 'nobjects': 100},
+    'medium': {'nexposures': 2, 'raw_shape': (256, 512), 'nccds': 16,
+               'image_shape': (512, 1024), 'nobjects': 2000},
+    'large': {'nexposures': 4, 'raw_shape': (1024, 2048), 'nccds': 62,
+              'image_shape': (1024, 2048), 'nobjects': 10000},
+}
+
+CORPUS_TASKS = ['combine_cats', 'makeMEF', 'splitScampHead', 'func']
+
+# Keywords that may legitimately differ between runs and are left out of
+# the digests
+DIGEST_IGNORE_KEYS = ('DATE', 'CHECKSUM', 'DATASUM')
+
+# The 70 CCDs of a raw DECam exposure: 62 science and 8 focus/guide CCDs
+RAW_DETPOS = [f"S{i:d}" for i in range(1, 32)] + [f"N{i:d}" for i in range(1, 32)] + \
+             [f"FS{i:d}" for i in range(1, 5)] + [f"FN{i:d}" for i in range(1, 5)]
+
+BASE_DATE_OBS = datetime.datetime(2016, 10, 19, 22, 30, 0)
+BASE_EXPNUM = 581000
+BANDS = ['g', 'r', 'i', 'z', 'Y']
+FILTERS = {'g': 'g DECam SDSS c0001 4720.0 1520.0', 'r': 'r DECam SDSS c0002 6415.0 1480.0',
+           'i': 'i DECam SDSS c0003 7835.0 1470.0', 'z': 'z DECam SDSS c0004 9260.0 1520.0',
+           'Y': 'Y DECam c0005 10095.0 1130.0'}
+
+# Seed streams of the different kinds of file
+_RAW, _IMAGE, _CATALOG, _HEAD = range(4)
+
+
+#######################################################################
+def _rng(seed, kind, num):
+    """ Return the random generator of one file, independent of the scale
+        and of the order the files are written in.
+    """
+    return np.random.default_rng([seed, kind, num])
+
+
+def _sexagesimal(value, hours=False):
+    """ Format degrees as 'dd:mm:ss.ss' (or 'hh:mm:ss.sss' for `hours`).
+    """
+    sign = '-' if value < 0 else ''
+    value = abs(value) / 15.0 if hours else abs(value)
+    ndec = 3 if hours else 2
+    total = round(value * 3600.0, ndec)
+    degs, rest = divmod(total, 3600.0)
+    mins, secs = divmod(rest, 60.0)
+    return f"{sign}{int(degs):02d}:{int(mins):02d}:{secs:0{3 + ndec}.{ndec}f}"
+
+
+def _exposure_info(seed, num):
+    """ Return the header values shared by all files of one exposure.
+    """
+    rng = _rng(seed, _RAW, num)
+    band = BANDS[num % len(BANDS)]
+    # 90 minutes apart, so that the dates of an observing nite cross
+    # midnight
+    date_obs = BASE_DATE_OBS + datetime.timedelta(minutes=90 * num,
+                                                  microseconds=int(rng.integers(0, 60000000)))
+    ra = float(rng.uniform(0.0, 360.0))
+    dec = float(rng.uniform(-65.0, 5.0))
+    return {'EXPNUM': BASE_EXPNUM + num,
+            'BAND': band,
+            'FILTER': FILTERS[band],
+            'INSTRUME': 'DECam',
+            'DATE-OBS': date_obs.strftime('%Y-%m-%dT%H:%M:%S.%f'),
+            'OBJECT': f"DES survey hex {int(ra * 10) - 1800:d}{int(dec * 10):d} tiling {num % 4 + 1:d}",
+            'TELRA': _sexagesimal(ra, hours=True),
+            'TELDEC': _sexagesimal(dec),
+            'ra': ra,
+            'dec': dec}
+
+
+def _ccd_center(info, ccdnum):
+    """ Return the (RA, DEC) in degrees of a CCD of an exposure.
+    """
+    k = ccdnum - 1
+    dec = info['dec'] + ((k // 8) - 4) * 0.15
+    ra = (info['ra'] + ((k % 8) - 3.5) * 0.3 / np.cos(np.radians(dec))) % 360.0
+    return ra, dec
+
+
+def _exposure_header(info, ccdnum=None):
+    """ Return the header cards of an exposure or one of its CCDs.
+    """
+    hdr = fits.Header()
+    for key in ['EXPNUM', 'FILTER', 'INSTRUME', 'DATE-OBS', 'OBJECT', 'TELRA', 'TELDEC']:
+        hdr[key] = info[key]
+    hdr['BAND'] = info['BAND']
+    if ccdnum is None:
+        hdr['RA'] = info['TELRA']
+        hdr['DEC'] = info['TELDEC']
+    else:
+        ra, dec = _ccd_center(info, ccdnum)
+        hdr['CCDNUM'] = ccdnum
+        hdr['DETPOS'] = RAW_DETPOS[ccdnum - 1]
+        hdr['RA'] = _sexagesimal(ra, hours=True)
+        hdr['DEC'] = _sexagesimal(dec)
+    return hdr
+
+
+#######################################################################
+def write_raw_exposure(filename, seed, num, shape):
+    """ Write a raw exposure: an empty primary HDU and 70 uint16 CCDs.
+    """
+    rng = _rng(seed, _RAW, num)
+    info = _exposure_info(seed, num)
+    hdus = [fits.PrimaryHDU(header=_exposure_header(info))]
+    for ccdnum, detpos in enumerate(RAW_DETPOS, start=1):
+        sky = 1000.0 + 50.0 * ccdnum
+        data = np.clip(sky + rng.normal(0.0, np.sqrt(sky), shape), 0, 65535).astype(np.uint16)
+        hdu = fits.ImageHDU(data, header=_exposure_header(info, ccdnum))
+        hdu.header['EXTNAME'] = detpos
+        hdus.append(hdu)
+    fits.HDUList(hdus).writeto(filename, overwrite=True)
+
+
+def write_images(filenames, seed, num, shape, info=None):
+    """ Write the reduced SCI, WGT and MSK images of one CCD.
+
+        Parameters
+        ----------
+        filenames : list
+            The SCI, WGT and MSK file names.
+
+        seed, num : int
+            The corpus seed and the CCD number.
+
+        shape : tuple
+            The image shape.
+
+        info : dict, optional
+            The exposure header values, default is those of exposure 0.
+    """
+    rng = _rng(seed, _IMAGE, num)
+    if info is None:
+        info = _exposure_info(seed, 0)
+    hdr = _exposure_header(info, num)
+    sky = 200.0 + 10.0 * num
+    sci = (rng.normal(sky, np.sqrt(sky), shape) - sky).astype(np.float32)
+    wgt = np.full(shape, 1.0 / sky, dtype=np.float32)
+    msk = np.zeros(shape, dtype=np.int16)
+    # a bad column and some cosmic rays
+    col = int(rng.integers(0, shape[1]))
+    msk[:, col] = 1
+    wgt[:, col] = 0.0
+    hits = rng.integers(0, shape[0] * shape[1], max(1, shape[0] * shape[1] // 1000))
+    sci.flat[hits] += 5000.0
+    msk.flat[hits] |= 4
+    for fname, data in zip(filenames, [sci, wgt, msk]):
+        fits.PrimaryHDU(data, header=hdr).writeto(fname, overwrite=True)
+
+
+def write_catalog(filename, seed, num, nobjects, info=None):
+    """ Write an LDAC catalog (primary, LDAC_IMHEAD, LDAC_OBJECTS) of one
+        CCD, with about `nobjects` objects.
+    """
+    rng = _rng(seed, _CATALOG, num)
+    if info is None:
+        info = _exposure_info(seed, 0)
+    nobj = int(rng.integers(nobjects * 4 // 5, nobjects * 6 // 5 + 1))
+    ra, dec = _ccd_center(info, num)
+
+    imhdr = _exposure_header(info, num)
+    cardstr = [str(card) for card in imhdr.cards] + ['END'.ljust(80)]
+    imhead = fits.BinTableHDU.from_columns(
+        [fits.Column(name='Field Header Card', format=f'{80*len(cardstr):d}A',
+                     dim=f'(80, {len(cardstr):d})', array=np.array([cardstr]))])
+    imhead.header['EXTNAME'] = 'LDAC_IMHEAD'
+
+    mags = rng.uniform(14.0, 25.0, nobj)
+    objects = fits.BinTableHDU.from_columns(
+        [fits.Column(name='NUMBER', format='J', array=np.arange(1, nobj + 1)),
+         fits.Column(name='XWIN_IMAGE', format='D', array=rng.uniform(1.0, 2048.0, nobj)),
+         fits.Column(name='YWIN_IMAGE', format='D', array=rng.uniform(1.0, 4096.0, nobj)),
+         fits.Column(name='ALPHAWIN_J2000', format='D', array=ra + rng.uniform(-0.15, 0.15, nobj)),
+         fits.Column(name='DELTAWIN_J2000', format='D', array=dec + rng.uniform(-0.075, 0.075, nobj)),
+         fits.Column(name='MAG_AUTO', format='E', array=mags),
+         fits.Column(name='MAGERR_AUTO', format='E', array=0.01 * np.exp(mags - 20.0)),
+         fits.Column(name='FLUX_RADIUS', format='E', array=rng.gamma(4.0, 0.8, nobj)),
+         fits.Column(name='CLASS_STAR', format='E', array=rng.uniform(0.0, 1.0, nobj)),
+         fits.Column(name='FLAGS', format='I', array=rng.integers(0, 4, nobj))])
+    objects.header['EXTNAME'] = 'LDAC_OBJECTS'
+    fits.HDUList([fits.PrimaryHDU(), imhead, objects]).writeto(filename, overwrite=True)
+
+
+def write_scamp_head(filename, seed, nheads, info=None):
+    """ Write a combined SCAMP head file with one head per CCD.
+    """
+    rng = _rng(seed, _HEAD, 0)
+    if info is None:
+        info = _exposure_info(seed, 0)
+    lines = []
+    for ccdnum in range(1, nheads + 1):
+        ra, dec = _ccd_center(info, ccdnum)
+        hdr = fits.Header()
+        hdr['EQUINOX'] = (2000.0, 'Mean equinox')
+        hdr['RADESYS'] = ('ICRS', 'Astrometric system')
+        hdr['CTYPE1'] = ('RA---TPV', 'WCS projection type for this axis')
+        hdr['CTYPE2'] = ('DEC--TPV', 'WCS projection type for this axis')
+        hdr['CRVAL1'] = (ra, 'World coordinate on this axis')
+        hdr['CRVAL2'] = (dec, 'World coordinate on this axis')
+        hdr['CRPIX1'] = (float(rng.normal(1024.0, 5.0)), 'Reference pixel on this axis')
+        hdr['CRPIX2'] = (float(rng.normal(2048.0, 5.0)), 'Reference pixel on this axis')
+        for key in ['CD1_1', 'CD1_2', 'CD2_1', 'CD2_2']:
+            scale = 7.3e-5 if key in ('CD1_1', 'CD2_2') else 1e-7
+            hdr[key] = (float(rng.normal(scale, 1e-8)), 'Linear projection matrix')
+        for axis in (1, 2):
+            for term in range(11):
+                hdr[f"PV{axis:d}_{term:d}"] = (float(rng.normal(0.0, 1e-3)),
+                                               'Projection distortion parameter')
+        hdr['FGROUPNO'] = (1, 'SCAMP field group label')
+        hdr['ASTIRMS1'] = (float(rng.uniform(1e-5, 3e-5)), 'Astrom. dispersion RMS (intern., high S/N)')
+        hdr['ASTIRMS2'] = (float(rng.uniform(1e-5, 3e-5)), 'Astrom. dispersion RMS (intern., high S/N)')
+        # SCAMP puts two extra spaces after HISTORY
+        lines.append('HISTORY   Astrometric solution by SCAMP version 2.0.4 (2016-10-19)'.ljust(80))
+        lines.extend(str(card) for card in hdr.cards)
+        lines.append('END'.ljust(80))
+    with open(filename, 'w') as headfh:
+        headfh.write(''.join(line + '\n' for line in lines))
+
+
+#######################################################################
+def generate_corpus(outdir, scale='small', seed=0, clobber=False):
+    """ Write a corpus of FITS files.
+
+        Parameters
+        ----------
+        outdir : str
+            The directory to write the corpus to, created if needed.
+
+        scale : str, optional
+            One of the CORPUS_SCALES, default is 'small'.
+
+        seed : int, optional
+            The random seed, default is 0.
+
+        clobber : bool, optional
+            Whether to write the files again when `outdir` already has a
+            corpus of the same scale and seed, default is ``False``.
+
+        Returns
+        -------
+        dict
+            The corpus manifest, also written to `outdir`/corpus.json.
+            File names in it are relative to `outdir`.
+
+        Raises
+        ------
+        ValueError
+            If `scale` is unknown.
+    """
+    if scale not in CORPUS_SCALES:
+        raise ValueError(f"Unknown corpus scale {scale}, must be one of {', '.join(CORPUS_SCALES)}")
+    params = CORPUS_SCALES[scale]
+
+    manifest_name = os.path.join(outdir, CORPUS_MANIFEST)
+    if not clobber and os.path.exists(manifest_name):
+        manifest = read_corpus_manifest(outdir)
+        if manifest['scale'] == scale and manifest['seed'] == seed:
+            return manifest
+
+    for subdir in ['raw', 'red', 'cat', 'head']:
+        os.makedirs(os.path.join(outdir, subdir), exist_ok=True)
+
+    info = _exposure_info(seed, 0)
+    manifest = {'version': CORPUS_VERSION, 'scale': scale, 'seed': seed,
+                'raw': [], 'images': [], 'catalogs': [], 'scamp_head': None,
+                'scamp_outputs': []}
+    for num in range(params['nexposures']):
+        fname = f"raw/DECam_{BASE_EXPNUM + num:08d}.fits"
+        if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
+            miscutils.fwdebug_print(f"Writing {fname}")
+        write_raw_exposure(os.path.join(outdir, fname), seed, num, params['raw_shape'])
+        manifest['raw'].append(fname)
+
+    prefix = f"D{info['EXPNUM']:08d}_{info['BAND']}"
+    for ccdnum in range(1, params['nccds'] + 1):
+        names = [f"red/{prefix}_c{ccdnum:02d}_{ext}.fits" for ext in ['sci', 'wgt', 'msk']]
+        write_images([os.path.join(outdir, fname) for fname in names], seed, ccdnum,
+                     params['image_shape'], info)
+        manifest['images'].append(names)
+
+        fname = f"cat/{prefix}_c{ccdnum:02d}_cat.fits"
+        write_catalog(os.path.join(outdir, fname), seed, ccdnum, params['nobjects'], info)
+        manifest['catalogs'].append(fname)
+        manifest['scamp_outputs'].append(f"{prefix}_c{ccdnum:02d}_scamp.head")
+
+    manifest['scamp_head'] = f"head/{prefix}_scamp.head"
+    write_scamp_head(os.path.join(outdir, manifest['scamp_head']), seed, params['nccds'], info)
+
+    with open(manifest_name, 'w') as manfh:
+        json.dump(manifest, manfh, indent=1)
+    return manifest
+
+
+def read_corpus_manifest(corpusdir):
+    """ Read the manifest written by :func:`generate_corpus`.
+
+        Raises
+        ------
+        ValueError
+            If the manifest was written by an incompatible version.
+    """
+    with open(os.path.join(corpusdir, CORPUS_MANIFEST), 'r') as manfh:
+        manifest = json.load(manfh)
+    if manifest.get('version') != CORPUS_VERSION:
+        raise ValueError(f"{corpusdir} is not a version {CORPUS_VERSION} corpus")
+    return manifest
+
+
+#######################################################################
+def fits_digest(filename, ignore=DIGEST_IGNORE_KEYS):
+    """ Return the sha256 hex digest of the header cards (except `ignore`)
+        and data of all HDUs of a FITS file.
+    """
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as fitsfh:
+        for entry in fitsutils.get_hdu_toc(fitsfh):
+            for card in entry['header'].cards:
+                if card.keyword not in ignore:
+                    digest.update(str(card).encode('ascii'))
+            digest.update(b'END')
+            fitsfh.seek(entry['datLoc'])
+            remaining = entry['datSpan']
+            while remaining > 0:
+                chunk = fitsfh.read(min(remaining, fitsutils.COPY_CHUNK_SIZE))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def file_digest(filename):
+    """ Return the sha256 hex digest of the bytes of a file.
+    """
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as infh:
+        for chunk in iter(lambda: infh.read(fitsutils.COPY_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _combine_digests(digests):
+    """ Return one digest of a list of digests.
+    """
+    return hashlib.sha256(''.join(digests).encode('ascii')).hexdigest()
+
+
+def corpus_digest(corpusdir, manifest=None):
+    """ Return one digest of all the files written by
+        :func:`generate_corpus`, to tell whether the generator changed.
+    """
+    if manifest is None:
+        manifest = read_corpus_manifest(corpusdir)
+    fnames = manifest['raw'] + [fname for names in manifest['images'] for fname in names] + \
+        manifest['catalogs'] + [manifest['scamp_head']]
+    return _combine_digests([file_digest(os.path.join(corpusdir, fname)) for fname in fnames])
+
+
+#######################################################################
+def _task_combine_cats(corpusdir, workdir, manifest):
+    incats = [os.path.join(corpusdir, fname) for fname in manifest['catalogs']]
+    outcat = os.path.join(workdir, 'combined_cat.fits')
+    if os.path.exists(outcat):
+        os.unlink(outcat)
+    fitsutils.combine_cats(','.join(incats), outcat)
+    return incats, [outcat], fits_digest
+
+
+def _task_makemef(corpusdir, workdir, manifest):
+    infiles = []
+    outfiles = []
+    for names in manifest['images']:
+        filenames = [os.path.join(corpusdir, fname) for fname in names]
+        outname = os.path.join(workdir, os.path.basename(names[0]).replace('_sci.fits', '_mef.fits'))
+        fitsutils.makeMEF(filenames=filenames, outname=outname,
+                          extnames=['SCI', 'WGT', 'MSK'], clobber=True)
+        infiles.extend(filenames)
+        outfiles.append(outname)
+    return infiles, outfiles, fits_digest
+
+
+def _task_splitscamphead(corpusdir, workdir, manifest):
+    head = os.path.join(corpusdir, manifest['scamp_head'])
+    outfiles = [os.path.join(workdir, fname) for fname in manifest['scamp_outputs']]
+    fitsutils.splitScampHead(head, ','.join(outfiles))
+    return [head], outfiles, file_digest
+
+
+def _task_func(corpusdir, workdir, manifest):
+    values = []
+    infiles = []
+    for fname in manifest['raw']:
+        filename = os.path.join(corpusdir, fname)
+        with fitsutils.open_headers(filename) as hdulist:
+            for key in ['band', 'camsym', 'nite', 'field', 'radeg', 'decdeg', 'tradeg', 'tdecdeg']:
+                values.append([fname, key, None, fsm.call_special_func(key, filename, hdulist)])
+            for hdu in range(1, len(hdulist)):
+                for key in ['radeg', 'decdeg']:
+                    values.append([fname, key, hdu, fsm.call_special_func(key, filename, hdulist, hdu)])
+        infiles.append(filename)
+    for fname in manifest['catalogs']:
+        filename = os.path.join(corpusdir, fname)
+        values.append([fname, 'objects', 2, fsm.call_special_func('objects', filename, whichhdu=2)])
+        infiles.append(filename)
+
+    outname = os.path.join(workdir, 'func_values.json')
+    with open(outname, 'w') as outfh:
+        json.dump(values, outfh)
+    return infiles, [outname], file_digest
+
+
+TASKS = {'combine_cats': _task_combine_cats,
+         'makeMEF': _task_makemef,
+         'splitScampHead': _task_splitscamphead,
+         'func': _task_func}
+
+
+def run_corpus(corpusdir, workdir=None, golden=None, tasks=None, repeat=1, callback=None):
+    """ Run the tasks over a corpus, checking their outputs against golden
+        digests and timing them.
+
+        Parameters
+        ----------
+        corpusdir : str
+            A directory written by :func:`generate_corpus`.
+
+        workdir : str, optional
+            The directory for the outputs, default is `corpusdir`/work.
+
+        golden : dict, optional
+            Golden digests as returned by :func:`make_golden`.  The default
+            is ``None``, in which case outputs are not checked.
+
+        tasks : list, optional
+            The tasks to run (CORPUS_TASKS), default is all.
+
+        repeat : int, optional
+            Number of times to run each task, the fastest time is reported.
+            The default is 1.
+
+        callback : function, optional
+            Called with each result dict as its task finishes.  The
+            default is ``None``.
+
+        Returns
+        -------
+        list
+            One dict per task with keys 'task', 'status' ('ok', 'mismatch',
+            'new' when there is no golden digest, or 'failed'), 'error',
+            'digest', 'golden', 'seconds', 'nbytes' (input size), 'mbps'
+            and 'noutputs'.
+
+        Raises
+        ------
+        ValueError
+            If a task is unknown or `golden` is for a different corpus.
+    """
+    manifest = read_corpus_manifest(corpusdir)
+    if golden is not None and (golden.get('scale'), golden.get('seed')) != (manifest['scale'], manifest['seed']):
+        raise ValueError(f"Golden digests are for scale {golden.get('scale')} seed {golden.get('seed')}, "
+                         f"corpus is scale {manifest['scale']} seed {manifest['seed']}")
+    tasks = CORPUS_TASKS if tasks is None else tasks
+    for task in tasks:
+        if task not in TASKS:
+            raise ValueError(f"Unknown corpus task {task}, must be one of {', '.join(CORPUS_TASKS)}")
+    if workdir is None:
+        workdir = os.path.join(corpusdir, 'work')
+
+    results = []
+    for task in tasks:
+        result = {'task': task, 'status': 'ok', 'error': None, 'digest': None,
+                  'golden': None if golden is None else golden['digests'].get(task),
+                  'seconds': None, 'nbytes': 0, 'mbps': None, 'noutputs': 0}
+        taskdir = os.path.join(workdir, task)
+        os.makedirs(taskdir, exist_ok=True)
+        try:
+            for _ in range(max(1, repeat)):
+                start = time.perf_counter()
+                infiles, outfiles, digest_func = TASKS[task](corpusdir, taskdir, manifest)
+                seconds = time.perf_counter() - start
+                if result['seconds'] is None or seconds < result['seconds']:
+                    result['seconds'] = seconds
+            result['digest'] = _combine_digests([digest_func(fname) for fname in outfiles])
+            result['noutputs'] = len(outfiles)
+            result['nbytes'] = sum(os.path.getsize(fname) for fname in infiles)
+            if result['seconds'] > 0:
+                result['mbps'] = result['nbytes'] / result['seconds'] / 1e6
+        except Exception as err:
+            result['status'] = 'failed'
+            result['error'] = f"{type(err).__name__}: {err}"
+        else:
+            if result['golden'] is None:
+                result['status'] = 'new'
+            elif result['golden'] != result['digest']:
+                result['status'] = 'mismatch'
+        results.append(result)
+        if callback is not None:
+            callback(result)
+    return results
+
+
+def make_golden(corpusdir, results, golden=None):
+    """ Return golden digests from the results of :func:`run_corpus`,
+        updating `golden` (if given) with the tasks that did not fail and
+        the digest of the corpus files.
+    """
+    manifest = read_corpus_manifest(corpusdir)
+    if golden is None:
+        golden = {'scale': manifest['scale'], 'seed': manifest['seed'], 'digests': {}}
+    golden['corpus'] = corpus_digest(corpusdir, manifest)
+    for result in results:
+        if result['status'] != 'failed':
+            golden['digests'][result['task']] = result['digest']
+    return golden
+
+
+def golden_filename(scale, seed):
+    """ Return the name of the shipped golden digests of a corpus.
+    """
+    return os.path.join(GOLDEN_DIR, f"corpus_{scale}_{seed:d}.json")
+
+
+def read_golden(scale, seed):
+    """ Return the shipped golden digests of a corpus, or ``None`` if
+        there are none for this scale and seed.
+    """
+    fname = golden_filename(scale, seed)
+    if not os.path.exists(fname):
+        return None
+    with open(fname, 'r') as goldfh:
+        return json.load(goldfh)
@@ -7,10 +7,16 @@
     Specialized functions for computing metadata
 """
 
-from astropy.io import fits
+import inspect
+from functools import lru_cache
+
+import numpy as np
 import despyfitsutils.fitsutils as fitsutils
 import despymisc.create_special_metadata as spmeta
 
+# Number of distinct raw values remembered by each cached decoder
+DECODE_CACHE_SIZE = 65536
+
 
 ######################################################################
 # !!!! Function name must be all lowercase
@@ -18,6 +24,66 @@ import despymisc.create_special_metadata as spmeta
 ######################################################################
 
 
+######################################################################
+def get_special_func(key):
+    """ Return the function that computes a special metadata value.
+
+        Parameters
+        ----------
+        key : str
+            The function name ('func_band') or the value name ('band').
+
+        Returns
+        -------
+        function
+            The matching func_<header key> function.
+
+        Raises
+        ------
+        ValueError
+            If there is no such function.
+    """
+    name = key.lower()
+    if not name.startswith('func_'):
+        name = 'func_' + name
+    func = globals().get(name)
+    if not callable(func):
+        raise ValueError(f"Unknown special metadata function {key}")
+    return func
+
+
+######################################################################
+def call_special_func(key, filename, hdulist=None, whichhdu=None):
+    """ Compute a special metadata value by name.
+
+        Parameters
+        ----------
+        key : str
+            The function name ('func_band') or the value name ('band').
+
+        filename : str
+            The file to read from (must be a fits file), only used if
+            hdulist is ``None``.
+
+        hdulist : astropy.io.fits.HDUList, optional
+            A listing of the HDUs to search for the requested HDU,
+            default is ``None``, in which case `filename` is opened and used.
+
+        whichhdu : various, optional
+            The HDU being searched for, ignored by functions that always use
+            the primary HDU. The default is ``None``.
+
+        Returns
+        -------
+        various
+            The value computed by the function.
+    """
+    func = get_special_func(key)
+    if 'whichhdu' in inspect.signature(func).parameters:
+        return func(filename, hdulist, whichhdu)
+    return func(filename, hdulist)
+
+
 ######################################################################
 def func_band(filename, hdulist=None, whichhdu=None):
     """ Create band from the 'FILTER' keyword
@@ -45,7 +111,7 @@ def func_band(filename, hdulist=None, whichhdu=None):
 
     hdulist2 = None
     if hdulist is None:
-        hdulist2 = fits.open(filename, 'readonly')
+        hdulist2 = fitsutils.open_headers(filename)
     else:
         hdulist2 = hdulist
 
@@ -84,7 +150,7 @@ def func_camsym(filename, hdulist=None, whichhdu=None):
     """
     hdulist2 = None
     if hdulist is None:
-        hdulist2 = fits.open(filename, 'readonly')
+        hdulist2 = fitsutils.open_headers(filename)
     else:
         hdulist2 = hdulist
 
@@ -124,7 +190,7 @@ def func_nite(filename, hdulist=None, whichhdu=None):
 
     hdulist2 = None
     if hdulist is None:
-        hdulist2 = fits.open(filename, 'readonly')
+        hdulist2 = fitsutils.open_headers(filename)
     else:
         hdulist2 = hdulist
 
@@ -133,7 +199,7 @@ def func_nite(filename, hdulist=None, whichhdu=None):
     if hdulist is None:
         hdulist2.close()
 
-    return spmeta.create_nite(date_obs)
+    return decode_nite(date_obs)
 
 
 ######################################################################
@@ -164,7 +230,7 @@ def func_objects(filename, hdulist=None, whichhdu=None):
     """
     hdulist2 = None
     if hdulist is None:
-        hdulist2 = fits.open(filename, 'readonly')
+        hdulist2 = fitsutils.open_headers(filename)
     else:
         hdulist2 = hdulist
 
@@ -203,7 +269,7 @@ def func_field(filename, hdulist=None, whichhdu=None):
     """
     hdulist2 = None
     if hdulist is None:
-        hdulist2 = fits.open(filename, 'readonly')
+        hdulist2 = fitsutils.open_headers(filename)
     else:
         hdulist2 = hdulist
 
@@ -243,7 +309,7 @@ def func_radeg(filename, hdulist=None, whichhdu=None):
     """
     hdulist2 = None
     if hdulist is None:
-        hdulist2 = fits.open(filename, 'readonly')
+        hdulist2 = fitsutils.open_headers(filename)
     else:
         hdulist2 = hdulist
 
@@ -252,7 +318,7 @@ def func_radeg(filename, hdulist=None, whichhdu=None):
     if hdulist is None:
         hdulist2.close()
 
-    return spmeta.convert_ra_to_deg(ra)
+    return decode_ra(ra)
 
 ######################################################################
 def func_tradeg(filename, hdulist=None):
@@ -280,7 +346,7 @@ def func_tradeg(filename, hdulist=None):
     """
     hdulist2 = None
     if hdulist is None:
-        hdulist2 = fits.open(filename, 'readonly')
+        hdulist2 = fitsutils.open_headers(filename)
     else:
         hdulist2 = hdulist
 
@@ -289,7 +355,7 @@ def func_tradeg(filename, hdulist=None):
     if hdulist is None:
         hdulist2.close()
 
-    return spmeta.convert_ra_to_deg(telra)
+    return decode_ra(telra)
 
 ######################################################################
 def func_decdeg(filename, hdulist=None, whichhdu=None):
@@ -318,7 +384,7 @@ def func_decdeg(filename, hdulist=None, whichhdu=None):
     """
     hdulist2 = None
     if hdulist is None:
-        hdulist2 = fits.open(filename, 'readonly')
+        hdulist2 = fitsutils.open_headers(filename)
     else:
         hdulist2 = hdulist
 
@@ -327,7 +393,7 @@ def func_decdeg(filename, hdulist=None, whichhdu=None):
     if hdulist is None:
         hdulist2.close()
 
-    return spmeta.convert_dec_to_deg(dec)
+    return decode_dec(dec)
 
 ######################################################################
 def func_tdecdeg(filename, hdulist=None):
@@ -356,7 +422,7 @@ def func_tdecdeg(filename, hdulist=None):
     """
     hdulist2 = None
     if hdulist is None:
-        hdulist2 = fits.open(filename, 'readonly')
+        hdulist2 = fitsutils.open_headers(filename)
     else:
         hdulist2 = hdulist
 
@@ -365,4 +431,290 @@ def func_tdecdeg(filename, hdulist=None):
     if hdulist is None:
         hdulist2.close()
 
-    return spmeta.convert_dec_to_deg(teldec)
+    return decode_dec(teldec)
+
+
+######################################################################
+# Cached decoders, keyed by the raw header value, used by the func_*
+# functions so that a value seen before is not parsed again
+######################################################################
+@lru_cache(maxsize=DECODE_CACHE_SIZE)
+def decode_nite(date_obs):
+    """ Return the nite of a DATE-OBS value, as create_nite (cached).
+    """
+    return spmeta.create_nite(date_obs)
+
+
+@lru_cache(maxsize=DECODE_CACHE_SIZE)
+def decode_ra(ra):
+    """ Return a sexagesimal RA value in degrees, as convert_ra_to_deg
+        (cached).
+    """
+    return spmeta.convert_ra_to_deg(ra)
+
+
+@lru_cache(maxsize=DECODE_CACHE_SIZE)
+def decode_dec(dec):
+    """ Return a sexagesimal DEC value in degrees, as convert_dec_to_deg
+        (cached).
+    """
+    return spmeta.convert_dec_to_deg(dec)
+
+
+DECODERS = {'nite': decode_nite, 'ra': decode_ra, 'dec': decode_dec}
+
+
+def decode_cache_info():
+    """ Return the hits, misses, maxsize and currsize of each cached
+        decoder, keyed by 'nite', 'ra' and 'dec'.
+    """
+    return {name: func.cache_info()._asdict() for name, func in DECODERS.items()}
+
+
+def clear_decode_cache():
+    """ Empty the caches of all decoders.
+    """
+    for func in DECODERS.values():
+        func.cache_clear()
+
+
+######################################################################
+# Array versions of the DATE-OBS and RA/DEC functions, for converting
+# many values at once.  These are not func_<header key> functions.
+######################################################################
+
+
+######################################################################
+def date_obs_to_datetime64(values):
+    """ Convert many DATE-OBS strings ('YYYY-MM-DDThh:mm:ss.ssssss') to
+        numpy datetime64 values.
+
+        Parameters
+        ----------
+        values : sequence
+            The DATE-OBS strings.
+
+        Returns
+        -------
+        numpy.ndarray
+            datetime64[us] values, NaT where a value cannot be parsed.
+    """
+    strs = np.char.strip(np.asarray(values, dtype=str).ravel())
+    try:
+        return strs.astype('datetime64[us]')
+    except ValueError:
+        out = np.full(strs.shape, np.datetime64('NaT'), dtype='datetime64[us]')
+        for i, val in enumerate(strs):
+            try:
+                out[i] = np.datetime64(val, 'us')
+            except ValueError:
+                pass
+        return out
+
+
+######################################################################
+def nite_array(values, invalid=-1):
+    """ Convert many DATE-OBS strings to nites as integers (YYYYMMDD).
+
+        The nite only depends on the date and hour (the part of DATE-OBS
+        before the first ':'), so create_nite is called once per distinct
+        date and hour and the results are identical to :func:`func_nite`.
+
+        Parameters
+        ----------
+        values : sequence
+            The DATE-OBS strings.
+
+        invalid : int, optional
+            The value for entries that cannot be parsed, default is -1.
+
+        Returns
+        -------
+        numpy.ndarray
+            The nites as int64.
+    """
+    strs = np.asarray(values, dtype=str).ravel()
+    prefixes = np.char.partition(strs, ':')[:, 0]
+    uniq, first, inverse = np.unique(prefixes, return_index=True, return_inverse=True)
+    nites = np.full(len(uniq), invalid, dtype=np.int64)
+    for k, i in enumerate(first):
+        try:
+            nites[k] = int(decode_nite(str(strs[i])))
+        except (ValueError, IndexError, TypeError):
+            pass
+    return nites[inverse.ravel()]
+
+
+######################################################################
+def _to_float_array(strs):
+    """ Convert an array of strings to floats, NaN where not a number.
+    """
+    try:
+        return strs.astype(np.float64)
+    except ValueError:
+        out = np.full(strs.shape, np.nan)
+        for i, val in enumerate(strs):
+            try:
+                out[i] = float(val)
+            except ValueError:
+                pass
+        return out
+
+
+######################################################################
+def _sexagesimal_to_array(values):
+    """ Split sexagesimal strings ('dd:mm:ss.s') into arrays.
+
+        Returns the absolute value of the first field, the minutes, the
+        seconds and a boolean array that is ``True`` for negative values.
+        Entries that are not of the form 'dd:mm:ss.s' are NaN.
+    """
+    strs = np.char.strip(np.asarray(values, dtype=str).ravel())
+    first = np.char.partition(strs, ':')
+    second = np.char.partition(first[:, 2], ':')
+    # exactly three fields are required
+    valid = (first[:, 1] == ':') & (second[:, 1] == ':') & \
+            (np.char.find(second[:, 2], ':') == -1)
+
+    degs = _to_float_array(np.where(valid, first[:, 0], 'nan'))
+    mins = _to_float_array(np.where(valid, second[:, 0], 'nan'))
+    secs = _to_float_array(np.where(valid, second[:, 2], 'nan'))
+    negative = np.char.startswith(first[:, 0], '-')
+    return np.abs(degs), mins, secs, negative
+
+
+######################################################################
+def ra_to_deg_array(values):
+    """ Convert many sexagesimal RA strings ('hh:mm:ss.s') to degrees.
+
+        Parameters
+        ----------
+        values : sequence
+            The RA strings, e.g. header values of 'RA' or 'TELRA'.
+
+        Returns
+        -------
+        numpy.ndarray
+            The RAs in decimal degrees, NaN where a value cannot be parsed.
+    """
+    hours, mins, secs, _ = _sexagesimal_to_array(values)
+    # the operations of convert_ra_to_deg in the same order, so that the
+    # results are identical to func_radeg
+    return hours * 15 + mins * 0.25 + secs * 0.25 / 60
+
+
+######################################################################
+def dec_to_deg_array(values):
+    """ Convert many sexagesimal DEC strings ('dd:mm:ss.s') to degrees.
+
+        Parameters
+        ----------
+        values : sequence
+            The DEC strings, e.g. header values of 'DEC' or 'TELDEC'.
+
+        Returns
+        -------
+        numpy.ndarray
+            The DECs in decimal degrees, NaN where a value cannot be parsed.
+    """
+    degs, mins, secs, negative = _sexagesimal_to_array(values)
+    # as convert_dec_to_deg
+    dec = degs + mins / 60 + secs / 3600
+    return np.where(negative, -dec, dec)
+
+
+######################################################################
+def _get_hdr_values(filenames, key, whichhdu):
+    """ Read the value of `key` from each file, ``None`` where it is missing.
+    """
+    values = []
+    for filename in filenames:
+        with fitsutils.open_headers(filename) as hdulist:
+            try:
+                values.append(fitsutils.get_hdr_value(hdulist, key, whichhdu))
+            except KeyError:
+                values.append(None)
+    return values
+
+
+######################################################################
+def radeg_array(filenames, whichhdu=None):
+    """ Get the FITS header value of 'RA' in decimal degrees for many files.
+
+        Parameters
+        ----------
+        filenames : sequence
+            The files to get the RA keyword from (must be fits files).
+
+        whichhdu : various, optional
+            The HDU being searched for, this can be an int for the HDU index,
+            a string for the HDU name, or ``None`` in which case the primary
+            HDU is used. The default is ``None``.
+
+        Returns
+        -------
+        numpy.ndarray
+            The decimal values of the RA, NaN where missing or unparsable.
+    """
+    return ra_to_deg_array(_get_hdr_values(filenames, 'RA', whichhdu))
+
+
+######################################################################
+def tradeg_array(filenames):
+    """ Get the FITS header value of 'TELRA' in decimal degrees for many
+        files.
+
+        Parameters
+        ----------
+        filenames : sequence
+            The files to get the TELRA keyword from (must be fits files).
+
+        Returns
+        -------
+        numpy.ndarray
+            The values of TELRA in decimal degrees, NaN where missing or
+            unparsable.
+    """
+    return ra_to_deg_array(_get_hdr_values(filenames, 'TELRA', None))
+
+
+######################################################################
+def decdeg_array(filenames, whichhdu=None):
+    """ Get the FITS header value of 'DEC' in decimal degrees for many files.
+
+        Parameters
+        ----------
+        filenames : sequence
+            The files to get the DEC keyword from (must be fits files).
+
+        whichhdu : various, optional
+            The HDU being searched for, this can be an int for the HDU index,
+            a string for the HDU name, or ``None`` in which case the primary
+            HDU is used. The default is ``None``.
+
+        Returns
+        -------
+        numpy.ndarray
+            The values of DEC in decimal degrees, NaN where missing or
+            unparsable.
+    """
+    return dec_to_deg_array(_get_hdr_values(filenames, 'DEC', whichhdu))
+
+
+######################################################################
+def tdecdeg_array(filenames):
+    """ Get the FITS header value of 'TELDEC' in decimal degrees for many
+        files.
+
+        Parameters
+        ----------
+        filenames : sequence
+            The files to get the TELDEC keyword from (must be fits files).
+
+        Returns
+        -------
+        numpy.ndarray
+            The values of TELDEC in decimal degrees, NaN where missing or
+            unparsable.
+    """
+    return dec_to_deg_array(_get_hdr_values(filenames, 'TELDEC', None))
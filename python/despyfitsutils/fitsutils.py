@@ -5,12 +5,407 @@
 """ Miscellaneous generic support functions for fits files
 """
 
+import io
 import re
 import os
 import sys
+import json
+import mmap
+import hashlib
+import fcntl
+import time
+import shutil
+import tempfile
+import csv
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
 from astropy.io import fits
+try:
+    from astropy.io.fits.hdu.compressed.header import _bintable_header_to_image_header
+except ImportError:
+    # astropy < 6.1
+    _bintable_header_to_image_header = None
 
 import despymisc.miscutils as miscutils
+import despyfitsutils.profiling as profiling
+import despyfitsutils.bytesource as bytesource
+
+FITS_BLOCK_SIZE = 2880
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+WRITE_BUFFER_SIZE = 16 * 1024 * 1024
+
+# HDU of a catalog (primary, LDAC_IMHEAD, LDAC_OBJECTS) that combine_cats
+# computes each metadata value from, LDAC_IMHEAD if not listed
+CATALOG_METADATA_HDU = {'objects': 2}
+
+# Sidecar of a catalog built with combine_cats(append=True) listing the
+# inputs it contains, and the lock file serializing appenders
+APPEND_MANIFEST_SUFFIX = '.manifest.json'
+APPEND_LOCK_SUFFIX = '.lock'
+DIRECT_IO_ALIGNMENT = 4096
+
+# Bytes of pixel data read at a time, and largest pixel subsample kept,
+# by makeMEF when computing pixel statistics
+PIXSTATS_CHUNK_SIZE = 16 * 1024 * 1024
+PIXSTATS_SAMPLE_SIZE = 1000000
+
+# numpy dtype of the raw pixel data for each BITPIX
+BITPIX_DTYPES = {8: 'u1', 16: '>i2', 32: '>i4', 64: '>i8', -32: '>f4', -64: '>f8'}
+
+class _DirectFileIO(io.RawIOBase):
+    """ Write-only file doing O_DIRECT writes from an aligned buffer.
+
+        Writes are collected in a page aligned buffer and written in
+        multiples of DIRECT_IO_ALIGNMENT bytes, so :meth:`flush` keeps
+        any unaligned remainder buffered.  The unaligned tail of the file
+        is written by :meth:`finish` (or :meth:`close`) after turning
+        O_DIRECT off.  If the file system does not support O_DIRECT
+        ordinary writes are used.
+    """
+    mode = 'wb'
+
+    def __init__(self, name, buffer_size):
+        super().__init__()
+        self.name = name
+        size = max(DIRECT_IO_ALIGNMENT, buffer_size // DIRECT_IO_ALIGNMENT * DIRECT_IO_ALIGNMENT)
+        self._buf = mmap.mmap(-1, size)
+        self._nbuf = 0
+        self._pos = 0
+        self._fd = None
+        try:
+            self._fd = os.open(name, os.O_WRONLY | getattr(os, 'O_DIRECT', 0))
+        except OSError:
+            self._fd = os.open(name, os.O_WRONLY)
+
+    def writable(self):
+        return True
+
+    def fileno(self):
+        return self._fd
+
+    def tell(self):
+        return self._pos
+
+    def _set_direct(self, direct):
+        """ Turn O_DIRECT on or off for the open file. """
+        if not hasattr(os, 'O_DIRECT'):
+            return
+        flags = fcntl.fcntl(self._fd, fcntl.F_GETFL)
+        flags = flags | os.O_DIRECT if direct else flags & ~os.O_DIRECT
+        fcntl.fcntl(self._fd, fcntl.F_SETFL, flags)
+
+    def _write_buffer(self, nbytes):
+        """ Write the first nbytes of the buffer to the file. """
+        view = memoryview(self._buf)[:nbytes]
+        try:
+            while view:
+                try:
+                    nwritten = os.write(self._fd, view)
+                except OSError:
+                    # e.g. EINVAL when the file system does not do O_DIRECT
+                    self._set_direct(False)
+                    nwritten = os.write(self._fd, view)
+                view = view[nwritten:]
+        finally:
+            view.release()
+
+    def write(self, b):
+        data = memoryview(b).cast('B')
+        total = len(data)
+        while data:
+            nbytes = min(len(data), len(self._buf) - self._nbuf)
+            self._buf[self._nbuf:self._nbuf + nbytes] = data[:nbytes]
+            self._nbuf += nbytes
+            data = data[nbytes:]
+            if self._nbuf == len(self._buf):
+                self._write_buffer(self._nbuf)
+                self._nbuf = 0
+        self._pos += total
+        return total
+
+    def flush(self):
+        """ Write the aligned part of the buffered data with O_DIRECT,
+            keeping the remainder buffered.
+        """
+        if self._fd is None or self._nbuf < DIRECT_IO_ALIGNMENT:
+            return
+        aligned = self._nbuf // DIRECT_IO_ALIGNMENT * DIRECT_IO_ALIGNMENT
+        self._write_buffer(aligned)
+        self._buf.move(0, aligned, self._nbuf - aligned)
+        self._nbuf -= aligned
+
+    def finish(self):
+        """ Write all buffered data, the unaligned tail with O_DIRECT off.
+            Nothing can be written after this.
+        """
+        if self._fd is None:
+            return
+        self.flush()
+        if self._nbuf:
+            self._set_direct(False)
+            tail = self._buf[:self._nbuf]
+            while tail:
+                tail = tail[os.write(self._fd, tail):]
+            self._nbuf = 0
+
+    def close(self):
+        if self._fd is not None:
+            try:
+                self.finish()
+            finally:
+                os.close(self._fd)
+                self._fd = None
+                self._buf.close()
+        super().close()
+
+
+class AtomicWriter:
+    """ Context manager for writing a file so that readers only ever see
+        the complete file.
+
+        Data is written to a temporary file in the same directory with
+        large buffered writes, fsync'ed, then renamed over `filename`.  If
+        an exception is raised the temporary file is removed and any
+        existing `filename` is left untouched.
+
+        Parameters
+        ----------
+        filename : str
+            The file to write.
+
+        overwrite : bool, optional
+            Whether an existing `filename` may be replaced, default is
+            ``True``.
+
+        buffer_size : int, optional
+            Size in bytes of the write buffer, default is WRITE_BUFFER_SIZE.
+            0 gives an unbuffered file (e.g. for :func:`copy_byte_range`).
+
+        direct : bool, optional
+            Write with O_DIRECT from a page aligned buffer, bypassing the
+            page cache, where the OS and file system support it.  The
+            default is ``False``.
+
+        fsync : bool, optional
+            Whether to fsync the file and its directory, default is
+            ``True``.
+
+        Raises
+        ------
+        FileExistsError
+            If `overwrite` is ``False`` and `filename` exists.
+
+        Examples
+        --------
+        >>> with AtomicWriter('out.fits') as outfh:
+        ...     hdulist.writeto(outfh)
+    """
+
+    def __init__(self, filename, overwrite=True, buffer_size=WRITE_BUFFER_SIZE, direct=False, fsync=True):
+        self.filename = filename
+        self.overwrite = overwrite
+        self.buffer_size = buffer_size
+        self.direct = direct
+        self.fsync = fsync
+        self.tmpname = None
+        self.fileobj = None
+
+    def __enter__(self):
+        if not self.overwrite and os.path.exists(self.filename):
+            raise FileExistsError(f"{self.filename} already exists")
+        outdir = os.path.dirname(os.path.abspath(self.filename))
+        fd, self.tmpname = tempfile.mkstemp(dir=outdir, prefix=f".{os.path.basename(self.filename)}.",
+                                            suffix='.tmp')
+        # mkstemp makes the file private, give it the usual permissions
+        umask = os.umask(0)
+        os.umask(umask)
+        os.fchmod(fd, 0o666 & ~umask)
+        if self.direct:
+            os.close(fd)
+            self.fileobj = _DirectFileIO(self.tmpname, self.buffer_size or WRITE_BUFFER_SIZE)
+        elif self.buffer_size > 0:
+            self.fileobj = io.BufferedWriter(io.FileIO(fd, 'w'), self.buffer_size)
+        else:
+            self.fileobj = io.FileIO(fd, 'w')
+        return self.fileobj
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                if self.direct:
+                    self.fileobj.finish()
+                else:
+                    self.fileobj.flush()
+                if self.fsync:
+                    os.fsync(self.fileobj.fileno())
+            self.fileobj.close()
+            if exc_type is None:
+                if not self.overwrite and os.path.exists(self.filename):
+                    raise FileExistsError(f"{self.filename} already exists")
+                os.replace(self.tmpname, self.filename)
+                self.tmpname = None
+                if self.fsync:
+                    dirfd = os.open(os.path.dirname(os.path.abspath(self.filename)), os.O_RDONLY)
+                    try:
+                        os.fsync(dirfd)
+                    finally:
+                        os.close(dirfd)
+        finally:
+            if self.tmpname is not None and os.path.exists(self.tmpname):
+                os.remove(self.tmpname)
+        return False
+
+
+class PixelStats:
+    """ Accumulate statistics of the pixels of one image, a chunk at a
+        time.
+
+        Means, sums, extremes and fractions are exact.  The median and the
+        sigma clipped mean are computed from a regular subsample of at most
+        `sample_size` pixels so that memory use does not grow with the
+        image size.
+
+        Parameters
+        ----------
+        npix : int
+            The number of pixels in the image.
+
+        kind : str, optional
+            'IMAGE', 'WEIGHT' or 'MASK' (the DES_EXT values), which selects
+            the statistics computed.  The default is 'IMAGE'.
+
+        sample_size : int, optional
+            Largest number of pixels kept for the median and clipped mean,
+            default is PIXSTATS_SAMPLE_SIZE.
+    """
+
+    # keyword: comment, for each kind of image
+    KEYWORDS = {'IMAGE': {'PIXMEAN': 'Mean of finite pixel values',
+                          'PIXMIN': 'Minimum pixel value',
+                          'PIXMAX': 'Maximum pixel value',
+                          'PIXMED': 'Median pixel value (subsampled)',
+                          'PIXCMEAN': '3-sigma clipped mean (subsampled)',
+                          'PIXCSTD': '3-sigma clipped std deviation (subsampled)',
+                          'PIXFBAD': 'Fraction of non-finite pixels'},
+                'WEIGHT': {'WGTSUM': 'Sum of weights',
+                           'WGTMED': 'Median weight (subsampled)',
+                           'WGTFZERO': 'Fraction of pixels with zero weight'},
+                'MASK': {'MSKFRAC': 'Fraction of masked (non-zero) pixels'}}
+    CLIP_SIGMA = 3.0
+    CLIP_ITER = 5
+
+    def __init__(self, npix, kind='IMAGE', sample_size=PIXSTATS_SAMPLE_SIZE):
+        self.kind = kind if kind in self.KEYWORDS else 'IMAGE'
+        self.npix = npix
+        self.stride = max(1, -(-npix // sample_size))
+        self.nseen = 0
+        self.nfinite = 0
+        self.nzero = 0
+        self.total = 0.0
+        self.vmin = np.inf
+        self.vmax = -np.inf
+        self._samples = []
+
+    def keywords(self):
+        """ Return the keywords (and comments) this accumulator computes.
+        """
+        return self.KEYWORDS[self.kind]
+
+    def update(self, values):
+        """ Add the next chunk of pixel values (any shape, in file order).
+        """
+        values = values.ravel()
+        start = (-self.nseen) % self.stride
+        self.nseen += values.size
+        if self.kind == 'MASK':
+            self.nzero += values.size - np.count_nonzero(values)
+            return
+
+        finite = values[np.isfinite(values)] if values.dtype.kind == 'f' else values
+        self.nfinite += finite.size
+        if finite.size:
+            self.total += float(finite.sum(dtype=np.float64))
+            self.vmin = min(self.vmin, float(finite.min()))
+            self.vmax = max(self.vmax, float(finite.max()))
+            if self.kind == 'WEIGHT':
+                self.nzero += finite.size - np.count_nonzero(finite)
+        sample = values[start::self.stride]
+        if sample.dtype.kind == 'f':
+            sample = sample[np.isfinite(sample)]
+        self._samples.append(sample.astype(np.float64))
+
+    def _clipped(self, sample):
+        """ Return the sigma clipped mean and standard deviation.
+        """
+        for _ in range(self.CLIP_ITER):
+            center = np.median(sample)
+            keep = np.abs(sample - center) <= self.CLIP_SIGMA * sample.std()
+            if keep.all():
+                break
+            sample = sample[keep]
+        return float(sample.mean()), float(sample.std())
+
+    def result(self):
+        """ Return a dict of keyword to value, ``None`` for values that
+            cannot be computed (e.g. no finite pixels).
+        """
+        if self.kind == 'MASK':
+            return {'MSKFRAC': float(self.nseen - self.nzero) / self.nseen if self.nseen else None}
+
+        sample = np.concatenate(self._samples) if self._samples else np.empty(0)
+        median = float(np.median(sample)) if sample.size else None
+        if self.kind == 'WEIGHT':
+            return {'WGTSUM': self.total,
+                    'WGTMED': median,
+                    'WGTFZERO': float(self.nzero + self.nseen - self.nfinite) / self.nseen if self.nseen else None}
+
+        vals = dict.fromkeys(self.KEYWORDS['IMAGE'])
+        vals['PIXFBAD'] = float(self.nseen - self.nfinite) / self.nseen if self.nseen else None
+        if self.nfinite:
+            vals['PIXMEAN'] = self.total / self.nfinite
+            vals['PIXMIN'] = self.vmin
+            vals['PIXMAX'] = self.vmax
+        if sample.size:
+            vals['PIXMED'] = median
+            vals['PIXCMEAN'], vals['PIXCSTD'] = self._clipped(sample)
+        return vals
+
+
+def _iter_pixel_chunks(hdulist, hdr):
+    """ Yield (raw bytes, pixel values) of the primary HDU data of an open
+        file in chunks of whole rows of about PIXSTATS_CHUNK_SIZE bytes.
+
+        The bytes are read from the file as they are stored (so they can
+        be written out unchanged); the values have BSCALE/BZERO applied and
+        BLANK pixels set to NaN.
+    """
+    info = hdulist.fileinfo(0)
+    infile = info['file']
+    dtype = np.dtype(BITPIX_DTYPES[hdr['BITPIX']])
+    bscale = hdr.get('BSCALE', 1)
+    bzero = hdr.get('BZERO', 0)
+    blank = hdr.get('BLANK') if dtype.kind in 'iu' else None
+
+    rowbytes = hdr.get('NAXIS1', 1) * dtype.itemsize
+    chunk = max(1, PIXSTATS_CHUNK_SIZE // rowbytes) * rowbytes
+    offset = info['datLoc']
+    remaining = get_data_size(hdr)
+    while remaining > 0:
+        infile.seek(offset)
+        buf = infile.read(min(chunk, remaining))
+        if not buf:
+            raise OSError(f"Unexpected end of file reading data of {infile.name}")
+        raw = np.frombuffer(buf, dtype=dtype)
+        values = raw
+        if bscale != 1 or bzero != 0 or blank is not None:
+            values = raw * np.float64(bscale) + bzero
+            if blank is not None:
+                values[raw == blank] = np.nan
+        yield buf, values
+        offset += len(buf)
+        remaining -= len(buf)
+
 
 class makeMEF:  # pragma: no cover
     """
@@ -33,6 +428,9 @@ class makeMEF:  # pragma: no cover
         self.clobber = kwargs.pop('clobber', False)
         self.extnames = kwargs.pop('extnames', None)
         self.verb = kwargs.pop('verb', False)
+        self.stats = kwargs.pop('stats', False)
+        self.stats_file = kwargs.pop('stats_file', None)
+        self.pixel_stats = None
 
         # Make sure that filenames and outname are defined
         if not self.filenames:
@@ -55,10 +453,15 @@ class makeMEF:  # pragma: no cover
 
     def addEXTNAME(self):
         """Add a user-provided list of extension names to the MEF
+
+        Raises
+        ------
+        ValueError
+            If the number of extension names doesn't match the number of
+            files.
         """
         if len(self.extnames) != len(self.filenames):
-            sys.exit("ERROR: number of extension names doesn't match filenames")
-            return
+            raise ValueError("ERROR: number of extension names doesn't match filenames")
 
         k = 0
         for extname, hdu in zip(self.extnames, self.HDU):
@@ -84,23 +487,690 @@ class makeMEF:  # pragma: no cover
         for fname in self.filenames:
             if self.verb:
                 print(f"# Reading {fname} --> HDU {k}")
-            self.HDU.append(fits.open(fname))
+            with profiling.phase('open'):
+                self.HDU.append(fits.open(fname))
             k = k + 1
 
     def write(self):
         """ Write MEF file with no Primary HDU
         """
+        if self.stats or self.stats_file:
+            self.write_with_stats()
+            return
+
         newhdu = fits.HDUList()
 
         for hdu in self.HDU:
             newhdu.append(hdu[0])# ,hdu[0].header)
         if self.verb:
             print(f"# Writing to: {self.outname}")
-        newhdu.writeto(self.outname, overwrite=self.clobber)
+        with profiling.phase('write'), AtomicWriter(self.outname, overwrite=self.clobber) as outfh:
+            newhdu.writeto(outfh)
+
+    def get_kind(self, hdr):
+        """ Return the DES_EXT (IMAGE, WEIGHT or MASK) of a header, from
+            DES_EXT or EXTNAME.
+        """
+        if 'DES_EXT' in hdr:
+            return str(hdr['DES_EXT']).strip().upper()
+        return makeMEF.DES_EXT.get(str(hdr.get('EXTNAME', '')).strip().upper(), 'IMAGE')
+
+    def write_with_stats(self):
+        """ Write MEF file with no Primary HDU, computing PixelStats of
+            each extension while its data is copied.
+
+            The headers are the ones astropy would write.  With `stats` the
+            statistic keywords are written with placeholder values and
+            filled in once the data of the extension has been written.
+            With `stats_file` the statistics are also written as a table.
+        """
+        self.pixel_stats = []
+        if self.verb:
+            print(f"# Writing to: {self.outname} with pixel statistics")
+        with profiling.phase('write'), AtomicWriter(self.outname, overwrite=self.clobber) as outfh:
+            for k, hdu in enumerate(self.HDU):
+                if k == 0:
+                    hdr = hdu[0].header.copy()
+                    if len(self.HDU) > 1 and 'EXTEND' not in hdr:
+                        naxis = hdr['NAXIS']
+                        hdr.set('EXTEND', True, after=f'NAXIS{naxis:d}' if naxis > 0 else 'NAXIS')
+                else:
+                    hdr = primary_to_ext_header(hdu[0].header)
+
+                npix = get_data_size(hdr) // (abs(hdr['BITPIX']) // 8)
+                pstats = PixelStats(npix, self.get_kind(hdr)) if npix else None
+                if pstats is not None and self.stats:
+                    for key, comment in pstats.keywords().items():
+                        hdr[key] = (0.0, comment)
+
+                hdr_offset = outfh.tell()
+                hdrbytes = hdr.tostring().encode('ascii')
+                outfh.write(hdrbytes)
+                nbytes = 0
+                if pstats is not None:
+                    for buf, values in _iter_pixel_chunks(hdu, hdr):
+                        outfh.write(buf)
+                        pstats.update(values)
+                        nbytes += len(buf)
+                    outfh.write(b'\0' * (-nbytes % FITS_BLOCK_SIZE))
+
+                values = pstats.result() if pstats is not None else {}
+                self.pixel_stats.append(values)
+                if values and self.stats:
+                    for key, val in values.items():
+                        hdr[key] = val
+                    newbytes = hdr.tostring().encode('ascii')
+                    if len(newbytes) != len(hdrbytes):
+                        raise ValueError(f"Header of HDU {k} changed size when adding statistics")
+                    end = outfh.tell()
+                    outfh.seek(hdr_offset)
+                    outfh.write(newbytes)
+                    outfh.seek(end)
+
+        if self.stats_file:
+            self.write_stats_file()
+
+    def write_stats_file(self):
+        """ Write the statistics of each extension as a table, see
+            header_table.write_header_table for the formats.
+        """
+        # imported here as header_table imports this module
+        import despyfitsutils.header_table as header_table
+
+        keys = ['EXTNAME']
+        for vals in self.pixel_stats:
+            keys.extend(key for key in vals if key not in keys)
+        rows = []
+        for hdu, vals in zip(self.HDU, self.pixel_stats):
+            extname = hdu[0].header.get('EXTNAME')
+            rows.append([extname] + [vals.get(key) for key in keys[1:]])
+        table = header_table.build_header_table(self.filenames, keys, rows,
+                                                [str(k) for k in range(len(rows))])
+        table.meta['OUTNAME'] = os.path.basename(self.outname)
+        header_table.write_header_table(table, self.stats_file, overwrite=True)
+
+
+#######################################################################
+def read_mef_manifest(filename):
+    """ Read the list of MEFs to build from a manifest file.
+
+        A .json manifest is a list of objects with 'outname', 'filenames'
+        and optionally 'extnames'.  Any other manifest is read as CSV with
+        the columns outname, filename and optionally extname and one row
+        per input file; all rows with the same outname make one MEF, in
+        the order the rows are given.
+
+        Parameters
+        ----------
+        filename : str
+            The manifest file.
+
+        Returns
+        -------
+        list
+            One dict per MEF with keys 'outname', 'filenames' and
+            'extnames' (``None`` when not given), suitable as keyword
+            arguments for :class:`makeMEF`.
+
+        Raises
+        ------
+        ValueError
+            If a required column or entry is missing, or a JSON manifest
+            has the same outname twice.
+    """
+    jobs = {}
+    if filename.lower().endswith('.json'):
+        with open(filename, 'r') as manfh:
+            entries = json.load(manfh)
+        for entry in entries:
+            if 'outname' not in entry or not entry.get('filenames'):
+                raise ValueError(f"Manifest entry {entry} needs outname and filenames")
+            if entry['outname'] in jobs:
+                raise ValueError(f"Manifest {filename} has more than one entry for {entry['outname']}")
+            jobs[entry['outname']] = {'outname': entry['outname'], 'filenames': list(entry['filenames']),
+                                      'extnames': entry.get('extnames')}
+        return list(jobs.values())
+
+    with open(filename, 'r', newline='') as manfh:
+        reader = csv.DictReader(manfh)
+        if reader.fieldnames is None or not {'outname', 'filename'} <= set(reader.fieldnames):
+            raise ValueError(f"Manifest {filename} needs outname and filename columns")
+        for row in reader:
+            # rows of one MEF need not be next to each other, two jobs
+            # writing the same output would race
+            job = jobs.setdefault(row['outname'], {'outname': row['outname'], 'filenames': [],
+                                                   'extnames': []})
+            job['filenames'].append(row['filename'])
+            job['extnames'].append(row.get('extname') or None)
+    for job in jobs.values():
+        if not any(job['extnames']):
+            job['extnames'] = None
+    return list(jobs.values())
+
+
+def _make_mef_job(job, clobber, stats=False):
+    """ Build one MEF in a worker process and report how it went.
+    """
+    result = {'outname': job['outname'], 'status': 'ok', 'error': None, 'seconds': 0.0}
+    start = time.time()
+    if os.path.isfile(job['outname']) and not clobber:
+        result['status'] = 'skipped'
+        result['error'] = 'output exists'
+        return result
+    try:
+        makeMEF(filenames=job['filenames'], outname=job['outname'],
+                extnames=job.get('extnames'), clobber=clobber, stats=stats)
+    except Exception as err:
+        result['status'] = 'failed'
+        result['error'] = f"{type(err).__name__}: {err}"
+    result['seconds'] = time.time() - start
+    return result
+
+
+def _failed_mef_result(job, err):
+    """ Return the result of a build that did not run or whose worker died.
+    """
+    return {'outname': job['outname'], 'status': 'failed',
+            'error': f"{type(err).__name__}: {err}", 'seconds': 0.0}
+
+
+def make_mef_batch(jobs, nproc=4, mem_limit=None, clobber=False, callback=None, stats=False):
+    """ Build many MEFs in parallel.
+
+        Builds are run in a pool of `nproc` processes.  A build is only
+        started while the total size of the inputs of the running builds,
+        including its own, fits in `mem_limit` (one build is always
+        allowed to run).  A failed build is reported and does not stop the
+        others.  If a worker process dies, the builds that were not
+        started yet are reported as failed too.
+
+        Parameters
+        ----------
+        jobs : list
+            As returned by :func:`read_mef_manifest`.
+
+        nproc : int, optional
+            Maximum number of concurrent builds, default is 4.
+
+        mem_limit : int, optional
+            Memory in bytes available to the builds.  The default is
+            ``None``, meaning half of the physical memory.
+
+        clobber : bool, optional
+            Whether to overwrite existing outputs, default is ``False``
+            (existing outputs are skipped).
+
+        callback : function, optional
+            Called with each result dict as its build finishes.  The
+            default is ``None``.
+
+        stats : bool, optional
+            Add pixel statistics keywords to each extension, see
+            :class:`makeMEF`.  The default is ``False``.
+
+        Returns
+        -------
+        list
+            One dict per job, in the order of `jobs`, with keys 'outname',
+            'status' ('ok', 'skipped' or 'failed'), 'error', 'seconds' and
+            'nbytes' (total input size).
+    """
+    if mem_limit is None:
+        mem_limit = os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // 2
+
+    sizes = []
+    for job in jobs:
+        try:
+            sizes.append(sum(os.path.getsize(fname) for fname in job['filenames']))
+        except OSError:
+            # let the build itself report the missing file
+            sizes.append(0)
+
+    results = [None] * len(jobs)
+    pending = list(range(len(jobs)))
+    running = {}
+    inflight = 0
+    broken = None
+    with ProcessPoolExecutor(max_workers=max(1, nproc)) as executor:
+        while running or (pending and broken is None):
+            while broken is None and pending and len(running) < nproc and \
+                  (not running or inflight + sizes[pending[0]] <= mem_limit):
+                k = pending[0]
+                try:
+                    running[executor.submit(_make_mef_job, jobs[k], clobber, stats)] = k
+                except BrokenProcessPool as err:
+                    # a worker died, no more builds can be started
+                    broken = err
+                    break
+                pending.pop(0)
+                inflight += sizes[k]
+            if not running:
+                break
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                k = running.pop(future)
+                inflight -= sizes[k]
+                try:
+                    result = future.result()
+                except BrokenProcessPool as err:
+                    broken = err
+                    result = _failed_mef_result(jobs[k], err)
+                except Exception as err:
+                    result = _failed_mef_result(jobs[k], err)
+                result['nbytes'] = sizes[k]
+                results[k] = result
+                if callback is not None:
+                    callback(result)
+
+    for k in pending:
+        result = _failed_mef_result(jobs[k], broken)
+        result['nbytes'] = sizes[k]
+        results[k] = result
+        if callback is not None:
+            callback(result)
+    return results
 
 
 #######################################################################
-def combine_cats(incats, outcat):
+def _select_extension(hdr, extnames):
+    """ Return the name a MEF extension is written under by split_mef, or
+        ``None`` if it is not selected.
+    """
+    extname = str(hdr.get('EXTNAME', '')).strip().upper()
+    des_ext = str(hdr.get('DES_EXT', '')).strip().upper()
+    if extnames is None:
+        return extname or None
+    for name in extnames:
+        uname = name.upper()
+        if uname in (extname, des_ext) or makeMEF.DES_EXT.get(uname) == des_ext:
+            return extname or uname
+    return None
+
+
+def split_mef(filename, extnames=None, outpattern=None, clobber=False):
+    """ Write extensions of a MEF file as flat (single HDU) FITS files, the
+        inverse of :class:`makeMEF`.
+
+        Only the headers of `filename` are read.  Each selected extension
+        header is rewritten as a primary header and its data is copied as
+        bytes, so the pixels are never decoded.
+
+        Parameters
+        ----------
+        filename : str
+            The MEF file.
+
+        extnames : list, optional
+            The extensions to write, matched against EXTNAME or DES_EXT
+            (e.g. ``['SCI', 'WGT']`` or ``['IMAGE']``).  The default is
+            ``None``, meaning every HDU with an EXTNAME and data.
+
+        outpattern : str, optional
+            Output file name, formatted with `base` (`filename` without
+            directory and .fits/.fits.fz extension), `dir` (directory of
+            `filename`), `extname` (lower case) and `hdu` (HDU number).
+            The default is ``'{dir}/{base}_{extname}.fits'``.
+
+        clobber : bool, optional
+            Whether to overwrite existing outputs, default is ``False``.
+
+        Returns
+        -------
+        list
+            The files written.
+
+        Raises
+        ------
+        ValueError
+            If a selected extension is tile compressed (ZIMAGE) or not an
+            image, if two extensions would be written to the same file
+            (e.g. they have the same EXTNAME), or if nothing matches
+            `extnames`.
+        FileExistsError
+            If an output exists and `clobber` is ``False``.
+
+        Both errors are raised before any file is written.
+    """
+    if outpattern is None:
+        outpattern = '{dir}/{base}_{extname}.fits'
+    dirname = os.path.dirname(filename) or '.'
+    base = re.sub(r'\.fits?(\.fz)?$', '', os.path.basename(filename))
+
+    with profiling.phase('read'):
+        toc = get_hdu_toc(filename)
+
+    selected = []
+    for k, entry in enumerate(toc):
+        hdr = entry['header']
+        name = _select_extension(hdr, extnames)
+        if name is None or (extnames is None and get_data_size(hdr) == 0):
+            continue
+        if hdr.get('ZIMAGE', False):
+            raise ValueError(f"{filename}[{k:d}] is tile compressed, it cannot be split without decompressing it")
+        if hdr.get('XTENSION', 'IMAGE').strip() != 'IMAGE':
+            raise ValueError(f"{filename}[{k:d}] is a {hdr['XTENSION'].strip()} extension, not an image")
+        outname = outpattern.format(dir=dirname, base=base, extname=name.lower(), hdu=k)
+        selected.append((k, entry, outname))
+    if not selected:
+        raise ValueError(f"No extensions of {filename} match {extnames}")
+    seen = {}
+    for k, _, outname in selected:
+        if outname in seen:
+            raise ValueError(f"{filename} HDUs {seen[outname]:d} and {k:d} would both be written to {outname}")
+        seen[outname] = k
+        if not clobber and os.path.exists(outname):
+            raise FileExistsError(f"{outname} already exists")
+
+    outnames = []
+    with profiling.phase('write'), open(filename, 'rb', buffering=0) as infh:
+        for _, entry, outname in selected:
+            if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
+                miscutils.fwdebug_print(f"Writing {filename}[{entry['header'].get('EXTNAME')}] --> {outname}")
+            with AtomicWriter(outname, overwrite=clobber, buffer_size=0) as outfh:
+                outfh.write(ext_to_primary_header(entry['header']).tostring().encode('ascii'))
+                copy_byte_range(infh, outfh, entry['datLoc'], entry['datSpan'])
+            outnames.append(outname)
+    return outnames
+
+
+def _split_mef_job(filename, extnames, outpattern, clobber):
+    """ Split one MEF in a worker process and report how it went.
+    """
+    result = {'filename': filename, 'status': 'ok', 'error': None, 'outputs': [], 'seconds': 0.0}
+    start = time.time()
+    try:
+        result['outputs'] = split_mef(filename, extnames, outpattern, clobber)
+    except Exception as err:
+        result['status'] = 'failed'
+        result['error'] = f"{type(err).__name__}: {err}"
+    result['seconds'] = time.time() - start
+    return result
+
+
+def split_mef_batch(filenames, extnames=None, outpattern=None, nproc=4, clobber=False, callback=None):
+    """ Run :func:`split_mef` on many MEF files in a pool of processes.  A
+        failed file is reported and does not stop the others.
+
+        Parameters
+        ----------
+        filenames : list
+            The MEF files to split.
+
+        nproc : int, optional
+            Number of files split at once, default is 4.
+
+        callback : function, optional
+            Called with each result dict as its file finishes.  The
+            default is ``None``.
+
+        The other parameters are as for :func:`split_mef`.
+
+        Returns
+        -------
+        list
+            One dict per file, in the order of `filenames`, with keys
+            'filename', 'status' ('ok' or 'failed'), 'error', 'outputs'
+            and 'seconds'.
+    """
+    results = [None] * len(filenames)
+    with ProcessPoolExecutor(max_workers=max(1, nproc)) as executor:
+        futures = {executor.submit(_split_mef_job, fname, extnames, outpattern, clobber): k
+                   for k, fname in enumerate(filenames)}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                k = futures[future]
+                try:
+                    result = future.result()
+                except Exception as err:
+                    # e.g. the worker process died
+                    result = {'filename': filenames[k], 'status': 'failed', 'outputs': [],
+                              'error': f"{type(err).__name__}: {err}", 'seconds': 0.0}
+                results[k] = result
+                if callback is not None:
+                    callback(result)
+    return results
+
+
+#######################################################################
+def _check_combine_input(incat):
+    """ Read the headers of one combine_cats input and return its table of
+        contents and a list of problems found with the file on its own.
+    """
+    problems = []
+    try:
+        toc = get_hdu_toc(incat)
+        filesize = os.path.getsize(incat)
+    except (OSError, ValueError) as err:
+        return None, [f"{incat}: cannot read headers ({err})"]
+
+    if len(toc) != 3:
+        problems.append(f"{incat}: has {len(toc):d} HDUs, expected 3")
+    for i, entry in enumerate(toc):
+        size = get_data_size(entry['header'])
+        if entry['datLoc'] + size > filesize:
+            problems.append(f"{incat}[{i:d}]: file is truncated, header describes {size:d} data bytes "
+                            f"but only {max(filesize - entry['datLoc'], 0):d} are present")
+    return toc, problems
+
+
+def _get_hdu_schema(hdr):
+    """ Return the EXTNAME and column schema of an HDU header.
+
+        Only the column names of LDAC_IMHEAD are compared, the width of its
+        'Field Header Card' column depends on the number of cards in the
+        image header.
+    """
+    ncols = hdr.get('TFIELDS', 0)
+    if hdr.get('EXTNAME') == 'LDAC_IMHEAD':
+        cols = tuple((hdr.get(f'TTYPE{i:d}'),) for i in range(1, ncols + 1))
+    else:
+        cols = tuple((hdr.get(f'TTYPE{i:d}'), hdr.get(f'TFORM{i:d}'), hdr.get(f'TDIM{i:d}'))
+                     for i in range(1, ncols + 1))
+    return hdr.get('EXTNAME'), cols
+
+
+def check_combine_inputs(incat_lst, outcat=None, nthreads=4):
+    """ Check that the inputs of :func:`combine_cats` can be combined,
+        reading only their headers.
+
+        Each input must have 3 HDUs whose EXTNAMEs and table columns
+        (TTYPE/TFORM/TDIM, only TTYPE for LDAC_IMHEAD) match those of the
+        first input, and must be
+        large enough to hold the data described by its headers
+        (NAXIS1 x NAXIS2 for tables).  All problems are collected before
+        failing.
+
+        Parameters
+        ----------
+        incat_lst : list
+            The FITS files to combine.
+
+        outcat : str, optional
+            The catalog that will be written.  If given, the free space on
+            its file system is checked against the output size.  The
+            default is ``None``.
+
+        nthreads : int, optional
+            Number of inputs to read concurrently, default is 4.
+
+        Returns
+        -------
+        int
+            The size in bytes of the combined output file.
+
+        Raises
+        ------
+        ValueError
+            If any problem is found, the message lists all of them.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, nthreads)) as executor:
+        results = list(executor.map(_check_combine_input, incat_lst))
+
+    problems = []
+    ref_schema = None
+    outsize = 0
+    for k, (incat, (toc, file_problems)) in enumerate(zip(incat_lst, results)):
+        problems.extend(file_problems)
+        if toc is None:
+            continue
+
+        schema = [_get_hdu_schema(entry['header']) for entry in toc]
+        if ref_schema is None:
+            ref_schema = schema
+            ref_cat = incat
+        elif len(schema) == len(ref_schema):
+            for i, ((extname, cols), (ref_extname, ref_cols)) in enumerate(zip(schema, ref_schema)):
+                if extname != ref_extname:
+                    problems.append(f"{incat}[{i:d}]: EXTNAME {extname} does not match {ref_extname} in {ref_cat}")
+                if cols != ref_cols:
+                    problems.append(f"{incat}[{i:d}]: columns do not match those in {ref_cat}")
+
+        for i, entry in enumerate(toc):
+            hdr = entry['header']
+            if i == 0 and k > 0:
+                hdr = primary_to_ext_header(hdr)
+            outsize += len(hdr.tostring()) + entry['datSpan']
+
+    if outcat is not None and not problems:
+        outdir = os.path.dirname(os.path.abspath(outcat))
+        free = shutil.disk_usage(outdir).free
+        if os.path.exists(outcat):
+            free += os.path.getsize(outcat)
+        if free < outsize:
+            problems.append(f"{outcat}: output needs {outsize:d} bytes but only {free:d} are free in {outdir}")
+
+    if problems:
+        raise ValueError("Cannot combine catalogs:\n    " + "\n    ".join(problems))
+
+    if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
+        miscutils.fwdebug_print(f"Checked {len(incat_lst):d} input catalogs, output size will be {outsize:d} bytes")
+    return outsize
+
+
+#######################################################################
+def select_catalog(hdu, columns=None, rows=None, row_filter=None):
+    """ Make a new binary table HDU with a subset of the columns and rows
+        of `hdu`.
+
+        When `hdu` comes from a memory mapped file only the pages holding
+        the selected fields of the selected rows are read.
+
+        Parameters
+        ----------
+        hdu : astropy.io.fits.BinTableHDU
+            The table to select from, it is not modified.
+
+        columns : list, optional
+            Names of the columns to keep, in the order wanted (names are
+            not case sensitive).  The default is ``None`` (all columns).
+
+        rows : slice or array, optional
+            The rows to keep, as a slice, index array or boolean mask.
+            The default is ``None`` (all rows).
+
+        row_filter : function, optional
+            Called with the table data (after `rows` is applied) and must
+            return a boolean mask or index array of the rows to keep.  The
+            default is ``None``.
+
+        Returns
+        -------
+        astropy.io.fits.BinTableHDU
+            The new table, with all non-structural header keywords of
+            `hdu`.
+
+        Raises
+        ------
+        ValueError
+            If a requested column does not exist.
+    """
+    data = hdu.data
+    if rows is not None:
+        data = data[rows]
+    if row_filter is not None:
+        data = data[row_filter(data)]
+
+    if columns is None:
+        columns = hdu.columns.names
+
+    newcols = []
+    for name in columns:
+        try:
+            col = hdu.columns[name]
+        except KeyError:
+            raise ValueError(f"Column {name} not found in table {hdu.name}") from None
+        newcols.append(fits.Column(name=col.name, format=col.format, unit=col.unit, null=col.null,
+                                   bscale=col.bscale, bzero=col.bzero, disp=col.disp, dim=col.dim,
+                                   array=data[col.name]))
+    return fits.BinTableHDU.from_columns(newcols, header=hdu.header, nrows=len(data))
+
+
+#######################################################################
+def read_catalog(filename, columns=None, rows=None, row_filter=None, ext='LDAC_OBJECTS'):
+    """ Read selected columns and rows of a catalog table.
+
+        The file is memory mapped so that only the selected fields of the
+        selected rows are read from disk.
+
+        Parameters
+        ----------
+        filename : str
+            The catalog FITS file.
+
+        columns : list, optional
+            Names of the columns to read.  The default is ``None`` (all
+            columns).
+
+        rows : slice or array, optional
+            The rows to read, see :func:`select_catalog`.  The default is
+            ``None`` (all rows).
+
+        row_filter : function, optional
+            Function selecting rows from the table data, see
+            :func:`select_catalog`.  The default is ``None``.
+
+        ext : int or str, optional
+            The table HDU to read, default is 'LDAC_OBJECTS'.
+
+        Returns
+        -------
+        astropy.io.fits.BinTableHDU
+            The selected table, detached from the file.
+    """
+    with fits.open(filename, mode='readonly', memmap=True) as hdulist:
+        newhdu = select_catalog(hdulist[ext], columns, rows, row_filter)
+    return newhdu
+
+
+#######################################################################
+def _get_catalog_metadata(incat, catalog, keys):
+    """ Compute special metadata values for one catalog given as a list of
+        its 3 HDUs, ``None`` for values that cannot be computed.
+    """
+    # imported here as fits_special_metadata imports this module
+    import despyfitsutils.fits_special_metadata as fsm
+
+    row = []
+    for key in keys:
+        name = key.lower()
+        if name.startswith('func_'):
+            name = name[5:]
+        try:
+            val = fsm.call_special_func(name, incat, catalog,
+                                        CATALOG_METADATA_HDU.get(name, 'LDAC_IMHEAD'))
+        except (KeyError, IndexError, ValueError) as err:
+            if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
+                miscutils.fwdebug_print(f"No {name} for {incat}: {err}")
+            val = None
+        row.append(val)
+    return row
+
+
+#######################################################################
+def combine_cats(incats, outcat, validate=True, columns=None, row_filter=None,
+                 metadata=None, metadata_out=None, append=False):
     """ Combine all input catalogs (each with 3 hdus) into a single FITS file.
 
         Parameters
@@ -110,43 +1180,437 @@ def combine_cats(incats, outcat):
 
         outcat : str
             The name of the catalog FITS file to create.
+
+        validate : bool, optional
+            Whether to check the headers of all inputs with
+            :func:`check_combine_inputs` before reading any data, default
+            is ``True``.
+
+        columns : list, optional
+            Names of the columns of the object table (the third hdu of each
+            catalog) to keep.  The default is ``None`` (all columns).
+
+        row_filter : function, optional
+            Function selecting the rows of each object table to keep, see
+            :func:`select_catalog`.  The default is ``None`` (all rows).
+
+        metadata : list, optional
+            Special metadata values to compute for each input while it is
+            read, e.g. ``['band', 'nite', 'field', 'objects']``.  'objects'
+            is the number of rows written for the catalog, the others are
+            computed from LDAC_IMHEAD (see CATALOG_METADATA_HDU).  The
+            default is ``None``.
+
+        metadata_out : str, optional
+            File to write the metadata table to (.json, .fits, .csv or
+            .parquet, see :func:`header_table.write_header_table`).  The
+            table has one row per input plus the totals NCATS and, if
+            computed, OBJECTS.  The default is ``None``.
+
+        append : bool, optional
+            Add the inputs to the end of an existing `outcat` (or create
+            it) instead of rebuilding it, see :func:`append_cats`.  Inputs
+            already in `outcat` are skipped and the metadata only covers
+            the catalogs appended.  The default is ``False``.
+
+        Returns
+        -------
+        astropy.table.Table or None
+            The metadata table if `metadata` was given.
+
+        Raises
+        ------
+        ValueError
+            If `validate` is ``True`` and the inputs cannot be combined.
     """
     # if incats is comma-separated list, split into python list
     comma_re = re.compile(r"\s*,\s*")
     incat_lst = comma_re.split(incats)
 
+    if append:
+        if columns is not None or row_filter is not None:
+            raise ValueError("Appending catalogs copies them unchanged, columns and row_filter cannot be used")
+        appended, meta_rows = append_cats(incat_lst, outcat, validate, metadata)
+        incat_lst = appended
+        if not metadata:
+            return None
+        return _make_catalog_metadata_table(incat_lst, metadata, meta_rows, metadata_out)
+
+    if validate:
+        with profiling.phase('check'):
+            check_combine_inputs(incat_lst, outcat)
+
     if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
         miscutils.fwdebug_print("Constructing hdulist object for single fits file")
     # Construct hdulist object to append hdus from individual catalogs to
     hdulist = fits.HDUList()
 
     # Now append the hdus from each input catalog file to the hdulist
+    meta_rows = []
     for incat in incat_lst:
         if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
             miscutils.fwdebug_print(f"Appending 3 HDUs from cat --> {incat}")
-        hdulist1 = fits.open(incat, mode='readonly')
-        hdulist.append(hdulist1[0])
-        hdulist.append(hdulist1[1])
-        hdulist.append(hdulist1[2])
+        with profiling.phase('open'):
+            hdulist1 = fits.open(incat, mode='readonly', memmap=True)
+        with profiling.phase('read'):
+            hdulist.append(hdulist1[0])
+            hdulist.append(hdulist1[1])
+            if columns is None and row_filter is None:
+                hdulist.append(hdulist1[2])
+            else:
+                hdulist.append(select_catalog(hdulist1[2], columns, row_filter=row_filter))
+        if metadata:
+            with profiling.phase('metadata'):
+                meta_rows.append(_get_catalog_metadata(incat, HeaderList(hdulist[-3:]), metadata))
         #hdulist1.close()
 
-    # And write the full hdulist to the output file
+    # And write the full hdulist to the output file, a pre-existing version
+    # is only replaced once the new one is complete
     if os.path.exists(outcat):
-        os.remove(outcat)
-        miscutils.fwdebug_print(f"Removing pre-existing version of fullcat {outcat}")
+        miscutils.fwdebug_print(f"Replacing pre-existing version of fullcat {outcat}")
 
     if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
         miscutils.fwdebug_print(f"Writing results to fullcat --> {outcat}")
-    hdulist.writeto(outcat)
+    with profiling.phase('write'), AtomicWriter(outcat) as outfh:
+        hdulist.writeto(outfh)
+
+    # outcat no longer holds the catalogs listed by an earlier append
+    try:
+        os.unlink(outcat + APPEND_MANIFEST_SUFFIX)
+    except FileNotFoundError:
+        pass
 
     if miscutils.fwdebug_check(6, 'FITSUTILS_DEBUG'):
         miscutils.fwdebug_print(f"Using fits_close to close fullcat --> {outcat}")
     hdulist.close()
 
+    if not metadata:
+        return None
+    return _make_catalog_metadata_table(incat_lst, metadata, meta_rows, metadata_out)
+
+
+def _make_catalog_metadata_table(incat_lst, metadata, meta_rows, metadata_out):
+    """ Make (and write) the combine_cats metadata table.
+    """
+    # imported here as header_table imports this module
+    import despyfitsutils.header_table as header_table
+
+    table = header_table.build_header_table(incat_lst, metadata, meta_rows)
+    table.meta['NCATS'] = len(incat_lst)
+    if 'OBJECTS' in table.colnames:
+        table.meta['OBJECTS'] = int(table['OBJECTS'].sum()) if len(table) else 0
+    if metadata_out is not None:
+        if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
+            miscutils.fwdebug_print(f"Writing catalog metadata to --> {metadata_out}")
+        header_table.write_header_table(table, metadata_out, overwrite=True)
+    return table
+
+
+#######################################################################
+def read_append_manifest(outcat):
+    """ Return the manifest of a catalog built by :func:`append_cats`: a
+        dict with 'size' (bytes of complete catalogs), 'inode' and
+        'mtime_ns' (of `outcat` when the manifest was written), 'tail'
+        (sha1 of the last FITS block of the complete catalogs) and
+        'inputs' (list of dicts with 'name', 'offset' and 'size').
+        ``None`` if there is no manifest.
+    """
+    try:
+        with open(outcat + APPEND_MANIFEST_SUFFIX, 'r') as manfh:
+            return json.load(manfh)
+    except FileNotFoundError:
+        return None
+
+
+def _get_append_tail(outfh, size):
+    """ Return the sha1 of the FITS block of an open catalog ending at
+        `size`.
+    """
+    if size < FITS_BLOCK_SIZE:
+        return None
+    return hashlib.sha1(os.pread(outfh.fileno(), FITS_BLOCK_SIZE, size - FITS_BLOCK_SIZE)).hexdigest()
+
+
+def _get_group_end(toc):
+    """ Return the end of the last complete catalog (group of 3 hdus) in
+        the table of contents of a combined catalog.
+    """
+    ngroups = len(toc) // 3
+    if ngroups == 0:
+        return 0
+    last = toc[3 * ngroups - 1]
+    return last['datLoc'] + last['datSpan']
+
+
+def _check_append_manifest(outcat, manifest):
+    """ Return whether the manifest of `outcat` describes it, i.e. `outcat`
+        was not replaced (e.g. rebuilt by :func:`combine_cats`) since the
+        manifest was written.  Data past the manifest size, left by an
+        interrupted append, is allowed.
+    """
+    try:
+        stat = os.stat(outcat)
+    except FileNotFoundError:
+        return False
+    size = manifest.get('size', 0)
+    if stat.st_ino != manifest.get('inode'):
+        # replaced, appends write in place
+        return False
+    if stat.st_size == size and stat.st_mtime_ns == manifest.get('mtime_ns'):
+        return True
+    if stat.st_size < size:
+        return False
+
+    # the size must end a complete catalog and the last block must be the
+    # one that was written
+    ends = set()
+    toc = get_hdu_toc(outcat, complete_only=True)
+    for k in range(2, len(toc), 3):
+        ends.add(toc[k]['datLoc'] + toc[k]['datSpan'])
+    if size not in ends:
+        return False
+    with open(outcat, 'rb') as outfh:
+        return _get_append_tail(outfh, size) == manifest.get('tail')
+
+
+def _write_append_manifest(outcat, manifest):
+    """ Atomically replace the manifest of an appended catalog.
+    """
+    with AtomicWriter(outcat + APPEND_MANIFEST_SUFFIX) as manfh:
+        manfh.write(json.dumps(manifest, indent=1).encode('utf-8'))
+
+
+def append_cats(incat_lst, outcat, validate=True, metadata=None):
+    """ Append catalogs (each with 3 hdus) to the end of a combined catalog
+        without rewriting the catalogs already in it.
+
+        The inputs in `outcat` are listed in the sidecar manifest
+        ``<outcat>.manifest.json`` along with the size of the complete
+        part of `outcat`, and inputs already listed are skipped.  A
+        manifest that does not match `outcat` (e.g. after it was rebuilt)
+        is ignored.  The
+        manifest is updated after each catalog has been written and
+        synced, and anything in `outcat` past the recorded size (left by
+        an interrupted append) is truncated first.  Appenders take an
+        exclusive lock on ``<outcat>.lock`` so several jobs can append to
+        the same catalog.  Readers that must not see a partial catalog
+        should only read up to the manifest size.
+
+        Headers and data are copied as bytes; the primary header of each
+        appended catalog is converted to an image extension header as in
+        :func:`combine_cats`.
+
+        Parameters
+        ----------
+        incat_lst : list
+            The FITS catalogs to append.
+
+        outcat : str
+            The combined catalog, created if it does not exist.  An
+            existing catalog without a manifest (e.g. made by
+            :func:`combine_cats`) is appended to after its last complete
+            hdu, with its earlier inputs unknown.
+
+        validate : bool, optional
+            Whether to check the headers of the new inputs with
+            :func:`check_combine_inputs`, and their tables against those
+            already in `outcat`, default is ``True``.
+
+        metadata : list, optional
+            Special metadata values to compute for each appended input,
+            as in :func:`combine_cats`.  The default is ``None``.
+
+        Returns
+        -------
+        tuple
+            The list of inputs appended and the list of their metadata
+            rows (empty without `metadata`).
+
+        Raises
+        ------
+        ValueError
+            If `validate` is ``True`` and the new inputs cannot be
+            appended.
+    """
+    with open(outcat + APPEND_LOCK_SUFFIX, 'a') as lockfh:
+        with profiling.phase('lock'):
+            fcntl.flock(lockfh.fileno(), fcntl.LOCK_EX)
+        try:
+            return _append_cats_locked(incat_lst, outcat, validate, metadata)
+        finally:
+            fcntl.flock(lockfh.fileno(), fcntl.LOCK_UN)
+
+
+def _append_cats_locked(incat_lst, outcat, validate, metadata):
+    """ append_cats once the lock is held.
+    """
+    manifest = read_append_manifest(outcat)
+    if manifest is not None and not _check_append_manifest(outcat, manifest):
+        if miscutils.fwdebug_check(1, 'FITSUTILS_DEBUG'):
+            miscutils.fwdebug_print(f"Ignoring stale manifest of {outcat}, it does not match the file")
+        manifest = None
+
+    out_toc = None
+    if manifest is None:
+        manifest = {'size': 0, 'inputs': []}
+        if os.path.exists(outcat) and os.path.getsize(outcat) > 0:
+            # not made by append_cats (or replaced since), keep its
+            # complete catalogs
+            out_toc = get_hdu_toc(outcat, complete_only=True)
+            manifest['size'] = _get_group_end(out_toc)
+
+    included = {entry['name'] for entry in manifest['inputs']}
+    new_lst = []
+    for incat in incat_lst:
+        name = os.path.abspath(incat)
+        if name in included:
+            if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
+                miscutils.fwdebug_print(f"Skipping {incat}, already in {outcat}")
+            continue
+        included.add(name)
+        new_lst.append(incat)
+    if not new_lst:
+        return [], []
+
+    if validate:
+        with profiling.phase('check'):
+            check_combine_inputs(new_lst)
+            if manifest['size'] > 0:
+                if out_toc is None:
+                    out_toc = get_hdu_toc(outcat, complete_only=True)
+                ref_schema = [_get_hdu_schema(entry['header']) for entry in out_toc[:3]]
+                schema = [_get_hdu_schema(entry['header']) for entry in get_hdu_toc(new_lst[0])]
+                if schema != ref_schema:
+                    raise ValueError(f"Cannot append {new_lst[0]}: its tables do not match those in {outcat}")
+
+    meta_rows = []
+    mode = 'r+b' if os.path.exists(outcat) else 'w+b'
+    with open(outcat, mode, buffering=0) as outfh:
+        outfh.truncate(manifest['size'])
+        outfh.seek(manifest['size'])
+        for incat in new_lst:
+            if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
+                miscutils.fwdebug_print(f"Appending 3 HDUs from cat --> {incat}")
+            offset = outfh.tell()
+            with profiling.phase('read'):
+                toc = get_hdu_toc(incat)
+            with profiling.phase('write'), open(incat, 'rb', buffering=0) as infh:
+                hdr = toc[0]['header']
+                if offset > 0:
+                    hdr = primary_to_ext_header(hdr)
+                elif 'EXTEND' not in hdr:
+                    hdr = hdr.copy()
+                    naxis = hdr['NAXIS']
+                    hdr.set('EXTEND', True, after=f'NAXIS{naxis:d}' if naxis > 0 else 'NAXIS')
+                outfh.write(hdr.tostring().encode('ascii'))
+                copy_byte_range(infh, outfh, toc[0]['datLoc'], toc[-1]['datLoc'] + toc[-1]['datSpan'] - toc[0]['datLoc'])
+                os.fsync(outfh.fileno())
+            if metadata:
+                with profiling.phase('metadata'):
+                    meta_rows.append(_get_catalog_metadata(incat, HeaderList.from_file(incat, compact=True),
+                                                           metadata))
+            manifest['size'] = outfh.tell()
+            stat = os.fstat(outfh.fileno())
+            manifest['inode'] = stat.st_ino
+            manifest['mtime_ns'] = stat.st_mtime_ns
+            manifest['tail'] = _get_append_tail(outfh, manifest['size'])
+            manifest['inputs'].append({'name': os.path.abspath(incat), 'offset': offset,
+                                       'size': manifest['size'] - offset})
+            _write_append_manifest(outcat, manifest)
 
-def splitScampHead(head_out, heads):
+    if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
+        miscutils.fwdebug_print(f"Appended {len(new_lst):d} catalogs to {outcat}, "
+                                f"{len(manifest['inputs']):d} listed in its manifest")
+    return new_lst, meta_rows
+
+
+#######################################################################
+def split_cats(incat, outcats, nthreads=1):
+    """ Split a catalog made by :func:`combine_cats` back into the
+        individual catalogs (each with 3 hdus).
+
+        Only the headers of `incat` are read.  The first header of each
+        catalog is rewritten as a primary header and the remaining header
+        and data bytes are copied unchanged, so the tables are never
+        loaded into memory.
+
+        Parameters
+        ----------
+        incat : str
+            The combined catalog FITS file to split.
+
+        outcats : str
+            Comma separated list of catalog FITS files to create, in the
+            same order as the catalogs in `incat`.
+
+        nthreads : int, optional
+            Number of output catalogs to write concurrently, default is 1.
+
+        Raises
+        ------
+        ValueError
+            If the number of hdus in `incat` is not 3 times the number of
+            output catalogs.
+    """
+    comma_re = re.compile(r"\s*,\s*")
+    outcat_lst = comma_re.split(outcats)
+
+    with profiling.phase('read'):
+        toc = get_hdu_toc(incat)
+    if len(toc) != 3 * len(outcat_lst):
+        raise ValueError(f"Number of hdus in {incat} ({len(toc):d}) does not match 3 x number of output catalogs ({len(outcat_lst):d})")
+
+    def write_one(k):
+        outcat = outcat_lst[k]
+        if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
+            miscutils.fwdebug_print(f"Writing HDUs {3*k:d}-{3*k+2:d} to cat --> {outcat}")
+        first, others = toc[3*k], toc[3*k+1:3*k+3]
+        with open(incat, 'rb', buffering=0) as infh, AtomicWriter(outcat, buffer_size=0) as outfh:
+            outfh.write(ext_to_primary_header(first['header']).tostring().encode('ascii'))
+            copy_byte_range(infh, outfh, first['datLoc'], first['datSpan'])
+            copy_byte_range(infh, outfh, others[0]['hdrLoc'],
+                            others[-1]['datLoc'] + others[-1]['datSpan'] - others[0]['hdrLoc'])
+
+    with profiling.phase('write'), ThreadPoolExecutor(max_workers=max(1, nthreads)) as executor:
+        list(executor.map(write_one, range(len(outcat_lst))))
+
+
+def _write_checkpoint(checkpoint, state):
+    """ Atomically replace the splitScampHead checkpoint file.
+    """
+    with AtomicWriter(checkpoint) as ckfh:
+        ckfh.write(json.dumps(state).encode('utf-8'))
+
+
+def _read_checkpoint(checkpoint, head_out, head_lst):
+    """ Return the number of heads already written and the offset in
+        `head_out` of the next one, from a checkpoint left by an earlier
+        run of splitScampHead on the same input.
+    """
+    if checkpoint is None or not os.path.exists(checkpoint):
+        return 0, 0
+    with open(checkpoint, 'r') as ckfh:
+        state = json.load(ckfh)
+    stat = os.stat(head_out)
+    if state.get('input') != os.path.abspath(head_out) or state.get('size') != stat.st_size or \
+       state.get('mtime') != stat.st_mtime_ns or state.get('outputs') != head_lst:
+        miscutils.fwdebug_print(f"Ignoring checkpoint {checkpoint} made for a different input")
+        return 0, 0
+    completed = state['completed']
+    if not all(os.path.exists(name) for name in head_lst[:completed]):
+        miscutils.fwdebug_print(f"Ignoring checkpoint {checkpoint}, outputs are missing")
+        return 0, 0
+    return completed, state['offset']
+
+
+def splitScampHead(head_out, heads, checkpoint=None, progress=0):
     """ Split single SCAMP output head file into individual files
 
+        The input is streamed a line at a time so memory use does not
+        depend on its size.  Each head is written with an
+        :class:`AtomicWriter`, so it only appears once complete and on disk
+        and no partially written head files are left behind on failure.
+
         Parameters
         ----------
         head_out : str
@@ -156,6 +1620,16 @@ def splitScampHead(head_out, heads):
             Comma separated list of filenames to write out the individual
             SCAMP heads to
 
+        checkpoint : str, optional
+            File recording how many heads have been written.  If it exists
+            from an interrupted run on the same input, splitting resumes
+            after the last completed head.  It is removed on success.  The
+            default is ``None`` (no checkpoint).
+
+        progress : float, optional
+            If greater than 0, print the number of heads written and the
+            throughput every `progress` seconds.  The default is 0.
+
         Raises
         ------
         ValueError
@@ -165,35 +1639,71 @@ def splitScampHead(head_out, heads):
     comma_re = re.compile(r"\s*,\s*")
     head_lst = comma_re.split(heads)
     reqheadcount = len(head_lst)
-    headcount = 0
-    endcount = 0
+    history_re = re.compile(rb"^HISTORY   Astrometric solution by SCAMP.*")
+    end_re = re.compile(rb"^END\s*")
+
+    headcount, offset = _read_checkpoint(checkpoint, head_out, head_lst)
+    if headcount > 0:
+        miscutils.fwdebug_print(f"Resuming after {headcount:d} heads from checkpoint {checkpoint}")
+    stat = os.stat(head_out)
+    state = {'input': os.path.abspath(head_out), 'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+             'outputs': head_lst}
+
+    endcount = headcount
     linecount = 0
-    linecount_tot = 0
+    writer = None
     filehead = None
-    for line in open(head_out, 'r'):
-        if re.match("^HISTORY   Astrometric solution by SCAMP.*", line):
+    start_time = last_report = time.time()
+    start_offset = offset
+
+    def finish_head():
+        """ Close the current head and move it into place """
+        nonlocal writer
+        if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
+            miscutils.fwdebug_print(f"Closing .head file after writing {linecount:d} lines.")
+        if endcount != headcount:
+            miscutils.fwdebug_print(f"Error: problem when writing {head_lst[headcount-1]}")
+            raise ValueError(f"Number of END lines ({endcount:d}) does not match number of HISTORY lines ({headcount:d})")
+        head_writer, writer = writer, None
+        head_writer.__exit__(None, None, None)
+        if checkpoint is not None:
+            _write_checkpoint(checkpoint, dict(state, completed=headcount, offset=offset))
+
+    try:
+        with profiling.phase('split'), open(head_out, 'rb') as infh:
+            infh.seek(offset)
+            for line in infh:
+                if history_re.match(line):
+                    if filehead is not None:
+                        finish_head()
+                        filehead = None
+                    if headcount >= reqheadcount:
+                        raise ValueError(f"Number of heads in {head_out} is more than required number of head files ({reqheadcount:d})")
+                    if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
+                        miscutils.fwdebug_print(f"Opening .head file {headcount:d} --> {head_lst[headcount]}")
+                    writer = AtomicWriter(head_lst[headcount], buffer_size=io.DEFAULT_BUFFER_SIZE)
+                    filehead = writer.__enter__()
+                    headcount += 1
+                    linecount = 0
+                    if progress > 0 and time.time() - last_report >= progress:
+                        last_report = time.time()
+                        rate = (offset - start_offset) / max(last_report - start_time, 1e-6) / 1e6
+                        print(f"Split {headcount - 1:d} of {reqheadcount:d} heads, {offset / 1e6:.1f} of {stat.st_size / 1e6:.1f} MB ({rate:.1f} MB/s)")
+                elif end_re.match(line):
+                    endcount += 1
+                if filehead is None:
+                    raise ValueError(f"{head_out} does not start with a SCAMP HISTORY line")
+                filehead.write(line)
+                offset += len(line)
+                linecount += 1
             if filehead is not None:
-                filehead.close()
-                if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
-                    miscutils.fwdebug_print(f"Closing .head file after writing {linecount:d} lines.")
-                if endcount != headcount:
-                    miscutils.fwdebug_print(f"Error: problem when writing {head_lst[headcount]}")
-                    raise ValueError(f"Number of END lines ({endcount:d}) does not match number of HISTORY lines ({headcount:d})")
-            if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
-                miscutils.fwdebug_print(f"Opening .head file {headcount:d} --> {head_lst[headcount]}")
-            filehead = open(head_lst[headcount], 'w')
-            headcount += 1
-            linecount = 0
-        elif re.match(r"^END\s*", line):
-            endcount += 1
-        filehead.write(line)
-        linecount += 1
-        linecount_tot += 1
-    filehead.close()
-
-    if endcount != headcount:
-        miscutils.fwdebug_print(f"Error: problem when writing {head_lst[headcount]}")
-        raise ValueError(f"Number of END lines ({endcount:d}) does not match number of HISTORY lines ({headcount:d})")
+                finish_head()
+                filehead = None
+    except BaseException:
+        if writer is not None:
+            # removes the temporary file of the unfinished head
+            writer.__exit__(*sys.exc_info())
+        raise
 
     if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
         miscutils.fwdebug_print(f"Closing .head file after writing {linecount:d} lines.\n")
@@ -201,7 +1711,712 @@ def splitScampHead(head_out, heads):
     if headcount != reqheadcount:
         raise ValueError(f"Number of head files made ({headcount:d}) does not match required number of head files ({reqheadcount:d})")
 
+    if checkpoint is not None and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+
+#######################################################################
+def get_data_size(hdr):
+    """ Compute the size in bytes of the data described by a header,
+        excluding the padding to a full FITS block.
+
+        Parameters
+        ----------
+        hdr : astropy.io.fits.Header
+            The header of the HDU
+
+        Returns
+        -------
+        int
+            The number of data bytes.
+    """
+    naxis = hdr.get('NAXIS', 0)
+    if naxis == 0:
+        return 0
+    # random groups have NAXIS1 = 0 which is not part of the data size
+    start = 2 if hdr.get('GROUPS', False) and hdr.get('NAXIS1', 0) == 0 else 1
+    nelem = 1
+    for i in range(start, naxis + 1):
+        nelem *= hdr[f'NAXIS{i:d}']
+    return abs(hdr['BITPIX']) // 8 * hdr.get('GCOUNT', 1) * (hdr.get('PCOUNT', 0) + nelem)
+
+
+#######################################################################
+def read_raw_header(fileobj):
+    """ Read the raw bytes of one FITS header from the current position.
+
+        Parameters
+        ----------
+        fileobj : file object
+            Binary file object positioned at the start of a header.
+
+        Returns
+        -------
+        bytes
+            The header blocks, including the END card and padding, or an
+            empty bytes object at the end of the file.
 
+        Raises
+        ------
+        OSError
+            If the file ends before the END card.
+    """
+    blocks = []
+    while True:
+        block = fileobj.read(FITS_BLOCK_SIZE)
+        if not block:
+            if blocks:
+                raise OSError("File ended before END card of header")
+            return b''
+        if len(block) != FITS_BLOCK_SIZE:
+            raise OSError("Truncated FITS header block")
+        blocks.append(block)
+        for i in range(0, FITS_BLOCK_SIZE, 80):
+            if block[i:i+8] == b'END     ':
+                return b''.join(blocks)
+
+
+#######################################################################
+def get_hdu_toc(filename, compact=False, complete_only=False):
+    """ Get the table of contents of a FITS file by reading only the
+        headers and skipping over the data.
+
+        Parameters
+        ----------
+        filename : str or file object
+            The FITS file (or a seekable binary file object) to scan.
+
+        compact : bool, optional
+            Return the headers as CompactHeader objects, default is
+            ``False``.
+
+        complete_only : bool, optional
+            Stop at the first HDU whose header cannot be read or whose data
+            goes past the end of the file, instead of raising an error.
+            The default is ``False``.
+
+        Returns
+        -------
+        list
+            One dict per HDU with keys 'header' (astropy.io.fits.Header or
+            CompactHeader),
+            'hdrLoc' (offset of the header), 'datLoc' (offset of the data)
+            and 'datSpan' (size of the data including padding), matching
+            the names used by astropy's HDUList.fileinfo.
+    """
+    if isinstance(filename, (str, bytes, os.PathLike)):
+        with open(filename, 'rb') as fileobj:
+            return get_hdu_toc(fileobj, compact, complete_only)
+    return list(iter_hdu_toc(filename, compact, complete_only))
+
+
+def iter_hdu_toc(fileobj, compact=False, complete_only=False):
+    """ Generate the entries of :func:`get_hdu_toc` one HDU at a time, so
+        that a scan can stop once the wanted header has been read.
+
+        Parameters
+        ----------
+        fileobj : file object
+            Seekable binary file object positioned at the first header.  It
+            may be used for other reads between entries.
+
+        compact, complete_only : bool, optional
+            As for :func:`get_hdu_toc`.
+
+        Yields
+        ------
+        dict
+            The entry of each HDU, as in :func:`get_hdu_toc`.
+    """
+    offset = fileobj.tell()
+    filesize = fileobj.seek(0, os.SEEK_END) if complete_only else None
+    while True:
+        fileobj.seek(offset)
+        try:
+            raw = read_raw_header(fileobj)
+            if not raw:
+                break
+            hdr = CompactHeader(raw) if compact else fits.Header.fromstring(raw.decode('ascii'))
+            size = get_data_size(hdr)
+        except (OSError, ValueError, KeyError):
+            if complete_only:
+                break
+            raise
+        span = (size + FITS_BLOCK_SIZE - 1) // FITS_BLOCK_SIZE * FITS_BLOCK_SIZE
+        if complete_only and offset + len(raw) + span > filesize:
+            break
+        yield {'header': hdr, 'hdrLoc': offset,
+               'datLoc': offset + len(raw), 'datSpan': span}
+        offset += len(raw) + span
+
+
+#######################################################################
+def _zimage_to_image_header(hdr):
+    """ Basic conversion of the header of a tile compressed image to the
+        header of the image, for astropy versions without
+        _bintable_header_to_image_header.
+    """
+    table_re = re.compile(r'^(TTYPE|TFORM|TUNIT|TNULL|TSCAL|TZERO|TDISP|TDIM|TBCOL)[0-9]+$')
+    zkey_re = re.compile(r'^(ZNAXIS|ZTILE|ZNAME|ZVAL)[0-9]+$')
+    zkeys = {'ZIMAGE', 'ZSIMPLE', 'ZTENSION', 'ZBITPIX', 'ZNAXIS', 'ZEXTEND', 'ZBLOCKED',
+             'ZPCOUNT', 'ZGCOUNT', 'ZHECKSUM', 'ZDATASUM', 'ZCMPTYPE', 'ZMASKCMP',
+             'ZQUANTIZ', 'ZDITHER0', 'ZBLANK', 'ZSCALE', 'ZZERO'}
+    image = fits.Header()
+    if 'ZSIMPLE' in hdr:
+        image['SIMPLE'] = hdr['ZSIMPLE']
+    else:
+        image['XTENSION'] = ('IMAGE', 'Image extension')
+    image['BITPIX'] = hdr['ZBITPIX']
+    image['NAXIS'] = hdr['ZNAXIS']
+    for i in range(1, hdr['ZNAXIS'] + 1):
+        image[f'NAXIS{i:d}'] = hdr[f'ZNAXIS{i:d}']
+    if 'ZSIMPLE' not in hdr:
+        image['PCOUNT'] = hdr.get('ZPCOUNT', 0)
+        image['GCOUNT'] = hdr.get('ZGCOUNT', 1)
+    for card in hdr.cards:
+        key = card.keyword
+        if key in ('XTENSION', 'BITPIX', 'PCOUNT', 'GCOUNT', 'TFIELDS', 'THEAP',
+                   'CHECKSUM', 'DATASUM') or key.startswith('NAXIS') or \
+           key in zkeys or table_re.match(key) or zkey_re.match(key):
+            continue
+        if key == 'EXTNAME' and card.value == 'COMPRESSED_IMAGE':
+            continue
+        image.append(card)
+    if 'ZEXTEND' in hdr:
+        image['EXTEND'] = hdr['ZEXTEND']
+    for zkey, key in [('ZHECKSUM', 'CHECKSUM'), ('ZDATASUM', 'DATASUM')]:
+        if zkey in hdr:
+            image[key] = hdr[zkey]
+    return image
+
+
+def get_image_header(hdr, compact=False):
+    """ Return the header of the image in a tile compressed (ZIMAGE) HDU,
+        as astropy's CompImageHDU gives it, or `hdr` itself for any other
+        HDU.
+
+        Parameters
+        ----------
+        hdr : astropy.io.fits.Header or CompactHeader
+            The header as stored in the file (e.g. from :func:`get_hdu_toc`).
+
+        compact : bool, optional
+            Return a CompactHeader, default is ``False``.
+
+        Returns
+        -------
+        astropy.io.fits.Header or CompactHeader
+            The image header.
+    """
+    if not hdr.get('ZIMAGE', False):
+        return hdr
+    if isinstance(hdr, CompactHeader):
+        hdr = hdr.to_header()
+    if _bintable_header_to_image_header is not None:
+        image = _bintable_header_to_image_header(hdr)
+    else:
+        image = _zimage_to_image_header(hdr)
+    return CompactHeader.from_header(image) if compact else image
+
+
+#######################################################################
+def ext_to_primary_header(hdr):
+    """ Convert an extension header into a primary header.
+
+        Parameters
+        ----------
+        hdr : astropy.io.fits.Header
+            The extension header, it is not modified.
+
+        Returns
+        -------
+        astropy.io.fits.Header
+            A copy of `hdr` starting with SIMPLE instead of XTENSION.
+
+        Raises
+        ------
+        ValueError
+            If `hdr` is not an image extension header.
+    """
+    newhdr = hdr.copy()
+    if 'XTENSION' not in newhdr:
+        return newhdr
+    if newhdr['XTENSION'].strip() != 'IMAGE':
+        raise ValueError(f"Cannot make primary header from {newhdr['XTENSION']} extension")
+
+    del newhdr['XTENSION']
+    newhdr.insert(0, ('SIMPLE', True, 'conforms to FITS standard'))
+    if newhdr.get('PCOUNT', 0) == 0 and newhdr.get('GCOUNT', 1) == 1:
+        newhdr.remove('PCOUNT', ignore_missing=True)
+        newhdr.remove('GCOUNT', ignore_missing=True)
+    if 'EXTEND' not in newhdr:
+        naxis = newhdr['NAXIS']
+        after = f'NAXIS{naxis:d}' if naxis > 0 else 'NAXIS'
+        newhdr.set('EXTEND', True, after=after)
+    return newhdr
+
+
+#######################################################################
+def primary_to_ext_header(hdr):
+    """ Convert a primary header into an image extension header, the
+        same way astropy does when a primary HDU is appended to an HDUList.
+
+        Parameters
+        ----------
+        hdr : astropy.io.fits.Header
+            The primary header, it is not modified.
+
+        Returns
+        -------
+        astropy.io.fits.Header
+            A copy of `hdr` starting with XTENSION = 'IMAGE'.
+    """
+    newhdr = hdr.copy()
+    if 'SIMPLE' not in newhdr:
+        return newhdr
+
+    del newhdr['SIMPLE']
+    newhdr.insert(0, ('XTENSION', 'IMAGE', 'Image extension'))
+    newhdr.remove('EXTEND', ignore_missing=True)
+    naxis = newhdr['NAXIS']
+    after = f'NAXIS{naxis:d}' if naxis > 0 else 'NAXIS'
+    if 'PCOUNT' not in newhdr:
+        newhdr.set('PCOUNT', 0, 'number of parameters', after=after)
+    if 'GCOUNT' not in newhdr:
+        newhdr.set('GCOUNT', 1, 'number of groups', after='PCOUNT')
+    return newhdr
+
+
+#######################################################################
+def copy_byte_range(infh, outfh, offset, size):
+    """ Copy `size` bytes starting at `offset` in `infh` to the current
+        position of `outfh` without decoding them.
+
+        The kernel does the copy (copy_file_range) where possible.  Both
+        file objects must be unbuffered binary files.
+
+        Parameters
+        ----------
+        infh : file object
+            The file to copy from, its position is not used.
+
+        outfh : file object
+            The file to copy to.
+
+        offset : int
+            Where to start copying in `infh`.
+
+        size : int
+            The number of bytes to copy.
+    """
+    infd = infh.fileno()
+    outfd = outfh.fileno()
+    while size > 0:
+        ncopied = 0
+        if hasattr(os, 'copy_file_range'):
+            try:
+                ncopied = os.copy_file_range(infd, outfd, min(size, COPY_CHUNK_SIZE), offset)
+            except OSError:
+                ncopied = 0
+        if ncopied == 0:
+            buf = os.pread(infd, min(size, COPY_CHUNK_SIZE), offset)
+            if not buf:
+                raise OSError(f"Unexpected end of file copying {size:d} bytes at {offset:d}")
+            ncopied = outfh.write(buf)
+        offset += ncopied
+        size -= ncopied
+
+
+#######################################################################
+class _CompactCards:
+    """ The cards of a CompactHeader, indexed by position or keyword like
+        astropy.io.fits.Header.cards.
+    """
+    __slots__ = ('_header',)
+
+    def __init__(self, header):
+        self._header = header
+
+    def __getitem__(self, key):
+        return self._header.card(key)
+
+    def __iter__(self):
+        return iter(self._header.card_list())
+
+    def __len__(self):
+        return len(self._header)
+
+
+class CompactHeader:
+    """ Read-only FITS header stored as its card images.
+
+        The cards (without trailing blanks) are kept in a single bytes
+        buffer, each preceded by a newline.  A keyword is found with one
+        search of the buffer and its value is only parsed (by astropy) when
+        it is asked for, so a CompactHeader uses a fraction of the memory
+        of an astropy.io.fits.Header.  It supports the read-only parts of
+        the Header interface used by this package (``hdr[key]``,
+        ``hdr.get``, ``key in hdr``, ``hdr.cards[key]``) and
+        :meth:`to_header` gives a full Header when needed.
+
+        Parameters
+        ----------
+        raw : bytes or str, optional
+            The header as read from a file: 80 character cards, ending
+            with an END card or not.
+    """
+    __slots__ = ('_buf',)
+
+    COMMENTARY_KEYWORDS = ('COMMENT', 'HISTORY', '')
+
+    def __init__(self, raw=b''):
+        if isinstance(raw, str):
+            raw = raw.encode('ascii')
+        lines = []
+        for i in range(0, len(raw), 80):
+            card = raw[i:i + 80].rstrip()
+            if card == b'END':
+                break
+            lines.append(b'\n' + card)
+        self._buf = b''.join(lines)
+
+    @classmethod
+    def from_header(cls, hdr):
+        """ Make a CompactHeader from an astropy.io.fits.Header.
+        """
+        return cls(hdr.tostring(endcard=False, padding=False))
+
+    @classmethod
+    def from_cards(cls, cards):
+        """ Make a CompactHeader from card images (e.g. the LDAC_IMHEAD
+            strings) or astropy.io.fits.Card objects.
+        """
+        return cls(''.join(card.ljust(80) if isinstance(card, str) else str(card) for card in cards))
+
+    def _lines(self):
+        return self._buf.split(b'\n')[1:]
+
+    def _find(self, key):
+        """ Return (start, end) of the first card with keyword `key` in the
+            buffer, or ``None``.
+        """
+        ukey = key.upper()
+        if ukey.startswith('HIERARCH '):
+            ukey = ukey[9:]
+        if len(ukey) <= 8 and ' ' not in ukey:
+            pos = self._buf.find(b'\n' + ukey.encode('ascii').ljust(8))
+        else:
+            pattern = b'\nHIERARCH ' + ukey.encode('ascii')
+            pos = self._buf.find(pattern)
+            while pos >= 0 and self._buf[pos + len(pattern):pos + len(pattern) + 1] not in b' =':
+                pos = self._buf.find(pattern, pos + 1)
+        if pos < 0:
+            return None
+        end = self._buf.find(b'\n', pos + 1)
+        return pos + 1, len(self._buf) if end < 0 else end
+
+    def _image(self, start, end):
+        """ Return the card image starting at `start`, including any
+            CONTINUE cards.
+        """
+        images = [self._buf[start:end].decode('ascii').ljust(80)]
+        while self._buf.startswith(b'\nCONTINUE', end):
+            start = end + 1
+            end = self._buf.find(b'\n', start)
+            end = len(self._buf) if end < 0 else end
+            images.append(self._buf[start:end].decode('ascii').ljust(80))
+        return ''.join(images)
+
+    def card_list(self):
+        """ Return all cards as a list of astropy.io.fits.Card.
+        """
+        images = []
+        for line in self._lines():
+            image = line.decode('ascii').ljust(80)
+            if line.startswith(b'CONTINUE') and images:
+                images[-1] += image
+            else:
+                images.append(image)
+        return [fits.Card.fromstring(image) for image in images]
+
+    def card(self, key):
+        """ Return the astropy.io.fits.Card of a keyword or position.
+
+            Raises
+            ------
+            KeyError
+                If there is no such keyword.
+        """
+        if isinstance(key, int):
+            return self.card_list()[key]
+        loc = self._find(key)
+        if loc is None:
+            raise KeyError(f"Keyword {key!r} not found.")
+        return fits.Card.fromstring(self._image(*loc))
+
+    @property
+    def cards(self):
+        return _CompactCards(self)
+
+    def __getitem__(self, key):
+        if isinstance(key, str) and key.upper() in self.COMMENTARY_KEYWORDS:
+            ukey = key.upper()
+            return [card.value for card in self.card_list() if card.keyword == ukey]
+        return self.card(key).value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __len__(self):
+        return self._buf.count(b'\n') - self._buf.count(b'\nCONTINUE')
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        """ Return the keywords of all cards, in order.
+        """
+        return [card.keyword for card in self.card_list()]
+
+    @property
+    def nbytes(self):
+        """ Size of the card buffer in bytes. """
+        return len(self._buf)
+
+    def tostring(self, endcard=True, padding=True):
+        """ Return the header as a string of 80 character cards, as
+            astropy.io.fits.Header.tostring.
+        """
+        text = ''.join(line.decode('ascii').ljust(80) for line in self._lines())
+        if endcard:
+            text += 'END'.ljust(80)
+        if padding:
+            text += ' ' * (-len(text) % FITS_BLOCK_SIZE)
+        return text
+
+    def to_header(self):
+        """ Return the header as an astropy.io.fits.Header.
+        """
+        return fits.Header.fromstring(self.tostring())
+
+    def __repr__(self):
+        return '\n'.join(line.decode('ascii').ljust(80) for line in self._lines())
+
+
+#######################################################################
+class HeaderOnlyHDU:
+    """ The header (and, for LDAC_IMHEAD, the data) of a single HDU.
+    """
+    __slots__ = ('header', 'data')
+
+    def __init__(self, header, data=None):
+        self.header = header
+        self.data = data
+
+
+class HeaderList:
+    """ The headers of all HDUs in a FITS file, detached from the file.
+
+        A HeaderList can be used in place of an astropy.io.fits.HDUList
+        wherever only headers are needed, e.g. by :func:`get_hdr`,
+        :func:`get_hdr_value` and the func_* functions in
+        fits_special_metadata.  It is indexed by HDU number or EXTNAME in
+        the same way as an HDUList.  The LDAC_IMHEAD table is kept so that
+        :func:`get_ldac_imhead_as_hdr` still works.
+
+        A HeaderList made by ``from_source(..., lazy=True)`` reads the
+        headers on demand, e.g. only the primary header when only HDU 0 is
+        used; ``len()`` and negative indices read all headers.
+
+        Parameters
+        ----------
+        hdus : list
+            List of HeaderOnlyHDU objects.
+
+        reader : iterator, optional
+            Yields the HeaderOnlyHDU objects of the following HDUs, read
+            when needed.  The default is ``None`` (`hdus` are all HDUs).
+
+        source : bytesource.ByteSource, optional
+            Byte source closed once `reader` is done or the HeaderList is
+            closed.  The default is ``None``.
+    """
+
+    def __init__(self, hdus, reader=None, source=None):
+        self.hdus = list(hdus)
+        self._reader = reader
+        self._source = source
+
+    @classmethod
+    def from_file(cls, filename, compact=False):
+        """ Read all headers of a FITS file.
+
+            Parameters
+            ----------
+            filename : str
+                The FITS file to read, or a URL read with
+                :meth:`from_source`.
+
+            compact : bool, optional
+                Keep the headers as CompactHeader objects, default is
+                ``False``.
+
+            Returns
+            -------
+            HeaderList
+                The headers of all HDUs in `filename`.
+        """
+        if compact or bytesource.is_remote(filename):
+            return cls.from_source(filename, compact=compact)
+
+        hdus = []
+        with fits.open(filename, 'readonly') as hdulist:
+            for hdu in hdulist:
+                data = None
+                if hdu.header.get('EXTNAME') == 'LDAC_IMHEAD':
+                    data = hdu.data.copy()
+                hdus.append(HeaderOnlyHDU(hdu.header.copy(), data))
+        return cls(hdus)
+
+    @classmethod
+    def from_source(cls, source, cache_dir=None, compact=False, lazy=False):
+        """ Read all headers of a FITS file through a byte source, fetching
+            only the header blocks (and the LDAC_IMHEAD table).  Tile
+            compressed images get the header of the image, as with astropy
+            (see :func:`get_image_header`).
+
+            Parameters
+            ----------
+            source : str or bytesource.ByteSource
+                A local path or URL, or an open byte source (which is not
+                closed).
+
+            cache_dir : str, optional
+                Local block cache directory when `source` is a URL, see
+                :func:`bytesource.open_source`.  The default is ``None``.
+
+            compact : bool, optional
+                Keep the headers as CompactHeader objects, default is
+                ``False``.
+
+            lazy : bool, optional
+                Read each header only when it is first used, default is
+                ``False``.  An open `source` must then stay open while
+                the HeaderList is used; a source opened here is closed
+                with the HeaderList or once all headers have been read.
+
+            Returns
+            -------
+            HeaderList
+                The headers of all HDUs.
+        """
+        if not isinstance(source, bytesource.ByteSource):
+            opened = bytesource.open_source(source, cache_dir)
+            if lazy:
+                return cls([], cls._read_hdus(opened, compact), opened)
+            with opened:
+                return cls.from_source(opened, compact=compact)
+
+        hdrs = cls([], cls._read_hdus(source, compact))
+        if not lazy:
+            hdrs._read_to(None)
+        return hdrs
+
+    @staticmethod
+    def _read_hdus(source, compact):
+        """ Generate the HeaderOnlyHDU of each HDU of a byte source.
+        """
+        if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
+            miscutils.fwdebug_print(f"Reading headers of {source.name} by byte ranges")
+        with bytesource.SourceFile(source) as fileobj:
+            for entry in iter_hdu_toc(fileobj, compact):
+                hdr = get_image_header(entry['header'], compact)
+                data = None
+                if hdr.get('EXTNAME') == 'LDAC_IMHEAD':
+                    raw = source.read(entry['hdrLoc'], entry['datLoc'] + entry['datSpan'] - entry['hdrLoc'])
+                    data = fits.BinTableHDU.fromstring(raw).data
+                yield HeaderOnlyHDU(hdr, data)
+
+    def _read_to(self, index):
+        """ Read headers until HDU `index` (all if ``None``) has been read
+            or there are no more.
+        """
+        while self._reader is not None and (index is None or len(self.hdus) <= index):
+            try:
+                self.hdus.append(next(self._reader))
+            except StopIteration:
+                self.close()
+
+    def close(self):
+        """ Stop reading headers and close the byte source of a lazy
+            HeaderList.  The headers already read stay available.
+        """
+        self._reader = None
+        if self._source is not None:
+            self._source.close()
+            self._source = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def __len__(self):
+        self._read_to(None)
+        return len(self.hdus)
+
+    def __iter__(self):
+        k = 0
+        while True:
+            self._read_to(k)
+            if k >= len(self.hdus):
+                return
+            yield self.hdus[k]
+            k += 1
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            self._read_to(key if key >= 0 else None)
+            return self.hdus[key]
+        ukey = key.upper()
+        if ukey == 'PRIMARY':
+            return self[0]
+        for hdu in self:
+            if str(hdu.header.get('EXTNAME', '')).strip().upper() == ukey:
+                return hdu
+        raise KeyError(f"Extension {key!r} not found.")
+
+
+#######################################################################
+def open_headers(filename):
+    """ Open a FITS file for reading its headers.
+
+        Local files are opened with astropy.  For URLs (see
+        :mod:`despyfitsutils.bytesource`) only the header blocks are
+        fetched with range reads, as they are used, and a lazy HeaderList
+        is returned.
+
+        Parameters
+        ----------
+        filename : str
+            Local path or URL of the FITS file.
+
+        Returns
+        -------
+        astropy.io.fits.HDUList or HeaderList
+            To be closed (or used as a context manager) by the caller.
+    """
+    if bytesource.is_remote(filename):
+        return HeaderList.from_source(filename, lazy=True)
+    return fits.open(filename, 'readonly')
 
 
 #######################################################################
@@ -303,10 +2518,89 @@ def get_hdr_extra(hdulist, key, whichhdu=None):
     ukey = key.upper()
 
     hdr = get_hdr(hdulist, whichhdu)
-    htype = type(hdr[ukey])
-    hcomment = hdr.comments[ukey]
+    card = hdr.cards[ukey]
+
+    return card.comment, type(card.value)
+
+#######################################################################
+def get_hdr_values(hdulist, keys, whichhdus=None, default=None, strict=False):
+    """ Look up the value, comment and type of many keys in many HDU
+        headers.  Each HDU is resolved once and each key is looked up once
+        per header.
+
+        Parameters
+        ----------
+        hdulist : astropy.io.fits.HDUList or HeaderList
+            The list of HDU objects to search
+
+        keys : list
+            The keywords to look up.
+
+        whichhdus : various or list, optional
+            The HDU(s) to search, each as `whichhdu` in :func:`get_hdr`.
+            The default is ``None`` (primary HDU).
+
+        default : various or dict, optional
+            The value returned for missing keys, or a dict of such values
+            keyed by (upper case) keyword.  The default is ``None``.
+
+        strict : bool, optional
+            Raise KeyError for missing keys instead of using `default`,
+            default is ``False``.
+
+        Returns
+        -------
+        dict
+            Keyed by each of `whichhdus` (as given), of dicts keyed by upper
+            case keyword of (value, comment, type) tuples.  Missing keys
+            have (default, ``None``, ``None``).
+    """
+    if not isinstance(whichhdus, (list, tuple)):
+        whichhdus = [whichhdus]
+    ukeys = [key.upper() for key in keys]
+
+    results = {}
+    for whichhdu in whichhdus:
+        cards = get_hdr(hdulist, whichhdu).cards
+        values = {}
+        for ukey in ukeys:
+            try:
+                card = cards[ukey]
+            except KeyError:
+                if strict:
+                    raise KeyError(f"Keyword {ukey!r} not found in HDU {whichhdu}.") from None
+                val = default.get(ukey) if isinstance(default, dict) else default
+                values[ukey] = (val, None, None)
+            else:
+                values[ukey] = (card.value, card.comment, type(card.value))
+        results[whichhdu] = values
+    return results
+
+#######################################################################
+def get_files_hdr_values(filenames, keys, whichhdus=None, default=None, strict=False, nthreads=4):
+    """ Run :func:`get_hdr_values` over many files, reading only their
+        headers, several files at a time.
+
+        Parameters
+        ----------
+        filenames : list
+            The FITS files to read.
 
-    return hcomment, htype
+        nthreads : int, optional
+            Number of files to read concurrently, default is 4.
+
+        The other parameters are as for :func:`get_hdr_values`.
+
+        Returns
+        -------
+        dict
+            Keyed by filename, of the results of :func:`get_hdr_values`.
+    """
+    def read_file(filename):
+        return get_hdr_values(HeaderList.from_file(filename), keys, whichhdus, default, strict)
+
+    with ThreadPoolExecutor(max_workers=max(1, nthreads)) as executor:
+        return dict(zip(filenames, executor.map(read_file, filenames)))
 
 #######################################################################
 def get_ldac_imhead_as_cardlist(imhead):
@@ -331,7 +2625,7 @@ def get_ldac_imhead_as_cardlist(imhead):
 
 
 #######################################################################
-def get_ldac_imhead_as_hdr(imhead):
+def get_ldac_imhead_as_hdr(imhead, compact=False):
     """ Convert an HDU to a header
 
         Parameters
@@ -339,10 +2633,16 @@ def get_ldac_imhead_as_hdr(imhead):
         imhead : astropy.io.fits.HDU
             The HDU to convert
 
+        compact : bool, optional
+            Return a CompactHeader, without parsing the cards, default is
+            ``False``.
+
         Returns
         -------
-        astropy.io.fits.header
+        astropy.io.fits.header or CompactHeader
             Contains the data from the input.
     """
+    if compact:
+        return CompactHeader.from_cards(imhead.data[0][0])
     hdr = fits.Header(get_ldac_imhead_as_cardlist(imhead))
     return hdr
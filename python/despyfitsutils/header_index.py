@@ -0,0 +1,270 @@
+"""
+    Inverted index of selected header keywords over many FITS files
+
+    The index maps keyword -> (type, value) -> (file, HDU number) for every
+    HDU of every indexed file, so finding e.g. all HDUs with a given OBJECT
+    or an EXPNUM range does not need the files to be read again.
+"""
+
+import os
+import bisect
+import pickle
+import numbers
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import despymisc.miscutils as miscutils
+import despyfitsutils.fitsutils as fitsutils
+
+INDEX_VERSION = 2
+
+
+#######################################################################
+def _normalize(val):
+    """ Return the form of a header value that is stored in the index,
+        a (type, value) tuple so that e.g. T and 1 are different values.
+    """
+    if isinstance(val, str):
+        return ('str', val.rstrip())
+    if isinstance(val, (bool, np.bool_)):
+        return ('bool', bool(val))
+    if isinstance(val, numbers.Number):
+        return ('number', val)
+    return ('str', str(val))
+
+
+def _read_file_entries(filename, keys):
+    """ Read (key, value, hdu) for the indexed keys in all HDUs of a file,
+        or return ``None`` if the file cannot be read.
+    """
+    entries = []
+    try:
+        for hdu, entry in enumerate(fitsutils.get_hdu_toc(filename, compact=True)):
+            hdr = entry['header']
+            for key in keys:
+                if key in hdr:
+                    entries.append((key, _normalize(hdr[key]), hdu))
+    except (OSError, ValueError) as err:
+        miscutils.fwdebug_print(f"WARNING: Skipping {filename}, cannot read its headers: {err}")
+        return None
+    return entries
+
+
+#######################################################################
+class HeaderIndex:
+    """ Inverted index of header keyword values.
+
+        Parameters
+        ----------
+        keys : list
+            The header keywords to index.
+    """
+
+    def __init__(self, keys):
+        self.keys = [key.upper() for key in keys]
+        self._postings = {key: {} for key in self.keys}
+        self._files = {}       # path -> (size, mtime_ns, fileid)
+        self._paths = []       # fileid -> path, None once removed
+        self._entries = []     # fileid -> list of (key, value, hdu)
+        self._sorted = {}      # key -> (sorted strings, sorted numbers), built on demand
+
+    def __len__(self):
+        return len(self._files)
+
+    # -----------------------------------------------------------------
+    def _add(self, path, stamp, entries):
+        """ Add the entries of one file to the index.
+        """
+        fileid = len(self._paths)
+        self._paths.append(path)
+        self._entries.append(entries)
+        self._files[path] = stamp + (fileid,)
+        for key, val, hdu in entries:
+            self._postings[key].setdefault(val, set()).add((fileid, hdu))
+            self._sorted.pop(key, None)
+
+    def _remove(self, path):
+        """ Remove one file from the index.
+        """
+        fileid = self._files.pop(path)[2]
+        for key, val, hdu in self._entries[fileid]:
+            locs = self._postings[key][val]
+            locs.discard((fileid, hdu))
+            if not locs:
+                del self._postings[key][val]
+                self._sorted.pop(key, None)
+        self._paths[fileid] = None
+        self._entries[fileid] = None
+
+    def update(self, filenames, nthreads=8):
+        """ Index new files and re-index files that changed since they were
+            indexed.  Unchanged files are not read, files that do not
+            exist or cannot be read are skipped (and dropped from the index
+            if they were in it).
+
+            Parameters
+            ----------
+            filenames : list
+                The files to index.
+
+            nthreads : int, optional
+                Number of files to read concurrently, default is 8.
+
+            Returns
+            -------
+            int
+                The number of files read.
+        """
+        todo = []
+        for filename in filenames:
+            path = os.path.abspath(filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                if miscutils.fwdebug_check(1, 'FITSUTILS_DEBUG'):
+                    miscutils.fwdebug_print(f"Skipping {filename}, it does not exist")
+                continue
+            stamp = (stat.st_size, stat.st_mtime_ns)
+            known = self._files.get(path)
+            if known is None or known[:2] != stamp:
+                todo.append((path, stamp))
+
+        if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
+            miscutils.fwdebug_print(f"Indexing {len(todo)} of {len(filenames)} files")
+
+        with ThreadPoolExecutor(max_workers=max(1, nthreads)) as executor:
+            results = executor.map(lambda item: _read_file_entries(item[0], self.keys), todo)
+            nread = 0
+            for (path, stamp), entries in zip(todo, results):
+                if path in self._files:
+                    self._remove(path)
+                if entries is not None:
+                    self._add(path, stamp, entries)
+                    nread += 1
+        return nread
+
+    def remove(self, filenames):
+        """ Remove files from the index, ignoring files that are not in it.
+        """
+        for filename in filenames:
+            path = os.path.abspath(filename)
+            if path in self._files:
+                self._remove(path)
+
+    def prune(self):
+        """ Remove files that no longer exist from the index and return how
+            many were removed.
+        """
+        gone = [path for path in self._files if not os.path.exists(path)]
+        self.remove(gone)
+        return len(gone)
+
+    # -----------------------------------------------------------------
+    def _check_key(self, key):
+        ukey = key.upper()
+        if ukey not in self._postings:
+            raise KeyError(f"Keyword {key} is not indexed")
+        return ukey
+
+    def _locations(self, postings):
+        """ Turn sets of (fileid, hdu) into a sorted list of (path, hdu).
+        """
+        found = set()
+        for locs in postings:
+            found.update(locs)
+        return sorted((self._paths[fileid], hdu) for fileid, hdu in found)
+
+    def _sorted_values(self, key):
+        """ Return the sorted string values and sorted numeric values of a
+            key.
+        """
+        if key not in self._sorted:
+            strs = sorted(val for tag, val in self._postings[key] if tag == 'str')
+            nums = sorted(val for tag, val in self._postings[key] if tag == 'number')
+            self._sorted[key] = (strs, nums)
+        return self._sorted[key]
+
+    def query(self, key, value):
+        """ Find the HDUs where `key` equals `value`.
+
+            Returns
+            -------
+            list
+                Sorted list of (path, HDU number).
+        """
+        ukey = self._check_key(key)
+        locs = self._postings[ukey].get(_normalize(value))
+        return self._locations([locs] if locs else [])
+
+    def query_prefix(self, key, prefix):
+        """ Find the HDUs where the string value of `key` starts with
+            `prefix`.
+
+            Returns
+            -------
+            list
+                Sorted list of (path, HDU number).
+        """
+        ukey = self._check_key(key)
+        strs = self._sorted_values(ukey)[0]
+        start = bisect.bisect_left(strs, prefix)
+        stop = start
+        while stop < len(strs) and strs[stop].startswith(prefix):
+            stop += 1
+        return self._locations(self._postings[ukey][('str', val)] for val in strs[start:stop])
+
+    def query_range(self, key, low=None, high=None):
+        """ Find the HDUs where the numeric value of `key` is between `low`
+            and `high` (inclusive, ``None`` for no limit).
+
+            Returns
+            -------
+            list
+                Sorted list of (path, HDU number).
+        """
+        ukey = self._check_key(key)
+        nums = self._sorted_values(ukey)[1]
+        start = 0 if low is None else bisect.bisect_left(nums, low)
+        stop = len(nums) if high is None else bisect.bisect_right(nums, high)
+        return self._locations(self._postings[ukey][('number', val)] for val in nums[start:stop])
+
+    def values(self, key):
+        """ Return the distinct values of `key` with their number of HDUs.
+
+            Returns
+            -------
+            list
+                (value, number of HDUs) sorted by type (bool, number,
+                string) and value, a list rather than a dict as T and 1
+                are different values.
+        """
+        ukey = self._check_key(key)
+        return [(val, len(self._postings[ukey][(tag, val)]))
+                for tag, val in sorted(self._postings[ukey])]
+
+    # -----------------------------------------------------------------
+    def save(self, filename):
+        """ Write the index to a file (atomically).  The sorted values used
+            by the prefix and range queries are saved too, so a loaded index
+            does not sort them again.
+        """
+        for key in self.keys:
+            self._sorted_values(key)
+        with fitsutils.AtomicWriter(filename) as outfh:
+            pickle.dump((INDEX_VERSION, self), outfh, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, filename):
+        """ Read an index written by :meth:`save`.
+
+            Raises
+            ------
+            ValueError
+                If the file was written by an incompatible version.
+        """
+        with open(filename, 'rb') as infh:
+            version, index = pickle.load(infh)
+        if version != INDEX_VERSION or not isinstance(index, cls):
+            raise ValueError(f"{filename} is not a version {INDEX_VERSION} header index")
+        return index
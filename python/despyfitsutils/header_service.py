@@ -0,0 +1,272 @@
+"""
+    Resident header lookup service listening on a Unix domain socket
+
+    Requests and responses are single lines of JSON.  Each request is a
+    dict with an 'op' entry:
+
+        {"op": "value", "file": ..., "key": ..., "hdu": ...}
+            value of a header keyword, as fitsutils.get_hdr_value
+        {"op": "func", "file": ..., "name": "band", "hdu": ...}
+            a special metadata value, as fits_special_metadata.func_<name>
+        {"op": "header", "file": ..., "hdu": ...}
+            the full header as text, as printHeader.py
+        {"op": "stats"}
+            request counts and timings, header cache hits and misses
+        {"op": "shutdown"}
+            stop the service
+
+    The response is {"ok": true, "value": ...} or
+    {"ok": false, "error": "..."}.
+"""
+
+import os
+import json
+import time
+import socket
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from astropy.io import fits
+
+import despymisc.miscutils as miscutils
+import despyfitsutils.fitsutils as fitsutils
+import despyfitsutils.fits_special_metadata as fsm
+
+# bin/hdr_client.py uses the same default without importing this module
+SOCKET_ENV = 'DESPYFITSUTILS_HDR_SOCKET'
+
+# Seconds between checks for a shutdown while waiting for a connection
+# or for the next request on one
+POLL_INTERVAL = 0.5
+
+
+#######################################################################
+def default_socket_path():
+    """ Return the socket path from $DESPYFITSUTILS_HDR_SOCKET, or a per
+        user default in /tmp.
+    """
+    return os.environ.get(SOCKET_ENV, f"/tmp/despyfitsutils_hdr_{os.getuid():d}.sock")
+
+
+#######################################################################
+class HeaderCache:
+    """ Least recently used cache of fitsutils.HeaderList objects (of
+        CompactHeader).
+
+        Entries are keyed by the file's real path and checked against its
+        size and modification time, so files that change on disk are
+        read again.
+
+        Parameters
+        ----------
+        maxsize : int, optional
+            Maximum number of files to keep headers for, default is 256.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, filename):
+        """ Return the HeaderList for `filename`, reading it if needed.
+        """
+        path = os.path.realpath(filename)
+        stat = os.stat(path)
+        stamp = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == stamp:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        hdrs = fitsutils.HeaderList.from_file(path, compact=True)
+        with self._lock:
+            self._entries[path] = (stamp, hdrs)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return hdrs
+
+    def stats(self):
+        """ Return a dict of cache size, hits and misses.
+        """
+        with self._lock:
+            return {'size': len(self._entries), 'maxsize': self.maxsize,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+#######################################################################
+def _json_value(val):
+    """ Make a header value JSON serializable.
+    """
+    if isinstance(val, fits.card.Undefined):
+        return None
+    if isinstance(val, (str, int, float, bool)) or val is None:
+        return val
+    return str(val)
+
+
+#######################################################################
+class HeaderServer:
+    """ Answer header lookups from a warm cache over a Unix domain socket.
+
+        Parameters
+        ----------
+        socket_path : str, optional
+            The socket to listen on, default is :func:`default_socket_path`.
+
+        nworkers : int, optional
+            Number of connections handled concurrently, default is 8.
+
+        cache_size : int, optional
+            Number of files kept in the header cache, default is 256.
+    """
+
+    def __init__(self, socket_path=None, nworkers=8, cache_size=256):
+        self.socket_path = socket_path or default_socket_path()
+        self.nworkers = nworkers
+        self.cache = HeaderCache(cache_size)
+        self.started = None
+        self._timing = {}
+        self._timing_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sock = None
+
+    def _record(self, op, seconds, ok):
+        """ Add a request to the timing stats.
+        """
+        with self._timing_lock:
+            stats = self._timing.setdefault(op, {'count': 0, 'errors': 0, 'total': 0.0, 'max': 0.0})
+            stats['count'] += 1
+            stats['errors'] += 0 if ok else 1
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+
+    def stats(self):
+        """ Return request timing stats per op and header cache stats.
+        """
+        with self._timing_lock:
+            requests = {}
+            for op, stats in self._timing.items():
+                requests[op] = dict(stats, mean=stats['total'] / stats['count'])
+        return {'uptime': time.time() - self.started if self.started else 0.0,
+                'requests': requests, 'cache': self.cache.stats()}
+
+    def handle_request(self, request):
+        """ Handle one decoded request and return the response dict.
+        """
+        op = request.get('op')
+        start = time.perf_counter()
+        try:
+            if op == 'value':
+                hdrs = self.cache.get(request['file'])
+                value = _json_value(fitsutils.get_hdr_value(hdrs, request['key'], request.get('hdu')))
+            elif op == 'func':
+                hdrs = self.cache.get(request['file'])
+                value = _json_value(fsm.call_special_func(request['name'], request['file'],
+                                                          hdrs, request.get('hdu')))
+            elif op == 'header':
+                hdrs = self.cache.get(request['file'])
+                hdr = fitsutils.get_hdr(hdrs, request.get('hdu', 0))
+                value = '\n'.join(str(card) for card in hdr.cards)
+            elif op == 'stats':
+                value = self.stats()
+            elif op == 'shutdown':
+                self._stop.set()
+                value = None
+            else:
+                raise ValueError(f"Unknown op {op!r}")
+            response = {'ok': True, 'value': value}
+        except Exception as err:
+            response = {'ok': False, 'error': f"{type(err).__name__}: {err}"}
+        self._record(str(op), time.perf_counter() - start, response['ok'])
+        return response
+
+    def _read_lines(self, conn):
+        """ Yield the lines read from a connection until it is closed or
+            the service is stopped.  Reads time out every POLL_INTERVAL so
+            that an idle client does not keep the service from stopping.
+        """
+        buf = b''
+        while not self._stop.is_set():
+            try:
+                data = conn.recv(65536)
+            except socket.timeout:
+                continue
+            if not data:
+                # closed by the client, the last line may lack a newline
+                if buf:
+                    yield buf
+                return
+            buf += data
+            while b'\n' in buf:
+                line, buf = buf.split(b'\n', 1)
+                yield line
+
+    def _handle_connection(self, conn):
+        """ Answer each request line on a connection until it is closed
+            or the service is stopped.
+        """
+        with conn:
+            conn.settimeout(POLL_INTERVAL)
+            for line in self._read_lines(conn):
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError as err:
+                    response = {'ok': False, 'error': f"Bad request: {err}"}
+                else:
+                    response = self.handle_request(request)
+                conn.settimeout(None)
+                conn.sendall(json.dumps(response).encode('utf-8') + b'\n')
+                conn.settimeout(POLL_INTERVAL)
+
+    def _bind(self):
+        """ Bind the listening socket, replacing a stale socket file.
+        """
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+            except OSError:
+                os.unlink(self.socket_path)
+            else:
+                probe.close()
+                raise OSError(f"A header service is already listening on {self.socket_path}")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.socket_path)
+        sock.listen(64)
+        sock.settimeout(POLL_INTERVAL)
+        return sock
+
+    def serve_forever(self):
+        """ Accept connections until a shutdown request or :meth:`shutdown`.
+        """
+        self._sock = self._bind()
+        self.started = time.time()
+        if miscutils.fwdebug_check(1, 'FITSUTILS_DEBUG'):
+            miscutils.fwdebug_print(f"Header service listening on {self.socket_path}")
+        try:
+            with ThreadPoolExecutor(max_workers=self.nworkers) as executor:
+                while not self._stop.is_set():
+                    try:
+                        conn, _ = self._sock.accept()
+                    except socket.timeout:
+                        continue
+                    executor.submit(self._handle_connection, conn)
+        finally:
+            self._sock.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def shutdown(self):
+        """ Ask :meth:`serve_forever` to return.
+        """
+        self._stop.set()
@@ -0,0 +1,291 @@
+"""
+    Build a single table of header values from many FITS files
+"""
+
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from astropy.table import Table, MaskedColumn
+
+import despymisc.miscutils as miscutils
+import despyfitsutils.fitsutils as fitsutils
+import despyfitsutils.fits_special_metadata as fsm
+
+# Errors that mean "this file has no usable value for this key"
+MISSING_ERRORS = (KeyError, IndexError, ValueError)
+
+# Output formats understood by write_header_table, keyed by file extension
+TABLE_FORMATS = {'.fits': 'fits',
+                 '.fit': 'fits',
+                 '.parquet': 'parquet',
+                 '.csv': 'ascii.csv',
+                 '.json': 'json'}
+
+# Null of integer columns, outside the range of any header value
+INT_NULL = np.iinfo(np.int64).min
+
+# FITS logical columns cannot be written with a null through astropy, so
+# bool columns with missing values are written to FITS as int16 columns
+# (1 = T, 0 = F) with this null
+BOOL_NULL = np.iinfo(np.int16).min
+
+
+#######################################################################
+def get_column_name(key):
+    """ Return the table column name for a header key or func_* key.
+
+        Parameters
+        ----------
+        key : str
+            Header keyword (e.g. 'FILTER') or special metadata function
+            name (e.g. 'func_band').
+
+        Returns
+        -------
+        str
+            The upper case column name ('FILTER', 'BAND', ...).
+    """
+    if key.lower().startswith('func_'):
+        return key[5:].upper()
+    return key.upper()
+
+
+#######################################################################
+def _read_file_values(filename, keys, whichhdus):
+    """ Read all requested values from a single file.
+
+        Returns one row (list of values, ``None`` when missing) per
+        requested HDU.
+    """
+    hdr_keys = [key for key in keys if not key.lower().startswith('func_')]
+    rows = []
+    with fitsutils.open_headers(filename) as hdulist:
+        for whichhdu in whichhdus:
+            try:
+                hdr_values = fitsutils.get_hdr_values(hdulist, hdr_keys, whichhdu)[whichhdu]
+            except MISSING_ERRORS as err:
+                if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
+                    miscutils.fwdebug_print(f"No header {filename}[{whichhdu}]: {err}")
+                hdr_values = {}
+            row = []
+            for key in keys:
+                if key.lower().startswith('func_'):
+                    try:
+                        val = fsm.call_special_func(key, filename, hdulist, whichhdu)
+                    except MISSING_ERRORS as err:
+                        if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
+                            miscutils.fwdebug_print(f"No value for {key} in {filename}[{whichhdu}]: {err}")
+                        val = None
+                else:
+                    val = hdr_values.get(key.upper(), (None,))[0]
+                row.append(val)
+            rows.append(row)
+    return rows
+
+
+#######################################################################
+def _make_column(name, values):
+    """ Make a masked column with a dtype suited to the non-missing values.
+    """
+    mask = [val is None for val in values]
+    present = [val for val in values if val is not None]
+
+    if present and all(isinstance(val, (bool, np.bool_)) for val in present):
+        fill = False
+        dtype = bool
+    elif present and all(isinstance(val, (int, np.integer)) and not isinstance(val, (bool, np.bool_))
+                         for val in present):
+        fill = INT_NULL
+        dtype = np.int64
+    elif present and all(isinstance(val, (int, float, np.integer, np.floating)) for val in present):
+        fill = np.nan
+        dtype = np.float64
+    else:
+        fill = ''
+        dtype = str
+        values = [str(val) if val is not None else None for val in values]
+
+    data = np.array([fill if val is None else val for val in values], dtype=dtype)
+    # the fill value is what is written as TNULL to FITS tables
+    return MaskedColumn(data, name=name, mask=mask, fill_value=fill)
+
+
+#######################################################################
+def _make_fits_table(table):
+    """ Return `table` with the bool columns that have missing values
+        made int16 columns with a null, so the missing values stay missing
+        when written to FITS.
+    """
+    names = [name for name in table.colnames
+             if table[name].dtype.kind == 'b' and np.any(getattr(table[name], 'mask', False))]
+    if not names:
+        return table
+    table = table.copy(copy_data=False)
+    for name in names:
+        col = table[name]
+        table[name] = MaskedColumn(col.filled(False).astype(np.int16), name=name,
+                                   mask=col.mask, fill_value=BOOL_NULL)
+    return table
+
+
+#######################################################################
+def tabulate_headers(filenames, keys, whichhdu=None, nthreads=4):
+    """ Read header values for many files into a single table.
+
+        Headers are read concurrently, one file per task.  Keys missing
+        from a header (or that cannot be computed) are masked in the
+        output table.
+
+        Parameters
+        ----------
+        filenames : list
+            The FITS files to read.
+
+        keys : list
+            Header keywords and/or fits_special_metadata function names
+            (e.g. ``['EXPNUM', 'func_band', 'func_nite']``).
+
+        whichhdu : various or list, optional
+            The HDU to read the keys from, as in
+            :func:`fitsutils.get_hdr_value`.  If a list is given one row
+            is made per file and HDU and an HDU column is added.  The
+            default is ``None`` (primary HDU).
+
+        nthreads : int, optional
+            Number of files to read concurrently, default is 4.
+
+        Returns
+        -------
+        astropy.table.Table
+            Contains a FILENAME column and one column per key.
+    """
+    multi_hdu = isinstance(whichhdu, (list, tuple))
+    whichhdus = list(whichhdu) if multi_hdu else [whichhdu]
+
+    # check the func_* keys up front rather than in every thread
+    for key in keys:
+        if key.lower().startswith('func_'):
+            fsm.get_special_func(key)
+
+    if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
+        miscutils.fwdebug_print(f"Reading {len(keys)} keys from {len(filenames)} files using {nthreads} threads")
+
+    with ThreadPoolExecutor(max_workers=max(1, nthreads)) as executor:
+        file_rows = list(executor.map(lambda fname: _read_file_values(fname, keys, whichhdus),
+                                      filenames))
+
+    names = []
+    hdus = []
+    rows = []
+    for fname, frows in zip(filenames, file_rows):
+        for hdu, row in zip(whichhdus, frows):
+            names.append(fname)
+            hdus.append(str(hdu))
+            rows.append(row)
+
+    return build_header_table(names, keys, rows, hdus if multi_hdu else None)
+
+
+#######################################################################
+def build_header_table(filenames, keys, rows, hdus=None):
+    """ Make a table of values already read from headers.
+
+        Parameters
+        ----------
+        filenames : list
+            The file each row was read from.
+
+        keys : list
+            The header keywords and/or func_* names, one per column.
+
+        rows : list
+            One list of values per file, in the order of `keys`, with
+            ``None`` for missing values.
+
+        hdus : list, optional
+            The HDU each row was read from, if given an HDU column is
+            added.  The default is ``None``.
+
+        Returns
+        -------
+        astropy.table.Table
+            Contains a FILENAME column and one masked column per key.
+    """
+    table = Table()
+    table['FILENAME'] = list(filenames)
+    if hdus is not None:
+        table['HDU'] = list(hdus)
+    for i, key in enumerate(keys):
+        table.add_column(_make_column(get_column_name(key), [row[i] for row in rows]))
+    return table
+
+
+#######################################################################
+def _write_json_table(table, outfile, overwrite):
+    """ Write a table as JSON: {"meta": {...}, "rows": [{...}, ...]}
+    """
+    if os.path.exists(outfile) and not overwrite:
+        raise OSError(f"File {outfile} already exists")
+
+    def jsonable(val):
+        if val is np.ma.masked:
+            return None
+        if isinstance(val, np.generic):
+            return val.item()
+        return val
+
+    rows = [{name: jsonable(row[name]) for name in table.colnames} for row in table]
+    meta = {key: jsonable(val) for key, val in table.meta.items()}
+    with open(outfile, 'w') as outfh:
+        json.dump({'meta': meta, 'rows': rows}, outfh, indent=1)
+
+
+#######################################################################
+def write_header_table(table, outfile, fmt=None, overwrite=False):
+    """ Write a table made by :func:`tabulate_headers` to a file.
+
+        Parameters
+        ----------
+        table : astropy.table.Table
+            The table to write.
+
+        outfile : str
+            The output file name.
+
+        fmt : str, optional
+            One of 'fits', 'parquet', 'ascii.csv' or 'json'.  The default is
+            ``None`` in which case the format is taken from the extension
+            of `outfile`.  In FITS tables missing values are written as
+            the column's TNULL (NaN for floats, empty for strings), bool
+            columns with missing values are written as int16 columns.
+
+        overwrite : bool, optional
+            Whether to overwrite an existing file, default is ``False``.
+
+        Raises
+        ------
+        ValueError
+            If the format cannot be determined.
+    """
+    if fmt is None:
+        ext = os.path.splitext(outfile)[1].lower()
+        if ext not in TABLE_FORMATS:
+            raise ValueError(f"Cannot determine table format for {outfile}, use one of {sorted(TABLE_FORMATS)}")
+        fmt = TABLE_FORMATS[ext]
+
+    if fmt == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError("Writing parquet tables requires pyarrow") from None
+
+    if miscutils.fwdebug_check(3, 'FITSUTILS_DEBUG'):
+        miscutils.fwdebug_print(f"Writing {len(table)} rows to {outfile} ({fmt})")
+    if fmt == 'json':
+        _write_json_table(table, outfile, overwrite)
+    elif fmt == 'fits':
+        _make_fits_table(table).write(outfile, format=fmt, overwrite=overwrite)
+    else:
+        table.write(outfile, format=fmt, overwrite=overwrite)
@@ -0,0 +1,246 @@
+"""
+    Per-phase timing of the command line tools
+
+    A Profiler records wall time, CPU time, bytes read and written and
+    peak RSS for each named phase of a run (imports, argument parsing,
+    open, read, write, ...) and optionally a cProfile dump.  Library
+    functions mark their phases with::
+
+        with profiling.phase('read'):
+            ...
+
+    which does nothing unless a Profiler is active.
+
+    This module only uses the standard library, and the despyfitsutils
+    package imports fitsutils lazily, so that importing it does not change
+    what is being measured.
+"""
+
+import os
+import sys
+import time
+import json
+import resource
+import contextlib
+
+PROFILE_ENV = 'DESPYFITSUTILS_PROFILE'
+PROFILE_OUT_ENV = 'DESPYFITSUTILS_PROFILE_OUT'
+CPROFILE_ENV = 'DESPYFITSUTILS_CPROFILE'
+
+# The Profiler that phase() records to, if any
+_active = None
+
+
+#######################################################################
+def _io_counters():
+    """ Return (bytes read, bytes written) by this process so far, or
+        (None, None) if /proc/self/io is not available.
+    """
+    try:
+        with open('/proc/self/io', 'r') as iofh:
+            counters = dict(line.split(':') for line in iofh)
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def _peak_rss():
+    """ Return the peak resident set size of this process in bytes.
+    """
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def _process_age():
+    """ Return the wall time in seconds since this process started, or
+        ``None`` if it cannot be determined.
+    """
+    try:
+        with open('/proc/self/stat', 'r') as statfh:
+            # the command name may contain spaces, fields after it don't
+            fields = statfh.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime', 'r') as upfh:
+            uptime = float(upfh.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+#######################################################################
+def add_profile_args(parser):
+    """ Add the --profile, --profile-format, --profile-out and --cprofile
+        options to an argparse parser.
+    """
+    parser.add_argument('--profile', action='store_true', default=False,
+                        help=f"report time spent per phase (or set ${PROFILE_ENV})")
+    parser.add_argument('--profile-format', action='store', default=None,
+                        choices=['summary', 'json'],
+                        help=f"format of the profile report, default summary (or ${PROFILE_ENV})")
+    parser.add_argument('--profile-out', action='store', default=None,
+                        help=f"file for the profile report, default stderr (or ${PROFILE_OUT_ENV})")
+    parser.add_argument('--cprofile', action='store', default=None,
+                        help=f"write a cProfile dump to this file (or ${CPROFILE_ENV})")
+
+
+#######################################################################
+@contextlib.contextmanager
+def phase(name):
+    """ Record the enclosed code as phase `name` of the active Profiler.
+    """
+    if _active is None:
+        yield
+    else:
+        with _active.phase(name):
+            yield
+
+
+#######################################################################
+class Profiler:
+    """ Collect per-phase timing for one run of a program.
+
+        Creating the Profiler records everything since the process started
+        (interpreter start up and imports) as the 'imports' phase, so it
+        should be created first thing in main().
+
+        Parameters
+        ----------
+        program : str
+            Name of the program, used in the report.
+    """
+
+    def __init__(self, program):
+        self.program = program
+        self.enabled = False
+        self.fmt = 'summary'
+        self.outfile = None
+        self.cprofile_file = None
+        self._cprofile = None
+        self.phases = {}
+        self._depth = 0
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._start_io = _io_counters()
+
+        age = _process_age()
+        self._add('imports', age, self._start_cpu, self._start_io[0], self._start_io[1])
+        self._mark = (self._start_wall, self._start_cpu, self._start_io)
+
+    def _add(self, name, wall, cpu, nread, nwritten):
+        """ Add measurements to a phase, creating it if needed.
+        """
+        stats = self.phases.setdefault(name, {'calls': 0, 'wall': 0.0, 'cpu': 0.0,
+                                              'read_bytes': 0, 'write_bytes': 0})
+        stats['calls'] += 1
+        for key, val in (('wall', wall), ('cpu', cpu), ('read_bytes', nread), ('write_bytes', nwritten)):
+            if val is None or stats[key] is None:
+                stats[key] = None
+            else:
+                stats[key] += val
+        stats['peak_rss'] = _peak_rss()
+
+    def mark(self, name):
+        """ Record everything since the previous mark (or since the
+            Profiler was created) as phase `name`.
+        """
+        wall, cpu, (nread, nwritten) = time.perf_counter(), time.process_time(), _io_counters()
+        last_wall, last_cpu, (last_read, last_written) = self._mark
+        self._add(name, wall - last_wall, cpu - last_cpu,
+                  None if nread is None else nread - last_read,
+                  None if nwritten is None else nwritten - last_written)
+        self._mark = (wall, cpu, (nread, nwritten))
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """ Record the enclosed code as phase `name`.  Nested phases are
+            only counted in the outermost one.
+        """
+        self._depth += 1
+        if self._depth == 1:
+            self.mark('other')
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self.mark(name)
+
+    def start(self, args=None):
+        """ Decide from the parsed arguments (or the environment) whether to
+            report, and start recording library phases.
+
+            Parameters
+            ----------
+            args : argparse.Namespace or dict, optional
+                Arguments from a parser given to :func:`add_profile_args`.
+        """
+        global _active
+
+        self.mark('args')
+        if args is None:
+            args = {}
+        elif not isinstance(args, dict):
+            args = vars(args)
+        env = os.environ.get(PROFILE_ENV)
+        if args.get('profile') or env:
+            self.enabled = True
+            fmt = args.get('profile_format') or env or 'summary'
+            self.fmt = 'json' if fmt.lower() == 'json' else 'summary'
+        self.outfile = args.get('profile_out') or os.environ.get(PROFILE_OUT_ENV)
+        self.cprofile_file = args.get('cprofile') or os.environ.get(CPROFILE_ENV)
+        if self.cprofile_file:
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        _active = self
+
+    def stop(self):
+        """ Stop recording and write the report and cProfile dump if
+            requested.
+        """
+        global _active
+
+        self.mark('other')
+        if _active is self:
+            _active = None
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.cprofile_file)
+            self._cprofile = None
+        if self.enabled:
+            if self.outfile:
+                with open(self.outfile, 'w') as outfh:
+                    self.write_report(outfh)
+            else:
+                self.write_report(sys.stderr)
+
+    def report(self):
+        """ Return the measurements as a dict.
+        """
+        totals = {}
+        for key in ('wall', 'cpu', 'read_bytes', 'write_bytes'):
+            vals = [stats[key] for stats in self.phases.values()]
+            totals[key] = None if None in vals else sum(vals)
+        totals['peak_rss'] = _peak_rss()
+        return {'program': self.program, 'pid': os.getpid(),
+                'total': totals, 'phases': self.phases}
+
+    def write_report(self, outfh):
+        """ Write the report as JSON or as a short table.
+        """
+        report = self.report()
+        if self.fmt == 'json':
+            json.dump(report, outfh, indent=2)
+            outfh.write('\n')
+            return
+
+        def fmt_num(val, scale=1.0, spec='.3f'):
+            return '-' if val is None else format(val / scale, spec)
+
+        outfh.write(f"# Profile of {self.program}\n")
+        outfh.write(f"# {'phase':<10} {'calls':>5} {'wall(s)':>9} {'cpu(s)':>9} {'read(MB)':>10} {'write(MB)':>10}\n")
+        for name, stats in list(report['phases'].items()) + [('total', report['total'])]:
+            outfh.write(f"  {name:<10} {stats.get('calls', ''):>5} {fmt_num(stats['wall']):>9} "
+                        f"{fmt_num(stats['cpu']):>9} {fmt_num(stats['read_bytes'], 1e6, '.2f'):>10} "
+                        f"{fmt_num(stats['write_bytes'], 1e6, '.2f'):>10}\n")
+        outfh.write(f"# peak RSS {report['total']['peak_rss'] / 1e6:.1f} MB\n")
@@ -12,6 +12,7 @@ setup(name='despyfitsutils',
       author_email = "felipe@illinois.edu",
       packages = ['despyfitsutils'],
       package_dir = {'': 'python'},
+      package_data = {'despyfitsutils': ['golden/*.json']},
       scripts = bin_files,
       data_files=[('ups',['ups/despyfitsutils.table']),]
       )
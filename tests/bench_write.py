@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+"""
+Write throughput of fitsutils.AtomicWriter for different buffer sizes
+
+Not run by the test suite, run by hand on the disk to be measured, e.g.
+
+    python bench_write.py --outdir /scratch/me --size 1024
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy
+from astropy.io import fits
+import despyfitsutils.fitsutils as fitsutils
+
+def bench(hdulist, outname, buffer_size, direct, repeat):
+    """ Return the best write time over repeat writes """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with fitsutils.AtomicWriter(outname, buffer_size=buffer_size, direct=direct) as outfh:
+            hdulist.writeto(outfh)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    """ Entry point """
+    parser = argparse.ArgumentParser(description='Benchmark fitsutils.AtomicWriter')
+    parser.add_argument('--outdir', action='store', default=None,
+                        help='directory on the disk to test (default a temporary directory)')
+    parser.add_argument('--size', action='store', type=int, default=256,
+                        help='size in MB of the file to write')
+    parser.add_argument('--buffers', action='store', default='65536,1048576,4194304,16777216,67108864',
+                        help='comma separated buffer sizes in bytes')
+    parser.add_argument('--repeat', action='store', type=int, default=3)
+    args = parser.parse_args()
+
+    outdir = tempfile.mkdtemp(dir=args.outdir)
+    try:
+        npix = args.size * 1024 * 1024 // 4
+        nrow = npix // 4096
+        data = numpy.random.default_rng(0).normal(size=(nrow, 4096)).astype('f4')
+        hdulist = fits.HDUList([fits.PrimaryHDU(data)])
+        outname = os.path.join(outdir, 'bench.fits')
+
+        start = time.perf_counter()
+        hdulist.writeto(outname, overwrite=True)
+        os.sync()
+        plain = time.perf_counter() - start
+        nbytes = os.path.getsize(outname)
+        print(f"# {nbytes / 1e6:.1f} MB to {outdir}, best of {args.repeat:d}")
+        print(f"{'writer':<12} {'buffer':>10} {'seconds':>9} {'MB/s':>9}")
+        print(f"{'writeto':<12} {'-':>10} {plain:>9.3f} {nbytes / plain / 1e6:>9.1f}")
+
+        for direct in (False, True):
+            for buffer_size in [int(b) for b in args.buffers.split(',')]:
+                elapsed = bench(hdulist, outname, buffer_size, direct, args.repeat)
+                name = 'atomic+dio' if direct else 'atomic'
+                print(f"{name:<12} {buffer_size:>10d} {elapsed:>9.3f} {nbytes / elapsed / 1e6:>9.1f}")
+    finally:
+        shutil.rmtree(outdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
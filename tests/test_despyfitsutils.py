@@ -4,16 +4,40 @@ import unittest
 import os
 import sys
 import copy
+import fcntl
 import shutil
+import socket
+import subprocess
 import filecmp
+import tempfile
+import threading
+import tracemalloc
 from contextlib import contextmanager
 from io import StringIO
 
+import numpy
+
 import combine_cats as ccats
 import split_head as splith
+import split_cats as splitc
+import despyfitsutils.fitsutils as fitsutils
 import despyfitsutils.fits_special_metadata as fsm
 from astropy.io import fits
+from astropy.table import Table
 import printHeader as phdr
+import despyfitsutils.header_table as htable
+import despyfitsutils.header_service as hservice
+import despyfitsutils.profiling as profiling
+import json
+import hdr_client
+import fitscombine
+import fitssplit
+import despyfitsutils.header_index as hindex
+import hdr_index
+import despyfitsutils.bytesource as bytesource
+import despyfitsutils.corpus as corpus
+import fits_corpus
+import despymisc.create_special_metadata as spmeta
 #class TestFitsutils(unittest.TestCase):
 #    def test_combine(self):
 #        pass
@@ -30,6 +54,56 @@ def capture_output():
     finally:
         sys.stdout, sys.stderr = old_out, old_err
 
+def write_test_image(filename, shape=(4, 5), **cards):
+    """ Write a small single HDU image with the given header cards """
+    hdu = fits.PrimaryHDU(numpy.arange(shape[0] * shape[1], dtype='f4').reshape(shape))
+    for key, val in cards.items():
+        hdu.header[key.replace('_', '-')] = val
+    hdu.writeto(filename)
+
+def write_test_fz(filename, shape=(200, 100), **cards):
+    """ Write a tile compressed image (.fz) with the given header cards """
+    hdu = fits.CompImageHDU(numpy.arange(shape[0] * shape[1], dtype='f4').reshape(shape), name='SCI')
+    for key, val in cards.items():
+        hdu.header[key.replace('_', '-')] = val
+    fits.HDUList([fits.PrimaryHDU(), hdu]).writeto(filename)
+
+def write_test_cat(filename, nobjects, seed=0, **cards):
+    """ Write a small LDAC style catalog (primary, LDAC_IMHEAD, LDAC_OBJECTS) """
+    rng = numpy.random.default_rng(seed)
+    imhdr = fits.Header()
+    imhdr['FILTER'] = 'i DECam SDSS c0003 7835.0 1470.0'
+    imhdr['DATE-OBS'] = '2016-10-19T03:15:22.123456'
+    imhdr['OBJECT'] = 'DES survey hex -159-521 tiling 1'
+    for key, val in cards.items():
+        imhdr[key.replace('_', '-')] = val
+    cardstr = [str(card) for card in imhdr.cards] + ['END'.ljust(80)]
+    imhead = fits.BinTableHDU.from_columns(
+        [fits.Column(name='Field Header Card', format=f'{80*len(cardstr):d}A',
+                     dim=f'(80, {len(cardstr):d})', array=numpy.array([cardstr]))])
+    imhead.header['EXTNAME'] = 'LDAC_IMHEAD'
+    objects = fits.BinTableHDU.from_columns(
+        [fits.Column(name='NUMBER', format='J', array=numpy.arange(1, nobjects + 1)),
+         fits.Column(name='ALPHAWIN_J2000', format='D', array=rng.uniform(0, 360, nobjects)),
+         fits.Column(name='DELTAWIN_J2000', format='D', array=rng.uniform(-90, 0, nobjects)),
+         fits.Column(name='MAG_AUTO', format='E', array=rng.uniform(14, 25, nobjects)),
+         fits.Column(name='FLAGS', format='I', array=rng.integers(0, 4, nobjects))])
+    objects.header['EXTNAME'] = 'LDAC_OBJECTS'
+    fits.HDUList([fits.PrimaryHDU(), imhead, objects]).writeto(filename)
+
+def write_test_scamp_head(filename, nheads, ncards=20):
+    """ Write a combined SCAMP head file with nheads heads, returning the text of each """
+    heads = []
+    for i in range(nheads):
+        lines = ['HISTORY   Astrometric solution by SCAMP version 2.0.4 (2016-10-19)']
+        for j in range(ncards):
+            lines.append(f"PV1_{j:<4d}=   {1e-3 * (i + 1) * (j + 1):.12E} / Projection distortion parameter")
+        lines.append('END     ')
+        heads.append(''.join(line.ljust(80) + '\n' for line in lines))
+    with open(filename, 'w') as headfh:
+        headfh.write(''.join(heads))
+    return heads
+
 class TestCobmineCats(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -59,12 +133,12 @@ class TestCobmineCats(unittest.TestCase):
         with capture_output() as (out, err):
             ccats.main()
             output = out.getvalue().strip()
-            self.assertFalse('Removing' in output)
+            self.assertFalse('Replacing' in output)
 
         with capture_output() as (out, err):
             ccats.main()
             output = out.getvalue().strip()
-            self.assertTrue('Removing' in output)
+            self.assertTrue('Replacing' in output)
 
         sys.argv = temp
 
@@ -105,6 +179,633 @@ class TestCobmineCats(unittest.TestCase):
         sys.argv = temp
 
 
+class TestSplitCats(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.incats = []
+        for i in range(3):
+            fname = os.path.join(self.tmpdir, f"cat{i:d}.fits")
+            write_test_cat(fname, 10 + i, seed=i)
+            self.incats.append(fname)
+        self.fullcat = os.path.join(self.tmpdir, 'fullcat.fits')
+        fitsutils.combine_cats(','.join(self.incats), self.fullcat)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_hdu_toc(self):
+        toc = fitsutils.get_hdu_toc(self.fullcat)
+        with fits.open(self.fullcat) as hdulist:
+            self.assertEqual(len(toc), len(hdulist))
+            for i, entry in enumerate(toc):
+                info = hdulist.fileinfo(i)
+                self.assertEqual(entry['hdrLoc'], info['hdrLoc'])
+                self.assertEqual(entry['datLoc'], info['datLoc'])
+                self.assertEqual(entry['datSpan'], info['datSpan'])
+
+    def test_split(self):
+        outcats = [os.path.join(self.tmpdir, f"out{i:d}.fits") for i in range(3)]
+        fitsutils.split_cats(self.fullcat, ','.join(outcats), nthreads=2)
+        for incat, outcat in zip(self.incats, outcats):
+            with fits.open(incat) as orig, fits.open(outcat, checksum=True) as new:
+                self.assertEqual(len(new), 3)
+                self.assertTrue(isinstance(new[0], fits.PrimaryHDU))
+                self.assertEqual(new[2].header['EXTNAME'], 'LDAC_OBJECTS')
+                self.assertTrue(numpy.array_equal(orig[2].data, new[2].data))
+                self.assertEqual(fitsutils.get_ldac_imhead_as_hdr(new[1])['FILTER'],
+                                 fitsutils.get_ldac_imhead_as_hdr(orig[1])['FILTER'])
+
+    def test_commandline(self):
+        listfile = os.path.join(self.tmpdir, 'split.list')
+        outcats = [os.path.join(self.tmpdir, f"out{i:d}.fits") for i in range(3)]
+        with open(listfile, 'w') as listfh:
+            listfh.write('\n'.join(outcats) + '\n')
+        temp = copy.deepcopy(sys.argv)
+        sys.argv = ['split_cats.py', '--incat', self.fullcat, '--list', listfile]
+        with capture_output():
+            splitc.main()
+        sys.argv = temp
+        for outcat in outcats:
+            self.assertTrue(os.path.exists(outcat))
+
+        self.assertRaises(ValueError, fitsutils.split_cats, self.fullcat, ','.join(outcats[:2]))
+
+class TestCatalogSubset(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.incats = []
+        for i in range(2):
+            fname = os.path.join(self.tmpdir, f"cat{i:d}.fits")
+            write_test_cat(fname, 100, seed=i)
+            self.incats.append(fname)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_read_catalog(self):
+        hdu = fitsutils.read_catalog(self.incats[0], ['mag_auto', 'NUMBER'], rows=slice(10, 20))
+        self.assertEqual(hdu.columns.names, ['MAG_AUTO', 'NUMBER'])
+        self.assertEqual(list(hdu.data['NUMBER']), list(range(11, 21)))
+        self.assertEqual(hdu.header['EXTNAME'], 'LDAC_OBJECTS')
+        self.assertEqual(hdu.header['TFIELDS'], 2)
+
+        hdu = fitsutils.read_catalog(self.incats[0], row_filter=lambda data: data['FLAGS'] == 0)
+        self.assertEqual(len(hdu.columns), 5)
+        self.assertTrue(numpy.all(hdu.data['FLAGS'] == 0))
+        self.assertRaises(ValueError, fitsutils.read_catalog, self.incats[0], ['NOSUCHCOL'])
+
+    def test_combine(self):
+        outcat = os.path.join(self.tmpdir, 'fullcat.fits')
+        temp = copy.deepcopy(sys.argv)
+        sys.argv = ['combine_cats.py', '--outcat', outcat, '--incats', ','.join(self.incats),
+                    '--columns', 'NUMBER,ALPHAWIN_J2000,DELTAWIN_J2000']
+        with capture_output():
+            ccats.main()
+        sys.argv = temp
+        with fits.open(outcat) as hdulist:
+            self.assertEqual(len(hdulist), 6)
+            self.assertEqual(hdulist[5].columns.names, ['NUMBER', 'ALPHAWIN_J2000', 'DELTAWIN_J2000'])
+            self.assertEqual(hdulist[5].header['NAXIS2'], 100)
+
+        fitsutils.combine_cats(','.join(self.incats), outcat, columns=['NUMBER'],
+                               row_filter=lambda data: data['NUMBER'] <= 10)
+        with fits.open(outcat) as hdulist:
+            self.assertEqual(list(hdulist[2].data['NUMBER']), list(range(1, 11)))
+
+class TestAtomicWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.outname = os.path.join(self.tmpdir, 'out.fits')
+        self.hdulist = fits.HDUList([fits.PrimaryHDU(numpy.arange(100000, dtype='f4').reshape(100, 1000))])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_write(self):
+        for direct in (False, True):
+            with fitsutils.AtomicWriter(self.outname, buffer_size=65536, direct=direct) as outfh:
+                self.hdulist.writeto(outfh)
+            self.assertTrue(numpy.array_equal(fits.getdata(self.outname), self.hdulist[0].data))
+            self.assertEqual(os.listdir(self.tmpdir), ['out.fits'])
+        self.assertTrue(os.stat(self.outname).st_mode & 0o044)
+
+    @unittest.skipUnless(hasattr(os, 'O_DIRECT'), 'needs O_DIRECT')
+    def test_direct_flush(self):
+        data = bytes(range(256)) * 100
+        with fitsutils.AtomicWriter(self.outname, buffer_size=65536, direct=True) as outfh:
+            if not fcntl.fcntl(outfh.fileno(), fcntl.F_GETFL) & os.O_DIRECT:
+                self.skipTest('file system does not support O_DIRECT')
+            # astropy flushes after the first header block
+            outfh.write(data[:2880])
+            outfh.flush()
+            outfh.write(data[2880:])
+            outfh.flush()
+            self.assertTrue(fcntl.fcntl(outfh.fileno(), fcntl.F_GETFL) & os.O_DIRECT)
+            self.assertEqual(os.fstat(outfh.fileno()).st_size % fitsutils.DIRECT_IO_ALIGNMENT, 0)
+        with open(self.outname, 'rb') as infh:
+            self.assertEqual(infh.read(), data)
+
+    def test_failure(self):
+        with open(self.outname, 'w') as outfh:
+            outfh.write('original')
+        with self.assertRaises(RuntimeError):
+            with fitsutils.AtomicWriter(self.outname) as outfh:
+                outfh.write(b'partial')
+                raise RuntimeError('crash')
+        with open(self.outname, 'r') as outfh:
+            self.assertEqual(outfh.read(), 'original')
+        self.assertEqual(os.listdir(self.tmpdir), ['out.fits'])
+        self.assertRaises(FileExistsError, fitsutils.AtomicWriter(self.outname, overwrite=False).__enter__)
+
+class TestCombineMetadata(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.incats = []
+        for i in range(3):
+            fname = os.path.join(self.tmpdir, f"cat{i:d}.fits")
+            write_test_cat(fname, 10 * (i + 1), seed=i)
+            self.incats.append(fname)
+        self.outcat = os.path.join(self.tmpdir, 'fullcat.fits')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_metadata(self):
+        sidecar = os.path.join(self.tmpdir, 'fullcat.json')
+        table = fitsutils.combine_cats(','.join(self.incats), self.outcat,
+                                       metadata=['band', 'func_nite', 'objects', 'tradeg'],
+                                       metadata_out=sidecar)
+        self.assertEqual(list(table['OBJECTS']), [10, 20, 30])
+        self.assertEqual(list(table['BAND']), ['i'] * 3)
+        self.assertEqual(table['NITE'][0], fsm.func_nite(self.incats[0], None, 'LDAC_IMHEAD'))
+        self.assertTrue(numpy.all(table['TRADEG'].mask))
+
+        with open(sidecar, 'r') as fh:
+            report = json.load(fh)
+        self.assertEqual(report['meta'], {'NCATS': 3, 'OBJECTS': 60})
+        self.assertEqual(report['rows'][1]['FILENAME'], self.incats[1])
+        self.assertEqual(report['rows'][1]['TRADEG'], None)
+
+    def test_commandline(self):
+        sidecar = os.path.join(self.tmpdir, 'fullcat_meta.fits')
+        temp = copy.deepcopy(sys.argv)
+        sys.argv = ['combine_cats.py', '--outcat', self.outcat, '--incats', ','.join(self.incats),
+                    '--metadata', 'objects,field', '--metadata-out', sidecar]
+        with capture_output():
+            ccats.main()
+        sys.argv = temp
+        with fits.open(sidecar) as hdulist:
+            self.assertEqual(hdulist[1].header['OBJECTS'], 60)
+            self.assertEqual(list(hdulist[1].data['OBJECTS']), [10, 20, 30])
+
+class TestAppendCats(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.incats = []
+        for i in range(4):
+            fname = os.path.join(self.tmpdir, f"cat{i:d}.fits")
+            write_test_cat(fname, 10 * (i + 1), seed=i)
+            self.incats.append(fname)
+        self.outcat = os.path.join(self.tmpdir, 'fullcat.fits')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def check_outcat(self, nobjects):
+        with fits.open(self.outcat) as hdulist:
+            self.assertEqual(len(hdulist), 3 * len(nobjects))
+            self.assertEqual([len(hdulist[i].data) for i in range(2, len(hdulist), 3)], nobjects)
+            for i, n in enumerate(nobjects):
+                with fits.open(self.incats[n // 10 - 1]) as incat:
+                    numpy.testing.assert_array_equal(hdulist[3 * i + 2].data, incat[2].data)
+
+    def test_append(self):
+        table = fitsutils.combine_cats(','.join(self.incats[:2]), self.outcat, append=True, metadata=['objects'])
+        self.assertEqual(list(table['OBJECTS']), [10, 20])
+        self.check_outcat([10, 20])
+
+        # repeats are skipped, only the new catalogs are added
+        table = fitsutils.combine_cats(','.join(self.incats[1:]), self.outcat, append=True, metadata=['objects'])
+        self.assertEqual(list(table['OBJECTS']), [30, 40])
+        self.check_outcat([10, 20, 30, 40])
+        self.assertEqual(fitsutils.combine_cats(self.incats[0], self.outcat, append=True, metadata=['objects']).meta,
+                         {'NCATS': 0, 'OBJECTS': 0})
+
+        manifest = fitsutils.read_append_manifest(self.outcat)
+        self.assertEqual([entry['name'] for entry in manifest['inputs']], self.incats)
+        self.assertEqual(manifest['size'], os.path.getsize(self.outcat))
+
+    def test_partial_and_existing(self):
+        # a catalog made by combine_cats, with an interrupted write at the end
+        fitsutils.combine_cats(self.incats[0], self.outcat)
+        with open(self.outcat, 'ab') as outfh:
+            outfh.write(b'SIMPLE  =' + b' ' * 6000)
+        fitsutils.append_cats(self.incats[1:2], self.outcat)
+        self.check_outcat([10, 20])
+
+        with open(self.outcat, 'ab') as outfh:
+            outfh.write(b'\0' * 100)
+        fitsutils.append_cats(self.incats[2:3], self.outcat)
+        self.check_outcat([10, 20, 30])
+
+        other = os.path.join(self.tmpdir, 'image.fits')
+        write_test_image(other)
+        self.assertRaises(ValueError, fitsutils.append_cats, [other], self.outcat)
+        self.assertRaises(ValueError, fitsutils.combine_cats, self.incats[3], self.outcat,
+                          columns=['NUMBER'], append=True)
+
+    def test_rebuilt(self):
+        fitsutils.combine_cats(','.join(self.incats[:3]), self.outcat, append=True)
+        manname = self.outcat + fitsutils.APPEND_MANIFEST_SUFFIX
+        shutil.copy(manname, manname + '.old')
+
+        # a rebuild removes the manifest
+        fitsutils.combine_cats(self.incats[0], self.outcat)
+        self.assertIsNone(fitsutils.read_append_manifest(self.outcat))
+        fitsutils.combine_cats(self.incats[1], self.outcat, append=True)
+        self.check_outcat([10, 20])
+
+        # a stale manifest larger than the file, or not at its end, is ignored
+        for incats, nobjects in [(self.incats[:1], [10]), (self.incats[:2], [10, 20])]:
+            fitsutils.combine_cats(','.join(incats), self.outcat)
+            shutil.copy(manname + '.old', manname)
+            fitsutils.append_cats(self.incats[3:], self.outcat)
+            self.check_outcat(nobjects + [40])
+            with fits.open(self.outcat) as hdulist:
+                hdulist.verify('exception')
+
+    def test_concurrent(self):
+        threads = [threading.Thread(target=fitsutils.append_cats, args=([incat], self.outcat))
+                   for incat in self.incats]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        manifest = fitsutils.read_append_manifest(self.outcat)
+        self.assertEqual(sorted(entry['name'] for entry in manifest['inputs']), self.incats)
+        with fits.open(self.outcat) as hdulist:
+            self.assertEqual(len(hdulist), 12)
+            self.assertEqual(sorted(len(hdulist[i].data) for i in range(2, 12, 3)), [10, 20, 30, 40])
+
+
+class TestMEFBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.inputs = []
+        for i in range(2):
+            names = []
+            for ext in ('sci', 'wgt', 'msk'):
+                fname = os.path.join(self.tmpdir, f"tile{i:d}_{ext}.fits")
+                write_test_image(fname, TILENAME=f"DES{i:04d}")
+                names.append(fname)
+            self.inputs.append(names)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_csv_manifest(self):
+        manifest = os.path.join(self.tmpdir, 'manifest.csv')
+        with open(manifest, 'w') as manfh:
+            manfh.write('outname,filename,extname\n')
+            for i, names in enumerate(self.inputs):
+                for fname, ext in zip(names, ('SCI', 'WGT', 'MSK')):
+                    manfh.write(f"{self.tmpdir}/tile{i:d}.fits,{fname},{ext}\n")
+            manfh.write(f"{self.tmpdir}/bad.fits,{self.tmpdir}/nosuchfile.fits,SCI\n")
+
+        jobs = fitsutils.read_mef_manifest(manifest)
+        self.assertEqual(len(jobs), 3)
+        self.assertEqual(jobs[0]['extnames'], ['SCI', 'WGT', 'MSK'])
+
+        results = fitsutils.make_mef_batch(jobs, nproc=2, mem_limit=1)
+        self.assertEqual([r['status'] for r in results], ['ok', 'ok', 'failed'])
+        with fits.open(os.path.join(self.tmpdir, 'tile1.fits')) as hdulist:
+            self.assertEqual(len(hdulist), 3)
+            self.assertEqual(hdulist[1].header['DES_EXT'], 'WEIGHT')
+
+        results = fitsutils.make_mef_batch(jobs[:1])
+        self.assertEqual(results[0]['status'], 'skipped')
+
+    def test_manifest_not_adjacent(self):
+        manifest = os.path.join(self.tmpdir, 'manifest.csv')
+        with open(manifest, 'w') as manfh:
+            manfh.write('outname,filename\n')
+            manfh.write(f"out1.fits,{self.inputs[0][0]}\n")
+            manfh.write(f"out2.fits,{self.inputs[1][0]}\n")
+            manfh.write(f"out1.fits,{self.inputs[0][1]}\n")
+        jobs = fitsutils.read_mef_manifest(manifest)
+        self.assertEqual([job['outname'] for job in jobs], ['out1.fits', 'out2.fits'])
+        self.assertEqual(jobs[0]['filenames'], self.inputs[0][:2])
+
+        manifest = os.path.join(self.tmpdir, 'manifest.json')
+        with open(manifest, 'w') as manfh:
+            json.dump([{'outname': 'out1.fits', 'filenames': self.inputs[0]},
+                       {'outname': 'out1.fits', 'filenames': self.inputs[1]}], manfh)
+        self.assertRaises(ValueError, fitsutils.read_mef_manifest, manifest)
+
+    def test_stats(self):
+        jobs = [{'outname': os.path.join(self.tmpdir, 'tile0.fits'), 'filenames': self.inputs[0],
+                 'extnames': ['SCI', 'WGT', 'MSK']}]
+        results = fitsutils.make_mef_batch(jobs, nproc=1, stats=True)
+        self.assertEqual(results[0]['status'], 'ok')
+        with fits.open(jobs[0]['outname']) as hdulist:
+            self.assertTrue('PIXMEAN' in hdulist[0].header)
+            self.assertTrue('WGTSUM' in hdulist[1].header)
+
+        temp = copy.deepcopy(sys.argv)
+        sys.argv = ['fitscombine.py', '--manifest', 'manifest.json', '--stats-file', 'stats.csv']
+        with capture_output():
+            self.assertRaises(SystemExit, fitscombine.main)
+        sys.argv = temp
+
+    def test_worker_died(self):
+        jobs = [{'outname': os.path.join(self.tmpdir, f'tile{i:d}.fits'), 'filenames': self.inputs[i % 2],
+                 'extnames': None} for i in range(4)]
+        reported = []
+        # the forked workers see the replaced makeMEF
+        make_mef = fitsutils.makeMEF
+        fitsutils.makeMEF = lambda **kwargs: os._exit(1)
+        try:
+            results = fitsutils.make_mef_batch(jobs, nproc=1, callback=reported.append)
+        finally:
+            fitsutils.makeMEF = make_mef
+        self.assertEqual([r['status'] for r in results], ['failed'] * 4)
+        self.assertTrue(all('BrokenProcessPool' in r['error'] for r in results))
+        self.assertEqual(len(reported), 4)
+
+    def test_json_commandline(self):
+        manifest = os.path.join(self.tmpdir, 'manifest.json')
+        report = os.path.join(self.tmpdir, 'report.json')
+        with open(manifest, 'w') as manfh:
+            json.dump([{'outname': os.path.join(self.tmpdir, 'tile0.fits'), 'filenames': self.inputs[0],
+                        'extnames': ['SCI', 'WGT', 'MSK']},
+                       {'outname': os.path.join(self.tmpdir, 'tile1.fits'), 'filenames': self.inputs[1],
+                        'extnames': ['SCI']}], manfh)
+        temp = copy.deepcopy(sys.argv)
+        sys.argv = ['fitscombine.py', '--manifest', manifest, '--nproc', '2', '--report', report]
+        with capture_output() as (out, _):
+            with self.assertRaises(SystemExit) as ctx:
+                fitscombine.main()
+            self.assertEqual(ctx.exception.code, 1)
+            self.assertTrue('1 of 2 done, 1 failed' in out.getvalue())
+        sys.argv = temp
+        with open(report, 'r') as reportfh:
+            results = json.load(reportfh)
+        self.assertEqual(results[0]['status'], 'ok')
+        self.assertTrue("number of extension names" in results[1]['error'])
+
+class TestMEFPixelStats(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        rng = numpy.random.default_rng(1)
+        sci = rng.normal(10, 2, (60, 40)).astype('f4')
+        sci[0, :4] = numpy.nan
+        wgt = rng.uniform(0, 1, (60, 40)).astype('f4')
+        wgt[:6] = 0
+        msk = (rng.uniform(size=(60, 40)) > 0.9).astype('uint16') * 4
+        self.arrays = [sci, wgt, msk]
+        self.inputs = []
+        for ext, data in zip(('sci', 'wgt', 'msk'), self.arrays):
+            fname = os.path.join(self.tmpdir, f"{ext}.fits")
+            fits.PrimaryHDU(data).writeto(fname)
+            self.inputs.append(fname)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_stats(self):
+        plain = os.path.join(self.tmpdir, 'plain.fits')
+        outname = os.path.join(self.tmpdir, 'stats.fits')
+        statsfile = os.path.join(self.tmpdir, 'stats.csv')
+        fitsutils.makeMEF(filenames=self.inputs, outname=plain, extnames=['SCI', 'WGT', 'MSK'])
+        mef = fitsutils.makeMEF(filenames=self.inputs, outname=outname, extnames=['SCI', 'WGT', 'MSK'],
+                                stats=True, stats_file=statsfile)
+
+        sci, wgt, msk = self.arrays
+        with fits.open(plain) as plainlist, fits.open(outname) as hdulist:
+            for plainhdu, hdu in zip(plainlist, hdulist):
+                for card in plainhdu.header.cards:
+                    self.assertEqual(hdu.header[card.keyword], card.value)
+                numpy.testing.assert_array_equal(hdu.data, plainhdu.data)
+            hdr = hdulist['SCI'].header
+            self.assertAlmostEqual(hdr['PIXMEAN'], numpy.nanmean(sci, dtype='f8'))
+            self.assertAlmostEqual(hdr['PIXMED'], numpy.nanmedian(sci))
+            self.assertAlmostEqual(hdr['PIXFBAD'], 4 / sci.size)
+            self.assertTrue(abs(hdr['PIXCMEAN'] - 10) < 0.2)
+            self.assertAlmostEqual(hdulist['WGT'].header['WGTSUM'], wgt.sum(dtype='f8'), places=3)
+            self.assertAlmostEqual(hdulist['WGT'].header['WGTFZERO'], 0.1)
+            self.assertAlmostEqual(hdulist['MSK'].header['MSKFRAC'], numpy.mean(msk > 0))
+        self.assertEqual(mef.pixel_stats[2], {'MSKFRAC': hdulist['MSK'].header['MSKFRAC']})
+        self.assertEqual(mef.pixel_stats[0]['PIXFBAD'], 4 / sci.size)
+
+        table = Table.read(statsfile)
+        self.assertEqual(list(table['EXTNAME']), ['SCI', 'WGT', 'MSK'])
+        self.assertTrue(table['PIXMED'].mask[1])
+
+    def test_subsample(self):
+        pstats = fitsutils.PixelStats(1000, sample_size=100)
+        for start in range(0, 1000, 300):
+            pstats.update(numpy.arange(start, min(start + 300, 1000), dtype='f4'))
+        vals = pstats.result()
+        self.assertEqual(pstats.stride, 10)
+        self.assertEqual(vals['PIXMED'], numpy.median(numpy.arange(0, 1000, 10)))
+        self.assertEqual(vals['PIXMEAN'], 499.5)
+        self.assertEqual(vals['PIXMAX'], 999)
+        self.assertEqual(vals['PIXFBAD'], 0.0)
+
+        pstats = fitsutils.PixelStats(10, kind='MASK')
+        pstats.update(numpy.zeros(10, dtype='i2'))
+        self.assertEqual(pstats.result()['MSKFRAC'], 0.0)
+
+
+class TestSplitMEF(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.mefs = []
+        for i in range(2):
+            names = []
+            for ext in ('sci', 'wgt', 'msk'):
+                fname = os.path.join(self.tmpdir, f"flat{i:d}_{ext}.fits")
+                write_test_image(fname, shape=(30, 20), TILENAME=f"DES{i:04d}")
+                names.append(fname)
+            outname = os.path.join(self.tmpdir, f"tile{i:d}.fits")
+            fitsutils.makeMEF(filenames=names, outname=outname, extnames=['SCI', 'WGT', 'MSK'])
+            self.mefs.append(outname)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_split(self):
+        outnames = fitsutils.split_mef(self.mefs[0], ['IMAGE', 'MSK'])
+        self.assertEqual(outnames, [os.path.join(self.tmpdir, 'tile0_sci.fits'),
+                                    os.path.join(self.tmpdir, 'tile0_msk.fits')])
+        with fits.open(self.mefs[0]) as mef, fits.open(outnames[1]) as flat:
+            self.assertEqual(len(flat), 1)
+            self.assertEqual(flat[0].header['DES_EXT'], 'MASK')
+            self.assertEqual(flat[0].header['TILENAME'], 'DES0000')
+            numpy.testing.assert_array_equal(flat[0].data, mef['MSK'].data)
+
+        self.assertRaises(FileExistsError, fitsutils.split_mef, self.mefs[0], ['SCI'])
+        self.assertEqual(len(fitsutils.split_mef(self.mefs[0], clobber=True,
+                                                 outpattern=os.path.join(self.tmpdir, '{base}.{hdu}.fits'))), 3)
+        self.assertRaises(ValueError, fitsutils.split_mef, self.mefs[0], ['NOSUCHEXT'])
+
+    def test_compressed(self):
+        fzname = os.path.join(self.tmpdir, 'tile.fits.fz')
+        fits.HDUList([fits.PrimaryHDU(), fits.CompImageHDU(numpy.zeros((30, 20), dtype='f4'), name='SCI')]
+                     ).writeto(fzname)
+        self.assertRaises(ValueError, fitsutils.split_mef, fzname, ['SCI'])
+
+    def test_duplicate_extnames(self):
+        dupname = os.path.join(self.tmpdir, 'dup.fits')
+        fits.HDUList([fits.PrimaryHDU()] +
+                     [fits.ImageHDU(numpy.zeros((3, 2), dtype='f4'), name=name) for name in ('SCI', 'WGT', 'SCI')]
+                     ).writeto(dupname)
+        self.assertRaises(ValueError, fitsutils.split_mef, dupname)
+        self.assertEqual(sorted(f for f in os.listdir(self.tmpdir) if f.startswith('dup')), ['dup.fits'])
+        # naming the outputs by HDU number tells them apart
+        self.assertEqual(len(fitsutils.split_mef(dupname, outpattern=os.path.join(self.tmpdir, 'dup_{hdu}.fits'))), 3)
+
+        # an existing output is found before anything is written
+        os.unlink(os.path.join(self.tmpdir, 'dup_3.fits'))
+        self.assertRaises(FileExistsError, fitsutils.split_mef, self.mefs[1],
+                          outpattern=os.path.join(self.tmpdir, 'dup_{hdu}.fits'))
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, 'dup_3.fits')))
+
+    def test_commandline(self):
+        report = os.path.join(self.tmpdir, 'report.json')
+        temp = copy.deepcopy(sys.argv)
+        sys.argv = ['fitssplit.py', '--extnames', 'WGT', '--nproc', '2', '--report', report] + self.mefs
+        with capture_output() as (out, _):
+            fitssplit.main()
+        sys.argv = temp
+        self.assertTrue('2 of 2 done' in out.getvalue())
+        with open(report, 'r') as reportfh:
+            results = json.load(reportfh)
+        self.assertEqual(results[1]['outputs'], [os.path.join(self.tmpdir, 'tile1_wgt.fits')])
+        self.assertTrue(os.path.exists(results[1]['outputs'][0]))
+
+
+class TestCheckCombineInputs(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.incats = []
+        for i in range(3):
+            fname = os.path.join(self.tmpdir, f"cat{i:d}.fits")
+            write_test_cat(fname, 100 * (i + 1), seed=i)
+            self.incats.append(fname)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_output_size(self):
+        outcat = os.path.join(self.tmpdir, 'fullcat.fits')
+        size = fitsutils.check_combine_inputs(self.incats, outcat)
+        fitsutils.combine_cats(','.join(self.incats), outcat)
+        self.assertEqual(size, os.path.getsize(outcat))
+
+    def test_bad_inputs(self):
+        # wrong number of hdus
+        fits.HDUList([fits.PrimaryHDU()]).writeto(self.incats[1], overwrite=True)
+        # different columns
+        with fits.open(self.incats[0]) as hdulist:
+            cols = fits.ColDefs(hdulist[2].columns[:2])
+            hdulist[2] = fits.BinTableHDU.from_columns(cols, header=hdulist[2].header)
+            hdulist.writeto(self.incats[2], overwrite=True)
+
+        outcat = os.path.join(self.tmpdir, 'fullcat.fits')
+        with self.assertRaises(ValueError) as ctx:
+            fitsutils.combine_cats(','.join(self.incats), outcat)
+        msg = str(ctx.exception)
+        self.assertTrue('has 1 HDUs' in msg)
+        self.assertTrue('columns do not match' in msg)
+        self.assertFalse(os.path.exists(outcat))
+
+    def test_imhead_sizes(self):
+        # image headers with different numbers of cards
+        os.unlink(self.incats[1])
+        write_test_cat(self.incats[1], 50, seed=5, EXPNUM=229686, CCDNUM=3)
+        outcat = os.path.join(self.tmpdir, 'fullcat.fits')
+        fitsutils.combine_cats(','.join(self.incats), outcat)
+        other = os.path.join(self.tmpdir, 'other.fits')
+        write_test_cat(other, 20, seed=6, CCDNUM=4)
+        fitsutils.combine_cats(other, outcat, append=True)
+        with fits.open(outcat) as hdulist:
+            self.assertEqual(len(hdulist), 12)
+            self.assertEqual(fitsutils.get_ldac_imhead_as_hdr(hdulist[4])['CCDNUM'], 3)
+            self.assertEqual(fitsutils.get_ldac_imhead_as_hdr(hdulist[10])['CCDNUM'], 4)
+
+    def test_truncated(self):
+        with open(self.incats[2], 'r+b') as fh:
+            fh.truncate(os.path.getsize(self.incats[2]) - 2 * fitsutils.FITS_BLOCK_SIZE)
+        self.assertRaises(ValueError, fitsutils.check_combine_inputs, self.incats)
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.incats = []
+        for i in range(2):
+            fname = os.path.join(self.tmpdir, f"cat{i:d}.fits")
+            write_test_cat(fname, 50, seed=i)
+            self.incats.append(fname)
+        self.outcat = os.path.join(self.tmpdir, 'fullcat.fits')
+        self.report = os.path.join(self.tmpdir, 'profile.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        os.environ.pop(profiling.PROFILE_ENV, None)
+
+    def test_commandline(self):
+        temp = copy.deepcopy(sys.argv)
+        sys.argv = ['combine_cats.py', '--outcat', self.outcat, '--incats', ','.join(self.incats),
+                    '--profile', '--profile-format', 'json', '--profile-out', self.report,
+                    '--cprofile', os.path.join(self.tmpdir, 'cprofile.out')]
+        with capture_output():
+            ccats.main()
+        sys.argv = temp
+
+        with open(self.report, 'r') as fh:
+            report = json.load(fh)
+        self.assertEqual(report['program'], 'combine_cats.py')
+        for name in ['imports', 'args', 'check', 'open', 'read', 'write']:
+            self.assertTrue(name in report['phases'])
+        self.assertEqual(report['phases']['open']['calls'], 2)
+        self.assertTrue(report['total']['peak_rss'] > 0)
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir, 'cprofile.out')))
+
+    def test_env(self):
+        os.environ[profiling.PROFILE_ENV] = 'summary'
+        temp = copy.deepcopy(sys.argv)
+        sys.argv = ['combine_cats.py', '--outcat', self.outcat, '--incats', ','.join(self.incats)]
+        with capture_output() as (_, err):
+            ccats.main()
+            self.assertTrue('# Profile of combine_cats.py' in err.getvalue())
+        sys.argv = temp
+
+    def test_profile_flag(self):
+        temp = copy.deepcopy(sys.argv)
+        sys.argv = ['printHeader.py', '--profile', self.incats[0]]
+        with capture_output() as (out, err):
+            phdr.main()
+            self.assertTrue('SIMPLE' in out.getvalue())
+            self.assertTrue('# Profile of printHeader.py' in err.getvalue())
+        sys.argv = temp
+
+    def test_import(self):
+        # the profiling module must not pull in astropy through the package
+        code = "import sys, despyfitsutils.profiling; print('astropy' in sys.modules)"
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        self.assertEqual(out.stdout.strip(), 'False')
+
+    def test_inactive(self):
+        with profiling.phase('read'):
+            pass
+        prof = profiling.Profiler('test')
+        with prof.phase('read'):
+            with prof.phase('inner'):
+                pass
+        self.assertTrue('read' in prof.phases)
+        self.assertFalse('inner' in prof.phases)
+
 class TestSplitScampHead(unittest.TestCase):
 
     def tearDown(self):
@@ -152,6 +853,67 @@ class TestSplitScampHead(unittest.TestCase):
         sys.argv = temp
 
 
+class TestSplitScampHeadStreaming(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.inhead = os.path.join(self.tmpdir, 'scamp.head')
+        self.heads = write_test_scamp_head(self.inhead, 5)
+        self.outheads = [os.path.join(self.tmpdir, f"ccd{i:d}.head") for i in range(5)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def check_outputs(self):
+        for name, text in zip(self.outheads, self.heads):
+            with open(name, 'r') as headfh:
+                self.assertEqual(headfh.read(), text)
+        self.assertEqual([f for f in os.listdir(self.tmpdir) if f.endswith('.tmp')], [])
+
+    def test_split(self):
+        with capture_output() as (out, _):
+            fitsutils.splitScampHead(self.inhead, ','.join(self.outheads), progress=1e-9)
+            self.assertTrue('MB/s' in out.getvalue())
+        self.check_outputs()
+
+    def test_resume(self):
+        checkpoint = os.path.join(self.tmpdir, 'split.ckpt')
+        # a directory in the way of the 4th output interrupts the split
+        os.mkdir(self.outheads[3])
+        self.assertRaises(OSError, fitsutils.splitScampHead, self.inhead, ','.join(self.outheads),
+                          checkpoint)
+        with open(checkpoint, 'r') as ckfh:
+            self.assertEqual(json.load(ckfh)['completed'], 3)
+        self.assertFalse(os.path.exists(self.outheads[4]))
+        self.assertEqual([f for f in os.listdir(self.tmpdir) if f.endswith('.tmp')], [])
+
+        os.rmdir(self.outheads[3])
+        # heads completed before the interruption are not written again
+        with open(self.outheads[0], 'w') as headfh:
+            headfh.write('marker')
+        fitsutils.splitScampHead(self.inhead, ','.join(self.outheads), checkpoint)
+        self.assertFalse(os.path.exists(checkpoint))
+        with open(self.outheads[0], 'r') as headfh:
+            self.assertEqual(headfh.read(), 'marker')
+        os.unlink(self.outheads[0])
+
+        # without the checkpoint everything is written
+        fitsutils.splitScampHead(self.inhead, ','.join(self.outheads), checkpoint)
+        self.check_outputs()
+
+    def test_bad_counts(self):
+        self.assertRaises(ValueError, fitsutils.splitScampHead, self.inhead, ','.join(self.outheads[:3]))
+        self.assertFalse(os.path.exists(self.outheads[3]))
+        self.assertRaises(ValueError, fitsutils.splitScampHead, self.inhead,
+                          ','.join(self.outheads + ['extra.head']))
+
+        for name in self.outheads:
+            os.unlink(name)
+        with open(self.inhead, 'w') as headfh:
+            headfh.write(''.join(self.heads).replace('END     ', 'XEND    ', 1))
+        self.assertRaises(ValueError, fitsutils.splitScampHead, self.inhead, ','.join(self.outheads))
+        self.assertFalse(os.path.exists(self.outheads[0]))
+        self.assertEqual([f for f in os.listdir(self.tmpdir) if f.endswith('.tmp')], [])
+
 class TestFitsSpecialMetadata(unittest.TestCase):
     testfile = ROOT + 'raw/test_raw.fits.fz'
     def test_func_band(self):
@@ -192,6 +954,572 @@ class TestFitsSpecialMetadata(unittest.TestCase):
         self.assertAlmostEqual(fsm.func_tdecdeg(self.testfile), -51.732137, 6)
         self.assertAlmostEqual(fsm.func_tdecdeg(self.testfile, fits.open(self.testfile)), -51.732137, 6)
 
+class TestRaDecArrays(unittest.TestCase):
+    ras = ['23:02:31.0', '00:00:00.0', '12:30:45.25', ' 05:01:02 ']
+    decs = ['-51:43:57.7', '-00:30:00.0', '+12:00:36.0', '89:59:59.99']
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.files = []
+        for i, (ra, dec) in enumerate(zip(self.ras, self.decs)):
+            fname = os.path.join(self.tmpdir, f"test{i:d}.fits")
+            write_test_image(fname, RA=ra, DEC=dec, TELRA=ra, TELDEC=dec)
+            self.files.append(fname)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_match_scalar(self):
+        numpy.testing.assert_array_equal(fsm.radeg_array(self.files),
+                                         [fsm.func_radeg(f) for f in self.files])
+        numpy.testing.assert_array_equal(fsm.decdeg_array(self.files, 'PRIMARY'),
+                                         [fsm.func_decdeg(f) for f in self.files])
+        numpy.testing.assert_array_equal(fsm.tradeg_array(self.files),
+                                         [fsm.func_tradeg(f) for f in self.files])
+        numpy.testing.assert_array_equal(fsm.tdecdeg_array(self.files),
+                                         [fsm.func_tdecdeg(f) for f in self.files])
+
+    def test_match_many(self):
+        rng = numpy.random.default_rng(2)
+        hours = rng.integers(0, 24, 20000)
+        degs = rng.integers(-89, 90, 20000)
+        mins = rng.integers(0, 60, 20000)
+        secs = rng.uniform(0, 60, 20000)
+        ras = [f"{h:02d}:{m:02d}:{s:06.3f}" for h, m, s in zip(hours, mins, secs)]
+        decs = [f"{d:+03d}:{m:02d}:{s:05.2f}" for d, m, s in zip(degs, mins, secs)]
+        numpy.testing.assert_array_equal(fsm.ra_to_deg_array(ras), [fsm.decode_ra(ra) for ra in ras])
+        numpy.testing.assert_array_equal(fsm.dec_to_deg_array(decs), [fsm.decode_dec(dec) for dec in decs])
+
+    def test_values(self):
+        self.assertAlmostEqual(fsm.dec_to_deg_array(['-00:30:00.0'])[0], -0.5)
+        ras = fsm.ra_to_deg_array(['12:00:00', 'junk', '', '12:00', '1:2:3:4', None])
+        self.assertEqual(ras[0], 180.0)
+        self.assertTrue(numpy.all(numpy.isnan(ras[1:])))
+
+class TestDecodeCache(unittest.TestCase):
+    dates = ['2013-09-01T14:59:59.999999', '2013-09-01T15:00:00.000000',
+             '2013-03-01T03:12:00.5', '2012-12-31T23:59:59', '2013-03-01T03:59:00']
+
+    def setUp(self):
+        fsm.clear_decode_cache()
+
+    def test_nite_array(self):
+        nites = fsm.nite_array(self.dates + ['junk', ''])
+        self.assertEqual(list(nites[:5]), [int(spmeta.create_nite(d)) for d in self.dates])
+        self.assertEqual(list(nites[:5]), [20130831, 20130901, 20130228, 20121231, 20130228])
+        self.assertEqual(list(nites[5:]), [-1, -1])
+        self.assertEqual(list(fsm.nite_array(['junk'], invalid=0)), [0])
+
+    def test_date_obs_to_datetime64(self):
+        times = fsm.date_obs_to_datetime64(self.dates[:2] + ['junk'])
+        self.assertEqual(times[1], numpy.datetime64('2013-09-01T15:00:00'))
+        self.assertEqual(times[1] - times[0], numpy.timedelta64(1, 'us'))
+        self.assertTrue(numpy.isnat(times[2]))
+
+    def test_cache(self):
+        for _ in range(3):
+            self.assertAlmostEqual(fsm.decode_ra('12:00:00'), 180.0)
+            self.assertAlmostEqual(fsm.decode_dec('-00:30:00.0'), -0.5)
+            self.assertEqual(fsm.decode_nite(self.dates[1]), '20130901')
+        info = fsm.decode_cache_info()
+        for name in ['nite', 'ra', 'dec']:
+            self.assertEqual(info[name]['misses'], 1)
+            self.assertEqual(info[name]['hits'], 2)
+        fsm.clear_decode_cache()
+        self.assertEqual(fsm.decode_cache_info()['ra']['currsize'], 0)
+
+    def test_func_unchanged(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(tmpdir, 'test.fits')
+            write_test_image(fname, RA='23:02:31.0', DEC='-51:43:57.7',
+                             TELRA='23:02:31.0', TELDEC='-51:43:57.7',
+                             DATE_OBS=self.dates[0])
+            for _ in range(2):
+                self.assertEqual(fsm.func_nite(fname), '20130831')
+                self.assertAlmostEqual(fsm.func_radeg(fname),
+                                       spmeta.convert_ra_to_deg('23:02:31.0'))
+                self.assertAlmostEqual(fsm.func_tdecdeg(fname),
+                                       spmeta.convert_dec_to_deg('-51:43:57.7'))
+            self.assertGreater(fsm.decode_cache_info()['ra']['hits'], 0)
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+class TestByteSource(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.image = os.path.join(self.tmpdir, 'raw.fits')
+        hdulist = fits.HDUList([fits.PrimaryHDU(header=fits.Header([('FILTER', 'z DECam SDSS c0004 9260.0 1520.0'),
+                                                                    ('DATE-OBS', '2012-11-21T01:02:03.4')]))])
+        for i in range(3):
+            hdulist.append(fits.ImageHDU(numpy.zeros((200, 300), dtype='f4'), name=f'CCD{i:d}'))
+        hdulist.writeto(self.image)
+        self.cat = os.path.join(self.tmpdir, 'cat.fits')
+        write_test_cat(self.cat, 5, EXPNUM=229686)
+        self.server, self.url = bytesource.start_range_server(self.tmpdir)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_headers(self):
+        url = f'{self.url}/raw.fits'
+        with bytesource.open_source(url) as source:
+            hdrs = fitsutils.HeaderList.from_source(source)
+            self.assertEqual(len(hdrs), 4)
+            self.assertEqual(hdrs['CCD2'].header['NAXIS2'], 200)
+            # only the header blocks were fetched
+            self.assertTrue(source.bytes_read < 8 * bytesource.CACHE_BLOCK_SIZE)
+            self.assertTrue(source.bytes_read < os.path.getsize(self.image) / 4)
+        self.assertEqual(fsm.func_band(url), 'z')
+        self.assertEqual(fsm.func_objects(f'{self.url}/cat.fits', None, 'LDAC_OBJECTS'), 5)
+        self.assertEqual(fsm.func_nite(f'{self.url}/cat.fits', None, 'LDAC_IMHEAD'),
+                         fsm.func_nite(self.cat, None, 'LDAC_IMHEAD'))
+        self.assertRaises(OSError, fitsutils.HeaderList.from_file, f'{self.url}/nosuchfile.fits')
+
+    def test_lazy(self):
+        url = f'{self.url}/raw.fits'
+        with bytesource.open_source(url, block_size=2880) as source:
+            hdrs = fitsutils.HeaderList.from_source(source, lazy=True)
+            self.assertEqual(hdrs[0].header['FILTER'], 'z DECam SDSS c0004 9260.0 1520.0')
+            self.assertEqual(source.requests, 1)
+            self.assertEqual(hdrs['CCD0'].header['NAXIS1'], 300)
+            self.assertEqual(source.requests, 2)
+            self.assertEqual(len(hdrs), 4)
+            self.assertEqual(source.requests, 4)
+            self.assertEqual([hdu.header.get('EXTNAME') for hdu in hdrs][1:], ['CCD0', 'CCD1', 'CCD2'])
+            self.assertRaises(KeyError, hdrs.__getitem__, 'NOSUCHEXT')
+
+        with fitsutils.open_headers(url) as hdrs:
+            self.assertEqual(fsm.func_band(url, hdrs), 'z')
+            self.assertEqual(len(hdrs.hdus), 1)
+
+    def test_compressed(self):
+        fzimage = os.path.join(self.tmpdir, 'image.fits.fz')
+        write_test_fz(fzimage, EXPNUM=229686)
+        with fits.open(fzimage) as hdulist, fitsutils.open_headers(f'{self.url}/image.fits.fz') as hdrs:
+            self.assertEqual(hdrs['SCI'].header, hdulist['SCI'].header)
+            self.assertEqual(fitsutils.get_hdr_value(hdrs, 'NAXIS1', 1), 100)
+
+    def test_cache(self):
+        url = f'{self.url}/raw.fits'
+        cache_dir = os.path.join(self.tmpdir, 'cache')
+        with bytesource.open_source(url, cache_dir=cache_dir, block_size=2880) as source:
+            data = source.read(100, 3 * 2880)
+            self.assertEqual(source.requests, 1)
+            self.assertEqual(source.read(2880, 2880), data[2780:5660])
+            self.assertEqual(source.requests, 1)
+            self.assertEqual(source.read(source.get_size() - 10, 100), open(self.image, 'rb').read()[-10:])
+
+        # a new source uses the blocks cached on disk
+        with bytesource.open_source(url, cache_dir=cache_dir, block_size=2880) as source:
+            self.assertEqual(source.read(0, 2880 * 4)[100:100 + 3 * 2880], data)
+            self.assertEqual(source.requests, 0)
+
+        with bytesource.open_source(self.image) as source:
+            self.assertEqual(source.read(100, 3 * 2880), data)
+
+    def test_cache_changed(self):
+        url = f'{self.url}/raw.fits'
+        cache_dir = os.path.join(self.tmpdir, 'cache')
+        with bytesource.open_source(url, cache_dir=cache_dir) as source:
+            self.assertEqual(fitsutils.HeaderList.from_source(source)[0].header['FILTER'],
+                             'z DECam SDSS c0004 9260.0 1520.0')
+
+        # same size, new contents and modification time
+        with fits.open(self.image, mode='update') as hdulist:
+            hdulist[0].header['FILTER'] = 'i DECam SDSS c0003 7835.0 1470.0'
+        mtime = os.path.getmtime(self.image) + 10
+        os.utime(self.image, (mtime, mtime))
+        with bytesource.open_source(url, cache_dir=cache_dir) as source:
+            self.assertEqual(fitsutils.HeaderList.from_source(source)[0].header['FILTER'],
+                             'i DECam SDSS c0003 7835.0 1470.0')
+            self.assertTrue(source.requests > 0)
+
+        # a local file changed in place
+        cached = os.path.join(self.tmpdir, 'cat_cache')
+        with bytesource.CachedByteSource(bytesource.LocalByteSource(self.cat), cache_dir=cached) as source:
+            first = source.read(0, 2880)
+        with open(self.cat, 'r+b') as catfh:
+            catfh.write(b'X')
+        mtime = os.path.getmtime(self.cat) + 10
+        os.utime(self.cat, (mtime, mtime))
+        with bytesource.CachedByteSource(bytesource.LocalByteSource(self.cat), cache_dir=cached) as source:
+            self.assertEqual(source.read(0, 2880), b'X' + first[1:])
+
+
+class TestHeaderService(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.image = os.path.join(self.tmpdir, 'image.fits')
+        write_test_image(self.image, FILTER='z DECam SDSS c0004 9260.0 1520.0', EXPNUM=229686)
+        self.cat = os.path.join(self.tmpdir, 'cat.fits')
+        write_test_cat(self.cat, 5)
+        self.socket = os.path.join(self.tmpdir, 'hdr.sock')
+        self.server = hservice.HeaderServer(self.socket, nworkers=2, cache_size=1)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        while self.server.started is None:
+            threading.Event().wait(0.01)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def query(self, **request):
+        return hdr_client.send_request(request, self.socket)
+
+    def test_requests(self):
+        self.assertEqual(self.query(op='value', file=self.image, key='expnum'),
+                         {'ok': True, 'value': 229686})
+        self.assertEqual(self.query(op='func', file=self.image, name='band')['value'], 'z')
+        self.assertEqual(self.query(op='func', file=self.cat, name='func_field', hdu='LDAC_IMHEAD')['value'],
+                         fsm.func_field(self.cat, None, 'LDAC_IMHEAD'))
+        self.assertEqual(self.query(op='value', file=self.cat, key='NAXIS2', hdu=2)['value'], 5)
+        self.assertTrue('EXPNUM' in self.query(op='header', file=self.image)['value'])
+
+        response = self.query(op='value', file=self.image, key='NOSUCHKEY')
+        self.assertFalse(response['ok'])
+        self.assertTrue(response['error'].startswith('KeyError'))
+        self.assertFalse(self.query(op='bogus')['ok'])
+
+        stats = self.query(op='stats')['value']
+        self.assertEqual(stats['requests']['value']['count'], 3)
+        self.assertEqual(stats['requests']['value']['errors'], 1)
+        self.assertEqual(stats['cache']['size'], 1)
+
+    def test_compressed(self):
+        fzimage = os.path.join(self.tmpdir, 'image.fits.fz')
+        write_test_fz(fzimage, EXPNUM=229686)
+        with fits.open(fzimage) as hdulist:
+            expected = hdulist[1].header
+            for key in ['NAXIS1', 'NAXIS2', 'BITPIX', 'EXPNUM']:
+                self.assertEqual(self.query(op='value', file=fzimage, key=key, hdu=1)['value'], expected[key])
+        self.assertEqual(self.query(op='header', file=fzimage, hdu=1)['value'],
+                             '\n'.join(str(card) for card in expected.cards))
+
+        # also without astropy's conversion
+        hdr = fitsutils.get_hdu_toc(fzimage)[1]['header']
+        image = fitsutils._zimage_to_image_header(hdr)
+        self.assertEqual(dict(image), {key: expected[key] for key in image})
+        self.assertEqual(set(image), set(expected))
+
+    def test_cache(self):
+        for _ in range(3):
+            self.query(op='value', file=self.image, key='EXPNUM')
+        self.assertEqual(self.server.cache.hits, 2)
+        # changed files are read again
+        with fits.open(self.image, mode='update') as hdulist:
+            hdulist[0].header['EXPNUM'] = 1
+        os.utime(self.image, ns=(0, 0))
+        self.assertEqual(self.query(op='value', file=self.image, key='EXPNUM')['value'], 1)
+
+    def test_shutdown_idle_client(self):
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        with client:
+            client.connect(self.socket)
+            client.sendall(json.dumps({'op': 'value', 'file': self.image, 'key': 'EXPNUM'}).encode() + b'\n')
+            self.assertEqual(json.loads(client.makefile('rb').readline())['value'], 229686)
+            # the client stays connected without sending anything
+            self.server.shutdown()
+            self.thread.join(10 * hservice.POLL_INTERVAL)
+            self.assertFalse(self.thread.is_alive())
+            self.assertFalse(os.path.exists(self.socket))
+
+    def test_client_commandline(self):
+        temp = copy.deepcopy(sys.argv)
+        sys.argv = ['hdr_client.py', '--socket', self.socket, 'func', 'band', self.image]
+        with capture_output() as (out, _):
+            hdr_client.main()
+            self.assertEqual(out.getvalue().strip(), 'z')
+        sys.argv = ['hdr_client.py', '--socket', self.socket, 'value', self.image, 'NOSUCHKEY']
+        self.assertRaises(SystemExit, hdr_client.main)
+        sys.argv = temp
+
+class TestHeaderIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.files = []
+        for i, obj in enumerate(['SN-X1', 'SN-X2', 'SN-C3']):
+            fname = os.path.join(self.tmpdir, f'image{i}.fits')
+            write_test_image(fname, OBJECT=obj, EXPNUM=229686 + i, BAND='griz'[i])
+            self.files.append(fname)
+        self.cat = os.path.join(self.tmpdir, 'cat.fits')
+        write_test_cat(self.cat, 5, EXPNUM=1)
+        self.files.append(self.cat)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_queries(self):
+        index = hindex.HeaderIndex(['object', 'EXPNUM', 'NAXIS2'])
+        self.assertEqual(index.update(self.files, nthreads=2), 4)
+        self.assertEqual(index.query('OBJECT', 'SN-X2'), [(self.files[1], 0)])
+        self.assertEqual(index.query('OBJECT', 'SN-X9'), [])
+        self.assertEqual(index.query_prefix('object', 'SN-X'), [(self.files[0], 0), (self.files[1], 0)])
+        self.assertEqual(index.query_range('EXPNUM', 229687, 229700),
+                         [(self.files[1], 0), (self.files[2], 0)])
+        self.assertEqual(index.query_range('NAXIS2', low=5), [(self.cat, 2)])
+        self.assertEqual(dict(index.values('OBJECT'))['SN-C3'], 1)
+        self.assertRaises(KeyError, index.query, 'FILTER', 'g')
+
+    def test_update(self):
+        indexfile = os.path.join(self.tmpdir, 'hdr.idx')
+        index = hindex.HeaderIndex(['OBJECT'])
+        index.update(self.files)
+        index.save(indexfile)
+
+        index = hindex.HeaderIndex.load(indexfile)
+        self.assertEqual(index.update(self.files), 0)
+        os.unlink(self.files[0])
+        write_test_image(self.files[0], OBJECT='SN-C1')
+        os.utime(self.files[0], ns=(0, 0))
+        self.assertEqual(index.update(self.files), 1)
+        self.assertEqual(index.query('OBJECT', 'SN-X1'), [])
+        self.assertEqual(len(index.query_prefix('OBJECT', 'SN-C')), 2)
+
+        # missing files are skipped
+        self.assertEqual(index.update(self.files + [os.path.join(self.tmpdir, 'nosuchfile.fits')]), 0)
+
+        # unreadable files are skipped, the others are still indexed
+        bad = os.path.join(self.tmpdir, 'bad.fits')
+        with open(bad, 'wb') as badfh:
+            badfh.write(b'not a fits file' * 300)
+        write_test_image(os.path.join(self.tmpdir, 'new.fits'), OBJECT='SN-C9')
+        with capture_output() as (out, _):
+            self.assertEqual(index.update([bad, os.path.join(self.tmpdir, 'new.fits')]), 1)
+            self.assertTrue('bad.fits' in out.getvalue())
+        self.assertEqual(len(index.query_prefix('OBJECT', 'SN-C')), 3)
+        index.remove([os.path.join(self.tmpdir, 'new.fits')])
+
+        os.unlink(self.files[2])
+        self.assertEqual(index.prune(), 1)
+        self.assertEqual(index.query_prefix('OBJECT', 'SN-C'), [(self.files[0], 0)])
+        self.assertEqual(len(index), 3)
+
+    def test_types(self):
+        flags = []
+        for i, val in enumerate([True, 1, 1.0, 'T']):
+            fname = os.path.join(self.tmpdir, f'flag{i}.fits')
+            write_test_image(fname, PHOTFLAG=val)
+            flags.append(fname)
+        index = hindex.HeaderIndex(['PHOTFLAG'])
+        index.update(flags)
+        self.assertEqual(index.query('PHOTFLAG', True), [(flags[0], 0)])
+        self.assertEqual(index.query('PHOTFLAG', 1), [(flags[1], 0), (flags[2], 0)])
+        self.assertEqual(index.query('PHOTFLAG', 'T'), [(flags[3], 0)])
+        self.assertEqual(index.values('PHOTFLAG'), [(True, 1), (1, 2), ('T', 1)])
+
+    def test_save_sorted(self):
+        indexfile = os.path.join(self.tmpdir, 'hdr.idx')
+        index = hindex.HeaderIndex(['OBJECT', 'EXPNUM'])
+        index.update(self.files)
+        index.save(indexfile)
+        index = hindex.HeaderIndex.load(indexfile)
+        self.assertEqual(sorted(index._sorted), ['EXPNUM', 'OBJECT'])
+        self.assertEqual(len(index.query_range('EXPNUM', 229686)), 3)
+
+    def test_commandline(self):
+        indexfile = os.path.join(self.tmpdir, 'hdr.idx')
+        temp = copy.deepcopy(sys.argv)
+        sys.argv = ['hdr_index.py', indexfile, 'update', '--keys', 'OBJECT,EXPNUM', '--files'] + self.files
+        with capture_output():
+            hdr_index.main()
+        sys.argv = ['hdr_index.py', indexfile, 'query', 'EXPNUM', '--value', '229688']
+        with capture_output() as (out, _):
+            hdr_index.main()
+            self.assertEqual(out.getvalue().strip(), f'{self.files[2]} 0')
+
+        # string values that look like numbers
+        idfile = os.path.join(self.tmpdir, 'id.fits')
+        write_test_image(idfile, OBJECT='00581000')
+        sys.argv = ['hdr_index.py', indexfile, 'update', '--files', idfile]
+        with capture_output():
+            hdr_index.main()
+        sys.argv = ['hdr_index.py', indexfile, 'query', 'OBJECT', '--value', '00581000']
+        with capture_output() as (out, _):
+            hdr_index.main()
+            self.assertEqual(out.getvalue().strip(), f'{idfile} 0')
+        sys.argv = temp
+
+
+class TestCompactHeader(unittest.TestCase):
+    def setUp(self):
+        self.hdr = fits.Header()
+        for i in range(100):
+            self.hdr[f'KEY{i:d}'] = (i * 1.5, 'a comment')
+        self.hdr['LONGSTR'] = 'x' * 150
+        self.hdr['HIERARCH ESO DET CHIP'] = 3
+        self.hdr['COMMENT'] = 'first'
+        self.hdr['COMMENT'] = 'second'
+        self.compact = fitsutils.CompactHeader(self.hdr.tostring())
+
+    def test_access(self):
+        cmp = self.compact
+        self.assertEqual(cmp['key5'], 7.5)
+        self.assertEqual(cmp['LONGSTR'], self.hdr['LONGSTR'])
+        self.assertEqual(cmp['ESO DET CHIP'], 3)
+        self.assertEqual(cmp['COMMENT'], ['first', 'second'])
+        self.assertTrue('KEY99' in cmp)
+        self.assertFalse('KEY100' in cmp)
+        self.assertEqual(cmp.get('KEY100', -1), -1)
+        self.assertRaises(KeyError, cmp.__getitem__, 'KEY100')
+        self.assertEqual(cmp.cards['KEY3'].comment, 'a comment')
+        self.assertEqual(len(cmp), len(self.hdr))
+        self.assertEqual(cmp.keys(), list(self.hdr.keys()))
+        self.assertEqual(cmp.to_header(), self.hdr)
+        self.assertEqual(cmp.tostring(), self.hdr.tostring())
+        self.assertEqual(fitsutils.CompactHeader.from_header(self.hdr).tostring(), cmp.tostring())
+
+        values = fitsutils.get_hdr_values(fitsutils.HeaderList([fitsutils.HeaderOnlyHDU(cmp)]), ['KEY1'])
+        self.assertEqual(values[None]['KEY1'], (1.5, 'a comment', float))
+
+    def test_memory(self):
+        raw = self.hdr.tostring()
+        tracemalloc.start()
+        hdrs = [fits.Header.fromstring(raw) for _ in range(20)]
+        full = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        tracemalloc.start()
+        compacts = [fitsutils.CompactHeader(raw) for _ in range(20)]
+        compact = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        self.assertEqual(len(hdrs), len(compacts))
+        self.assertTrue(compact * 5 < full)
+
+    def test_files(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            cat = os.path.join(tmpdir, 'cat.fits')
+            write_test_cat(cat, 5, EXPNUM=229686)
+            hdrs = fitsutils.HeaderList.from_file(cat, compact=True)
+            self.assertTrue(isinstance(hdrs['LDAC_OBJECTS'].header, fitsutils.CompactHeader))
+            self.assertEqual(fitsutils.get_hdr_value(hdrs, 'NAXIS2', 'LDAC_OBJECTS'), 5)
+            self.assertEqual(fitsutils.get_hdr_value(hdrs, 'EXPNUM', 'LDAC_IMHEAD'), 229686)
+            imhead = fitsutils.get_ldac_imhead_as_hdr(hdrs['LDAC_IMHEAD'], compact=True)
+            # the full header keeps the END string of the table as a card
+            full = fitsutils.get_ldac_imhead_as_hdr(hdrs['LDAC_IMHEAD'])
+            self.assertEqual(list(imhead.to_header().items()),
+                             [item for item in full.items() if item[0] != 'END'])
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+class TestGetHdrValues(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cat = os.path.join(self.tmpdir, 'cat.fits')
+        write_test_cat(self.cat, 5, EXPNUM=229686)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_values(self):
+        with fits.open(self.cat) as hdulist:
+            res = fitsutils.get_hdr_values(hdulist, ['naxis2', 'EXTNAME', 'NOSUCHKEY'], [2, 'LDAC_OBJECTS'],
+                                           default={'NOSUCHKEY': -1})
+            self.assertEqual(list(res), [2, 'LDAC_OBJECTS'])
+            self.assertEqual(res[2], res['LDAC_OBJECTS'])
+            self.assertEqual(res[2]['NAXIS2'][0], 5)
+            self.assertEqual(res[2]['NAXIS2'][1:],
+                             fitsutils.get_hdr_extra(hdulist, 'NAXIS2', 2))
+            self.assertEqual(res[2]['NOSUCHKEY'], (-1, None, None))
+            self.assertRaises(KeyError, fitsutils.get_hdr_values, hdulist, ['NOSUCHKEY'], 2, strict=True)
+
+            res = fitsutils.get_hdr_values(hdulist, ['EXPNUM'], 'LDAC_IMHEAD')
+            self.assertEqual(res['LDAC_IMHEAD']['EXPNUM'][0], 229686)
+
+    def test_files(self):
+        other = os.path.join(self.tmpdir, 'image.fits')
+        write_test_image(other, EXPNUM=1)
+        res = fitsutils.get_files_hdr_values([self.cat, other], ['EXPNUM', 'NAXIS'], nthreads=2)
+        self.assertEqual(res[other][None]['EXPNUM'][0], 1)
+        self.assertEqual(res[self.cat][None]['EXPNUM'][0], None)
+        self.assertEqual(res[self.cat][None]['NAXIS'][0], 0)
+
+
+class TestCorpus(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cdir = os.path.join(self.tmpdir, 'corpus')
+        self.manifest = corpus.generate_corpus(self.cdir, 'small', seed=7)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_generate(self):
+        params = corpus.CORPUS_SCALES['small']
+        self.assertEqual(len(self.manifest['raw']), params['nexposures'])
+        self.assertEqual(len(self.manifest['catalogs']), params['nccds'])
+        with fits.open(os.path.join(self.cdir, self.manifest['raw'][0])) as hdulist:
+            self.assertEqual(len(hdulist), 71)
+            self.assertEqual(hdulist[0].header['INSTRUME'], 'DECam')
+            self.assertEqual(hdulist['N31'].data.shape, params['raw_shape'])
+            self.assertEqual(hdulist['N31'].data.dtype, numpy.uint16)
+        with fits.open(os.path.join(self.cdir, self.manifest['catalogs'][0])) as hdulist:
+            self.assertEqual(hdulist[1].header['EXTNAME'], 'LDAC_IMHEAD')
+        with self.assertRaises(ValueError):
+            corpus.generate_corpus(self.cdir, 'huge')
+
+    def test_deterministic(self):
+        other = os.path.join(self.tmpdir, 'other')
+        self.assertEqual(corpus.generate_corpus(other, 'small', seed=7), self.manifest)
+        for fname in self.manifest['raw'] + self.manifest['catalogs'] + [self.manifest['scamp_head']]:
+            self.assertTrue(filecmp.cmp(os.path.join(self.cdir, fname), os.path.join(other, fname), shallow=False))
+        corpus.generate_corpus(other, 'small', seed=8)
+        fname = self.manifest['raw'][0]
+        self.assertNotEqual(corpus.fits_digest(os.path.join(self.cdir, fname)),
+                            corpus.fits_digest(os.path.join(other, fname)))
+
+    def test_run(self):
+        results = corpus.run_corpus(self.cdir)
+        self.assertEqual([r['task'] for r in results], corpus.CORPUS_TASKS)
+        self.assertEqual({r['status'] for r in results}, {'new'})
+        self.assertTrue(all(r['seconds'] > 0 and r['nbytes'] > 0 for r in results))
+        golden = corpus.make_golden(self.cdir, results)
+
+        results = corpus.run_corpus(self.cdir, os.path.join(self.tmpdir, 'work'), golden, repeat=2)
+        self.assertEqual({r['status'] for r in results}, {'ok'})
+
+        golden['digests']['makeMEF'] = '0' * 64
+        results = corpus.run_corpus(self.cdir, golden=golden, tasks=['makeMEF', 'func'])
+        self.assertEqual([r['status'] for r in results], ['mismatch', 'ok'])
+
+        with self.assertRaises(ValueError):
+            corpus.run_corpus(self.cdir, tasks=['nosuchtask'])
+        golden['seed'] = 8
+        with self.assertRaises(ValueError):
+            corpus.run_corpus(self.cdir, golden=golden)
+
+    def test_golden(self):
+        # the shipped digests of the default seed catch changes of the
+        # generator and of the task outputs
+        golden = corpus.read_golden('small', 0)
+        cdir = os.path.join(self.tmpdir, 'default')
+        corpus.generate_corpus(cdir, 'small')
+        self.assertEqual(corpus.corpus_digest(cdir), golden['corpus'])
+        # the func values also depend on despymisc, which is not checked here
+        results = corpus.run_corpus(cdir, golden=golden, tasks=['combine_cats', 'makeMEF', 'splitScampHead'])
+        self.assertEqual([r['status'] for r in results], ['ok'] * 3)
+        self.assertIsNone(corpus.read_golden('small', 7))
+
+    def test_commandline(self):
+        goldfile = os.path.join(self.tmpdir, 'golden.json')
+        temp = copy.deepcopy(sys.argv)
+        try:
+            sys.argv = ['fits_corpus.py', self.cdir, 'run', '--golden', goldfile, '--update-golden']
+            with capture_output() as (out, err):
+                fits_corpus.main()
+            sys.argv = ['fits_corpus.py', self.cdir, 'run', '--golden', goldfile,
+                        '--tasks', 'combine_cats,splitScampHead']
+            with capture_output() as (out, err):
+                fits_corpus.main()
+                self.assertIn('2 of 2 tasks passed', out.getvalue())
+        finally:
+            sys.argv = temp
+
 class Test_printHeader(unittest.TestCase):
     testfile = ROOT + 'raw/test_raw.fits.fz'
     outfile = 'test.dat'
@@ -234,5 +1562,62 @@ class Test_printHeader(unittest.TestCase):
 
         sys.argv = copy.deepcopy(temp)
 
+class TestHeaderTable(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.files = []
+        for i, filt in enumerate(['g DECam SDSS c0001 4720.0 1520.0', 'r DECam SDSS c0002 6415.0 1480.0']):
+            fname = os.path.join(self.tmpdir, f"test{i}.fits")
+            cards = {'FILTER': filt, 'EXPTIME': 90.0 + i}
+            if i == 0:
+                cards['EXPNUM'] = 123456
+                cards['PHOTFLAG'] = True
+            write_test_image(fname, **cards)
+            self.files.append(fname)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_tabulate(self):
+        table = htable.tabulate_headers(self.files, ['EXPNUM', 'exptime', 'func_band'], nthreads=2)
+        self.assertEqual(table.colnames, ['FILENAME', 'EXPNUM', 'EXPTIME', 'BAND'])
+        self.assertEqual(list(table['BAND']), ['g', 'r'])
+        self.assertEqual(table['EXPNUM'][0], 123456)
+        self.assertTrue(table['EXPNUM'].mask[1])
+        self.assertEqual(table['EXPNUM'].dtype.kind, 'i')
+        self.assertEqual(table['EXPTIME'].dtype.kind, 'f')
+
+    def test_multi_hdu(self):
+        table = htable.tabulate_headers(self.files, ['NAXIS'], [0, 'PRIMARY'])
+        self.assertEqual(len(table), 4)
+        self.assertEqual(list(table['HDU']), ['0', 'PRIMARY'] * 2)
+
+    def test_write(self):
+        table = htable.tabulate_headers(self.files, ['EXPNUM', 'func_band'])
+        outfile = os.path.join(self.tmpdir, 'table.fits')
+        htable.write_header_table(table, outfile)
+        data = fits.getdata(outfile)
+        self.assertEqual(list(data['BAND']), ['g', 'r'])
+        htable.write_header_table(table, os.path.join(self.tmpdir, 'table.csv'))
+        self.assertRaises(ValueError, htable.write_header_table, table, 'table.txt')
+        self.assertRaises(ValueError, htable.tabulate_headers, self.files, ['func_nosuch'])
+
+    def test_write_missing(self):
+        table = htable.tabulate_headers(self.files, ['EXPNUM', 'PHOTFLAG', 'EXPTIME'])
+        outfile = os.path.join(self.tmpdir, 'table.fits')
+        htable.write_header_table(table, outfile)
+        data = Table.read(outfile)
+        self.assertEqual(data['EXPNUM'][0], 123456)
+        self.assertTrue(data['EXPNUM'].mask[1])
+        self.assertEqual(data['PHOTFLAG'][0], 1)
+        self.assertTrue(data['PHOTFLAG'].mask[1])
+        self.assertEqual(list(data['EXPTIME']), [90.0, 91.0])
+        # a missing value must not collide with a real one
+        table['EXPNUM'][0] = 999999
+        htable.write_header_table(table, outfile, overwrite=True)
+        data = Table.read(outfile)
+        self.assertEqual(data['EXPNUM'][0], 999999)
+        self.assertEqual(list(data['EXPNUM'].mask), [False, True])
+
 if __name__ == '__main__':
     unittest.main()